@@ -5,7 +5,7 @@ from os import environ
 from flask_login import LoginManager, current_user
 from flask_migrate import Migrate
 from flask_mail import Mail, Message
-from config.config import DevelopmentConfig, ProductionConfig, StagingConfig  # Import all configs
+from config.config import DevelopmentConfig, ProductionConfig, StagingConfig, TestingConfig  # Import all configs
 import os
 from dotenv import load_dotenv
 
@@ -19,15 +19,17 @@ mail = Mail()
 DB_NAME = "database.db"
 
 
-def create_app():
+def create_app(config_class=None):
     app = Flask(__name__, instance_relative_config=True)
 
     # Determine the config class based on the environment
-    config_class = {
-        'production': ProductionConfig,
-        'development': DevelopmentConfig,
-        'staging': StagingConfig,
-    }.get(os.environ.get('FLASK_ENV'), DevelopmentConfig)  # Default to DevelopmentConfig
+    if config_class is None:
+        config_class = {
+            'production': ProductionConfig,
+            'development': DevelopmentConfig,
+            'staging': StagingConfig,
+            'testing': TestingConfig,
+        }.get(os.environ.get('FLASK_ENV'), DevelopmentConfig)  # Default to DevelopmentConfig
 
     import ssl
 
@@ -54,6 +56,9 @@ def create_app():
 
     create_database(app)
 
+    from .commands import register_commands
+    register_commands(app)
+
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
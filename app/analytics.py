@@ -0,0 +1,380 @@
+"""
+Network-wide analytics computed in the database
+
+calculate_nationwide_analytics() used to load every report of every location
+into Python. It now runs a handful of aggregate queries (conditional sums over
+the 7/14/30-day windows, a per-day GROUP BY for the chart), so memory follows
+the number of states and days rather than the number of reports. The state
+breakdown and current status are read from state_summary, and totals and whole
+days from the daily rollups (see rollups.py); only the partial first and last day of a rolling
+window are read from reports. The common foods come from the food item index
+(see food_items.py) and the AI fullness average from the AI estimate sums of
+the rollups, so no vision_analysis is decoded here.
+
+The views serve the result from the shared cache (see cache.py); any committed
+report or location write invalidates it. Each pantry's analytics are cached
+there too, keyed by its latest report id and invalidated by writes to its
+reports.
+"""
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, func, case, and_, or_, false, inspect
+from sqlalchemy.orm import object_session
+from . import db
+from .models import Location, Report, StateSummary, ReportDailyRollup as Rollup
+from .helpers import get_state_full_name
+from .rollups import EMPTY_MAX, LOW_MAX, day_start
+from .cache import invalidate
+from .food_items import top_food_items
+
+NATIONWIDE_CACHE = 'analytics:nationwide'
+PANTRY_CACHE = 'analytics:pantry'
+
+
+def pantry_cache_name(location_id):
+    return f"{PANTRY_CACHE}:{location_id}"
+
+
+def pantry_views_name(location_id):
+    return f"{PANTRY_CACHE}:views:{location_id}"
+
+
+@event.listens_for(Location, 'after_insert')
+@event.listens_for(Location, 'after_update')
+@event.listens_for(Location, 'after_delete')
+@event.listens_for(Report, 'after_insert')
+@event.listens_for(Report, 'after_update')
+@event.listens_for(Report, 'after_delete')
+def pantry_written(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        invalidate(session, NATIONWIDE_CACHE)
+
+
+@event.listens_for(Report, 'after_insert')
+@event.listens_for(Report, 'after_update')
+@event.listens_for(Report, 'after_delete')
+def report_written(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    moved_from = inspect(target).attrs.location_id.history.deleted or []
+    for location_id in set(moved_from + [target.location_id]):
+        if location_id is not None:
+            invalidate(session, pantry_cache_name(location_id))
+
+
+def latest_report_id(location_id):
+    """Id of the pantry's newest report (0 without reports), the version its cached analytics are keyed by"""
+    return db.session.query(func.coalesce(func.max(Report.id), 0)).filter(Report.location_id == location_id).scalar()
+
+
+def most_viewed_pantries(store, limit):
+    """Ids of the `limit` pantries with the most analytics views counted in `store`, most viewed first"""
+    location_ids = [location_id for (location_id,) in db.session.query(Location.id).order_by(Location.id)]
+    views = [int(count or 0) for count in store.mget([pantry_views_name(location_id) for location_id in location_ids])]
+    ranked = sorted((-count, location_id) for count, location_id in zip(views, location_ids) if count)
+    return [location_id for _, location_id in ranked[:limit]]
+
+
+def normalize_datetime(dt):
+    """
+    Normalize datetime to UTC timezone-aware datetime
+    Handles both timezone-aware and timezone-naive datetime objects
+    """
+    if dt is None:
+        return None
+
+    # If datetime is timezone-naive, assume it's UTC
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+
+    # If datetime is timezone-aware, convert to UTC
+    return dt.astimezone(timezone.utc)
+
+
+def utc_day(column):
+    """SQL expression for the UTC calendar day (YYYY-MM-DD) of a timestamp column"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(func.timezone('UTC', column), 'YYYY-MM-DD')
+    # SQLite stores UTC wall-clock strings
+    return func.strftime('%Y-%m-%d', column)
+
+
+def _count_where(condition):
+    return func.sum(case((condition, 1), else_=0))
+
+
+def _mean(total, count):
+    # Same value statistics.mean() gives for integers
+    return total / count if count else None
+
+
+def _state_rows():
+    """Per state with a reporting location: active locations, their reports, and the latest-report status buckets"""
+    return db.session.query(
+        StateSummary.state,
+        StateSummary.active_location_count.label('locations'),
+        StateSummary.report_count.label('reports'),
+        StateSummary.fullness_sum,
+        StateSummary.fullness_count,
+        StateSummary.empty_count.label('empty'),
+        StateSummary.low_count.label('low'),
+        StateSummary.full_count.label('full'),
+    ).filter(StateSummary.active_location_count > 0)\
+     .order_by(StateSummary.state)\
+     .all()
+
+
+def _report_totals():
+    """Number of reports, first and last report time, reports with an AI analysis and the sum/count of their AI estimates"""
+    return db.session.query(
+        func.sum(Rollup.report_count).label('total'),
+        func.min(Rollup.first_report_time).label('first'),
+        func.max(Rollup.last_report_time).label('last'),
+        func.sum(Rollup.ai_report_count).label('with_ai'),
+        func.sum(Rollup.ai_fullness_sum).label('ai_fullness_sum'),
+        func.sum(Rollup.ai_fullness_count).label('ai_fullness_count'),
+    ).join(Location, Location.id == Rollup.location_id).one()
+
+
+def _split_window(start, end=None):
+    """
+    Split [start, end) into whole UTC days, read from the rollups, and the partial
+    days at either edge, read from reports
+    Returns (rollup condition, report condition)
+    """
+    first_day = start.date()
+    if day_start(first_day) < start:
+        first_day += timedelta(days=1)
+    if end is None:
+        return Rollup.day >= first_day, and_(Report.time >= start, Report.time < day_start(first_day))
+
+    end_day = end.date()
+    if end_day < first_day:
+        return false(), and_(Report.time >= start, Report.time < end)
+    return and_(Rollup.day >= first_day, Rollup.day < end_day), or_(
+        and_(Report.time >= start, Report.time < day_start(first_day)),
+        and_(Report.time >= day_start(end_day), Report.time < end),
+    )
+
+
+def _window_totals(windows):
+    """
+    Report count, empty/full counts and fullness sum/count for each of
+    `windows` ({name: (start, end or None)}), exact to the report time
+    """
+    splits = {name: _split_window(*bounds) for name, bounds in windows.items()}
+    fullness = Report.pantry_fullness
+
+    rollup_columns, report_columns = [], []
+    for name, (in_days, in_edges) in splits.items():
+        rollup_columns += [func.sum(case((in_days, column), else_=0)) for column in (
+            Rollup.report_count, Rollup.empty_count, Rollup.full_count, Rollup.fullness_sum, Rollup.fullness_count)]
+        report_columns += [
+            _count_where(in_edges),
+            _count_where(and_(in_edges, fullness <= EMPTY_MAX)),
+            _count_where(and_(in_edges, fullness > LOW_MAX)),
+            func.sum(case((in_edges, fullness))),
+            func.count(case((in_edges, fullness))),
+        ]
+
+    from_days = db.session.query(*rollup_columns).join(Location, Location.id == Rollup.location_id).one()
+    from_edges = db.session.query(*report_columns)\
+                           .join(Location, Location.id == Report.location_id)\
+                           .filter(or_(*(in_edges for _, in_edges in splits.values())))\
+                           .one()
+
+    metrics = ('reports', 'empty', 'full', 'fullness_sum', 'fullness_count')
+    totals = {}
+    for i, name in enumerate(windows):
+        values = zip(from_days[i * 5:i * 5 + 5], from_edges[i * 5:i * 5 + 5])
+        totals[name] = {metric: int(days or 0) + int(edges or 0) for metric, (days, edges) in zip(metrics, values)}
+    return totals
+
+
+def _daily_chart(since):
+    """Average fullness and number of reports with a fullness value per UTC day"""
+    in_days, in_edges = _split_window(since)
+    days = {}
+    for day, total, count in db.session.query(Rollup.day, func.sum(Rollup.fullness_sum), func.sum(Rollup.fullness_count))\
+                                       .join(Location, Location.id == Rollup.location_id)\
+                                       .filter(in_days)\
+                                       .group_by(Rollup.day)\
+                                       .having(func.sum(Rollup.fullness_count) > 0):
+        days[day.isoformat()] = (total, count)
+
+    # The partial first day
+    day = utc_day(Report.time)
+    for date, total, count in db.session.query(day, func.sum(Report.pantry_fullness), func.count(Report.pantry_fullness))\
+                                        .join(Location, Location.id == Report.location_id)\
+                                        .filter(in_edges, Report.pantry_fullness.isnot(None))\
+                                        .group_by(day):
+        days[date] = (total, count)
+
+    return [{'date': date, 'avg_fullness': round(total / count, 1), 'report_count': count}
+            for date, (total, count) in sorted(days.items())]
+
+
+# Granularity -> (SQL bucket, label of a bucket key, minimum reports for a point on the pantry page)
+PERIODS = {
+    'weekly': ('week', lambda key: f"Week of {key}", 2),
+    'monthly': ('month', lambda key: datetime.strptime(key, '%Y-%m').strftime('%B %Y'), 2),
+    'yearly': ('year', lambda key: key, 5),
+}
+
+
+def day_bucket(column, bucket):
+    """SQL expression for the week (its Monday, YYYY-MM-DD), month (YYYY-MM) or year (YYYY) of a date column"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(func.date_trunc(bucket, column), {'week': 'YYYY-MM-DD', 'month': 'YYYY-MM', 'year': 'YYYY'}[bucket])
+    # SQLite stores dates as YYYY-MM-DD strings
+    if bucket == 'week':
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.strftime({'month': '%Y-%m', 'year': '%Y'}[bucket], column)
+
+
+def location_trend_buckets(location_id, granularity, start=None, end=None):
+    """
+    Average, minimum and maximum fullness and report count of one pantry per
+    week, month or year (oldest first), grouped by the database over its daily
+    rollups; only days from `start` to `end` (dates, inclusive) are counted
+    """
+    bucket, label, _ = PERIODS[granularity]
+    key = day_bucket(Rollup.day, bucket)
+    query = db.session.query(key, func.sum(Rollup.report_count), func.sum(Rollup.fullness_sum),
+                             func.sum(Rollup.fullness_count), func.min(Rollup.fullness_min),
+                             func.max(Rollup.fullness_max))\
+                      .filter(Rollup.location_id == location_id)
+    if start is not None:
+        query = query.filter(Rollup.day >= start)
+    if end is not None:
+        query = query.filter(Rollup.day <= end)
+    return [{
+        'period': period,
+        'label': label(period),
+        'average_fullness': round(total / count, 1),
+        'report_count': int(reports),
+        'min_fullness': lowest,
+        'max_fullness': highest,
+    } for period, reports, total, count, lowest, highest in
+        query.group_by(key).having(func.sum(Rollup.fullness_count) > 0).order_by(key)]
+
+
+def location_time_trends(location_id):
+    """Weekly, monthly and yearly fullness of one pantry, for the pantry page"""
+    trends = {}
+    for granularity, (_, _, minimum) in PERIODS.items():
+        trends[granularity] = [point for point in location_trend_buckets(location_id, granularity)
+                               if point['report_count'] >= minimum]
+
+    for granularity in PERIODS:
+        trends[f"has_{granularity}_data"] = len(trends[granularity]) >= 2
+    return trends
+
+
+def _trend(current, previous):
+    if previous <= 0:
+        return "stable"
+    change = ((current - previous) / previous) * 100
+    if change > 10:
+        return "increasing"
+    if change < -10:
+        return "decreasing"
+    return "stable"
+
+
+def calculate_nationwide_analytics():
+    """
+    Calculate analytics and trends across all pantries in the network
+    Returns None when there are no locations, no reporting locations or fewer than two reports
+    """
+    total_locations = db.session.query(func.count(Location.id)).scalar()
+    if not total_locations:
+        return None
+
+    state_rows = _state_rows()
+    active_locations = sum(row.locations for row in state_rows)
+    if active_locations < 1:
+        return None
+
+    now = datetime.now(timezone.utc)
+    totals = _report_totals()
+    total_reports = int(totals.total or 0)
+    if total_reports < 2:
+        return None
+
+    start_date = normalize_datetime(totals.first)
+    end_date = normalize_datetime(totals.last)
+    days_active = (end_date - start_date).days + 1
+
+    fullness_sum = sum(row.fullness_sum or 0 for row in state_rows)
+    fullness_count = sum(row.fullness_count for row in state_rows)
+    avg_current_fullness = _mean(fullness_sum, fullness_count) or 0
+
+    state_breakdown = {}
+    for row in state_rows:
+        avg_fullness = _mean(row.fullness_sum, row.fullness_count)
+        state_breakdown[get_state_full_name(row.state or None)] = {
+            'locations': row.locations,
+            'reports': int(row.reports),
+            'avg_fullness': round(avg_fullness, 1) if avg_fullness is not None else 0.0,
+        }
+
+    windows = _window_totals({
+        'last_30_days': (now - timedelta(days=30), None),
+        'last_week': (now - timedelta(days=7), None),
+        'previous_week': (now - timedelta(days=14), now - timedelta(days=7)),
+    })
+    last_week, previous_week = windows['last_week'], windows['previous_week']
+    reports_last_30_days = windows['last_30_days']['reports']
+    reports_last_7_days = last_week['reports']
+    last_week_empty, last_week_full = last_week['empty'], last_week['full']
+    prev_week_empty, prev_week_full = previous_week['empty'], previous_week['full']
+
+    fullness_trend = None
+    if last_week['fullness_count'] and previous_week['fullness_count']:
+        fullness_trend = _mean(last_week['fullness_sum'], last_week['fullness_count']) - \
+            _mean(previous_week['fullness_sum'], previous_week['fullness_count'])
+
+    common_foods = top_food_items(limit=10)
+    avg_ai_fullness = _mean(totals.ai_fullness_sum, int(totals.ai_fullness_count or 0))
+
+    return {
+        'network_overview': {
+            'total_locations': total_locations,
+            'active_locations': active_locations,
+            'total_reports': total_reports,
+            'avg_reports_per_location': round(total_reports / active_locations, 1),
+            'days_active': days_active,
+            'reports_last_30_days': reports_last_30_days,
+            'reports_last_7_days': reports_last_7_days
+        },
+        'current_status': {
+            'avg_fullness': round(avg_current_fullness, 1),
+            'empty_pantries': sum(int(row.empty or 0) for row in state_rows),
+            'low_pantries': sum(int(row.low or 0) for row in state_rows),
+            'full_pantries': sum(int(row.full or 0) for row in state_rows),
+            'total_reporting': active_locations
+        },
+        'trends': {
+            'fullness_trend_weekly': round(fullness_trend, 1) if fullness_trend is not None else None,
+            'empty_trend': _trend(last_week_empty, prev_week_empty),
+            'full_trend': _trend(last_week_full, prev_week_full),
+            'last_week_empty': last_week_empty,
+            'last_week_full': last_week_full,
+            'prev_week_empty': prev_week_empty,
+            'prev_week_full': prev_week_full,
+            'community_engagement': 'high' if reports_last_7_days > reports_last_30_days / 3 else 'moderate' if reports_last_7_days > reports_last_30_days / 6 else 'low'
+        },
+        'chart_data': _daily_chart(now - timedelta(days=30)),
+        'state_breakdown': state_breakdown,
+        'ai_insights': {
+            'reports_with_ai': int(totals.with_ai or 0),
+            'common_foods': common_foods,
+            'avg_ai_fullness': round(avg_ai_fullness, 1) if avg_ai_fullness is not None else None
+        },
+        'date_range': {
+            'start': start_date,
+            'end': end_date
+        }
+    }
@@ -0,0 +1,275 @@
+"""
+Cache shared by all workers
+
+Results that every gunicorn worker would otherwise recompute on each request
+(the nationwide analytics and insights) are kept in a store all workers share.
+By default that is the cache_entry table. Setting CACHE_URL to a redis:// URL
+swaps in Redis (needs the `redis` package): DatabaseCache implements the
+subset of the redis-py client used here, get/mget/set(ex, nx)/delete/incr, so
+the two are interchangeable.
+
+cached() stores a value with a TTL and the generation it was computed from.
+invalidate() bumps the generation once the writing transaction commits, which
+makes the stored value stale at once. On a miss one worker takes a short lock
+and recomputes; the others keep serving the stale value meanwhile, or wait for
+it when there is nothing to serve yet.
+
+A value can also carry a version (e.g. the id of the latest report it was
+computed from): a stored value of another version is stale too. Hits and
+misses can be counted under a `stats` name, read back with cache_stats().
+
+Counters that are bumped on every page view (hits, misses, pantry views) go
+through increment(): each worker adds them up in memory and writes the totals
+every COUNTER_FLUSH_SECONDS, so a view costs no write transaction. Counts a
+worker has not flushed yet are lost if it exits, which is fine for traffic
+statistics.
+"""
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import event, cast, func, BigInteger, Integer, LargeBinary, Text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import db
+from .models import CacheEntry
+from .db_helpers import upsert
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+LOCK_SECONDS = 30
+# Stale values are kept this long so there is something to serve while recomputing
+STALE_SECONDS = 24 * 3600
+WAIT_INTERVAL = 0.05
+COUNTER_FLUSH_SECONDS = 10
+
+
+def _as_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+class DatabaseCache:
+    """Redis-style key/value store on the cache_entry table, using its own connections"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table = CacheEntry.__table__
+
+    def _live(self, now):
+        return (self.table.c.expires_at.is_(None)) | (self.table.c.expires_at > now)
+
+    def get(self, key):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                self.table.select().with_only_columns([self.table.c.value])
+                .where(self.table.c.key == key, self._live(datetime.now(timezone.utc)))
+            ).scalar()
+
+    def mget(self, keys):
+        keys = list(keys)
+        if not keys:
+            return []
+        with self.engine.connect() as connection:
+            values = dict(connection.execute(
+                self.table.select().with_only_columns([self.table.c.key, self.table.c.value])
+                .where(self.table.c.key.in_(keys), self._live(datetime.now(timezone.utc)))
+            ).all())
+        return [values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        now = datetime.now(timezone.utc)
+        values = {'value': _as_bytes(value), 'expires_at': now + timedelta(seconds=ex) if ex else None}
+        if not nx:
+            with self.engine.begin() as connection:
+                upsert(connection, self.table, {'key': key}, values,
+                       lambda current, new: {column: new[column] for column in values})
+            return True
+
+        # Only if absent (an expired row counts as absent)
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(self.table.delete().where(self.table.c.key == key,
+                                                             self.table.c.expires_at <= now))
+                connection.execute(self.table.insert().values(key=key, **values))
+        except IntegrityError:
+            return False
+        return True
+
+    def delete(self, *keys):
+        with self.engine.begin() as connection:
+            return connection.execute(self.table.delete().where(self.table.c.key.in_(keys))).rowcount
+
+    def incr(self, key, amount=1):
+        # One INSERT ... ON CONFLICT DO UPDATE, so concurrent first increments can't overwrite each other
+        with self.engine.begin() as connection:
+            def merge(current, new):
+                return {'value': _added(connection, current['value'], amount), 'expires_at': None}
+
+            row = upsert(connection, self.table, {'key': key}, {'value': _as_bytes(amount), 'expires_at': None},
+                         merge, returning=[self.table.c.value])
+        return int(row.value)
+
+
+def _added(connection, column, amount):
+    """SQL for the integer stored as text in bytes `column` plus `amount`, as bytes again"""
+    if connection.dialect.name == 'postgresql':
+        total = cast(func.convert_from(column, 'UTF8'), BigInteger) + amount
+        return func.convert_to(cast(total, Text), 'UTF8')
+    return cast(cast(column, Integer) + amount, LargeBinary)
+
+
+class CounterBuffer:
+    """Increments added up in memory and written to the store every `interval` seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.flushed_at = time.monotonic()
+
+    def add(self, store, key):
+        with self.lock:
+            self.counts[key] += 1
+            due = time.monotonic() - self.flushed_at >= self.interval
+        if due:
+            self.flush(store)
+
+    def flush(self, store):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.flushed_at = time.monotonic()
+        for key, amount in counts.items():
+            try:
+                store.incr(key, amount)
+            except Exception as e:
+                print(f"Error writing cache counter {key}: {e}")
+
+
+def get_cache():
+    """This app's shared store (Redis when CACHE_URL is set, otherwise the database)"""
+    store = current_app.extensions.get('shared_cache')
+    if store is None:
+        url = current_app.config.get('CACHE_URL')
+        if url and redis is not None:
+            store = redis.Redis.from_url(url)
+        else:
+            if url:
+                print("CACHE_URL is set but the redis package is not installed; using the database cache")
+            store = DatabaseCache(db.engine)
+        current_app.extensions['shared_cache'] = store
+    return store
+
+
+def _generation(store, name):
+    return int(store.get(f"{name}:generation") or 0)
+
+
+def _load(raw):
+    return pickle.loads(raw) if raw is not None else None
+
+
+def _counters():
+    buffer = current_app.extensions.get('cache_counters')
+    if buffer is None:
+        buffer = CounterBuffer(current_app.config.get('COUNTER_FLUSH_SECONDS', COUNTER_FLUSH_SECONDS))
+        current_app.extensions['cache_counters'] = buffer
+    return buffer
+
+
+def increment(key):
+    """Add one to counter `key`, written to the shared store with this worker's next flush"""
+    _counters().add(get_cache(), key)
+
+
+def flush_counts():
+    """Write this worker's pending increment() calls now"""
+    _counters().flush(get_cache())
+
+
+def _count(stats, outcome):
+    if stats is not None:
+        increment(f"{stats}:{outcome}")
+
+
+def cache_stats(stats):
+    """
+    {'hits': n, 'misses': n} counted by cached() calls made with this `stats` name
+    (this worker's pending counts are flushed first; other workers' may lag by COUNTER_FLUSH_SECONDS)
+    """
+    flush_counts()
+    hits, misses = get_cache().mget([f"{stats}:hits", f"{stats}:misses"])
+    return {'hits': int(hits or 0), 'misses': int(misses or 0)}
+
+
+def cached(name, compute, ttl, version=None, stats=None):
+    """
+    The cached value of `name`, calling compute() to refresh it when it is
+    missing, older than `ttl` seconds, invalidated or of another `version`
+    """
+    store = get_cache()
+    try:
+        generation = _generation(store, name)
+        entry = _load(store.get(name))
+    except Exception as e:
+        print(f"Cache unavailable for {name}: {e}")
+        return compute()
+
+    if entry is not None and entry['generation'] == generation and entry.get('version') == version \
+            and entry['expires'] > time.time():
+        _count(stats, 'hits')
+        return entry['value']
+    _count(stats, 'misses')
+
+    lock, token = f"{name}:lock", uuid.uuid4().hex
+    if store.set(lock, token, ex=LOCK_SECONDS, nx=True):
+        try:
+            value = compute()
+            store.set(name, pickle.dumps({'generation': generation, 'version': version,
+                                          'expires': time.time() + ttl, 'value': value}),
+                      ex=ttl + STALE_SECONDS)
+            return value
+        finally:
+            if store.get(lock) == token.encode('utf-8'):
+                store.delete(lock)
+
+    # Another worker is recomputing
+    if entry is not None:
+        return entry['value']
+    deadline = time.time() + LOCK_SECONDS
+    while time.time() < deadline and store.get(lock) is not None:
+        time.sleep(WAIT_INTERVAL)
+        entry = _load(store.get(name))
+        if entry is not None:
+            return entry['value']
+    return compute()
+
+
+def invalidate(session, name):
+    """Make `name` stale once `session` commits"""
+    session.info.setdefault('cache_invalidations', set()).add(name)
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_invalidations(session):
+    names = session.info.pop('cache_invalidations', None)
+    if not names or not has_app_context():
+        return
+    store = get_cache()
+    for name in names:
+        try:
+            store.incr(f"{name}:generation")
+        except Exception as e:
+            print(f"Error invalidating cached {name}: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_invalidations(session):
+    session.info.pop('cache_invalidations', None)
@@ -0,0 +1,240 @@
+"""
+Server-side marker clustering
+
+Pantries are bucketed into a pyramid of web-mercator grid cells, one grid per
+map zoom level, stored in the map_cluster_cell table with running sums (count,
+lat/lon sums for the centroid, and a count per map status). Coordinates are
+summed as integer micro-degrees, so adding and removing a pantry any number of
+times leaves the sums exact. MapClusterMember
+records what each location currently contributes, so a report or location edit
+only moves that one pantry's contribution between cells: the pyramid is kept
+up to date on write, inside the same transaction, and never rebuilt per request.
+
+`flask rebuild-clusters` recomputes everything from scratch.
+"""
+import math
+from collections import defaultdict
+from sqlalchemy import event, and_, or_
+from . import db
+from .models import Location, Report, MapClusterCell, MapClusterMember
+from .map_data import pantry_feed_query, pantry_status
+from .db_helpers import upsert_increment
+from .spatial import _to_float
+
+MIN_CLUSTER_ZOOM = 0
+MAX_CLUSTER_ZOOM = 12
+# Each map tile is split into 2**CELL_SUBDIVISION cells per side (~32px cells on 256px tiles)
+CELL_SUBDIVISION = 3
+MAX_MERCATOR_LATITUDE = 85.05112878
+MICRO_DEGREES = 10 ** 6
+
+# Worst first; 'unknown' only counts when nothing else is known
+STATUS_ORDER = ['empty', 'low', 'full']
+STATUS_COLUMNS = {
+    'full': 'full_count',
+    'low': 'low_count',
+    'empty': 'empty_count',
+    'unknown': 'unknown_count',
+}
+
+
+def cells_per_side(zoom):
+    return 2 ** (zoom + CELL_SUBDIVISION)
+
+
+def cell_x_for(longitude, zoom):
+    n = cells_per_side(zoom)
+    return min(n - 1, max(0, int((longitude + 180.0) / 360.0 * n)))
+
+
+def cell_y_for(latitude, zoom):
+    n = cells_per_side(zoom)
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    radians = math.radians(latitude)
+    y = (1.0 - math.log(math.tan(radians) + 1.0 / math.cos(radians)) / math.pi) / 2.0 * n
+    return min(n - 1, max(0, int(y)))
+
+
+def cell_keys(latitude, longitude):
+    """(zoom, cell_x, cell_y) of the cell holding a point, for every zoom level"""
+    return [(zoom, cell_x_for(longitude, zoom), cell_y_for(latitude, zoom))
+            for zoom in range(MIN_CLUSTER_ZOOM, MAX_CLUSTER_ZOOM + 1)]
+
+
+def micro_degrees(degrees):
+    return int(round(degrees * MICRO_DEGREES))
+
+
+def _contribution(latitude, longitude, status, sign):
+    """Per-cell increments for adding (sign=1) or removing (sign=-1) one pantry"""
+    increments = {
+        'pantry_count': sign,
+        'latitude_micro_sum': sign * micro_degrees(latitude),
+        'longitude_micro_sum': sign * micro_degrees(longitude),
+        'full_count': 0,
+        'low_count': 0,
+        'empty_count': 0,
+        'unknown_count': 0,
+    }
+    increments[STATUS_COLUMNS[status]] = sign
+    return {key: dict(increments) for key in cell_keys(latitude, longitude)}
+
+
+def _apply(connection, changes):
+    table = MapClusterCell.__table__
+    for (zoom, cell_x, cell_y), increments in changes.items():
+        if not any(increments.values()):
+            continue
+        upsert_increment(connection, table,
+                         {'zoom': zoom, 'cell_x': cell_x, 'cell_y': cell_y},
+                         increments)
+
+
+def move_member(connection, location_id, latitude, longitude, status):
+    """
+    Make the pyramid reflect a location at (latitude, longitude) with `status`
+    Pass latitude/longitude as None to take the location off the map
+    """
+    members = MapClusterMember.__table__
+    old = connection.execute(members.select().where(members.c.location_id == location_id)).first()
+
+    if latitude is not None and longitude is not None:
+        latitude, longitude = float(latitude), float(longitude)
+        new = (latitude, longitude, status)
+    else:
+        new = None
+
+    if old is not None and new == (old.latitude, old.longitude, old.status):
+        return
+
+    changes = defaultdict(lambda: defaultdict(int))
+    if old is not None:
+        for key, increments in _contribution(old.latitude, old.longitude, old.status, -1).items():
+            for column, amount in increments.items():
+                changes[key][column] += amount
+    if new is not None:
+        for key, increments in _contribution(latitude, longitude, status, 1).items():
+            for column, amount in increments.items():
+                changes[key][column] += amount
+    _apply(connection, changes)
+
+    if new is None:
+        connection.execute(members.delete().where(members.c.location_id == location_id))
+    elif old is None:
+        connection.execute(members.insert().values(location_id=location_id, latitude=latitude,
+                                                   longitude=longitude, status=status))
+    else:
+        connection.execute(members.update().where(members.c.location_id == location_id)
+                           .values(latitude=latitude, longitude=longitude, status=status))
+
+
+def _latest_status(connection, location_id):
+    reports = Report.__table__
+    fullness = connection.execute(
+        reports.select().with_only_columns([reports.c.pantry_fullness])
+        .where(reports.c.location_id == location_id)
+        .order_by(reports.c.time.desc(), reports.c.id.desc())
+        .limit(1)
+    ).scalar()
+    return pantry_status(fullness)[0]
+
+
+@event.listens_for(Location, 'after_insert')
+@event.listens_for(Location, 'after_update')
+def location_written(mapper, connection, location):
+    move_member(connection, location.id, _to_float(location.latitude), _to_float(location.longitude),
+                _latest_status(connection, location.id))
+
+
+@event.listens_for(Location, 'before_delete')
+def location_deleted(mapper, connection, location):
+    move_member(connection, location.id, None, None, None)
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, report):
+    if report.location_id is None:
+        return
+    members = MapClusterMember.__table__
+    member = connection.execute(members.select().where(members.c.location_id == report.location_id)).first()
+    if member is None:
+        # Location has no coordinates yet; it joins the pyramid once it is geocoded
+        return
+    move_member(connection, report.location_id, member.latitude, member.longitude,
+                _latest_status(connection, report.location_id))
+
+
+def place_locations(connection, locations):
+    """
+    Move located pantries written with Core (which skips the mapper events) into their cells
+    `locations` is an iterable of (location_id, latitude, longitude)
+    """
+    for location_id, latitude, longitude in locations:
+        move_member(connection, location_id, latitude, longitude, _latest_status(connection, location_id))
+
+
+def rebuild_clusters():
+    """
+    Recompute the whole pyramid from the locations and their latest reports
+    Returns the number of pantries placed on the map
+    """
+    cells = defaultdict(lambda: defaultdict(int))
+    members = []
+    for location, fullness, _ in pantry_feed_query():
+        latitude, longitude = _to_float(location.latitude), _to_float(location.longitude)
+        if latitude is None or longitude is None:
+            continue
+        status = pantry_status(fullness)[0]
+        members.append({'location_id': location.id, 'latitude': latitude,
+                        'longitude': longitude, 'status': status})
+        for key, increments in _contribution(latitude, longitude, status, 1).items():
+            for column, amount in increments.items():
+                cells[key][column] += amount
+
+    db.session.execute(MapClusterCell.__table__.delete())
+    db.session.execute(MapClusterMember.__table__.delete())
+    if cells:
+        db.session.execute(MapClusterCell.__table__.insert(), [
+            {'zoom': zoom, 'cell_x': cell_x, 'cell_y': cell_y, **increments}
+            for (zoom, cell_x, cell_y), increments in cells.items()
+        ])
+    if members:
+        db.session.execute(MapClusterMember.__table__.insert(), members)
+    db.session.commit()
+    return len(members)
+
+
+def serialize_cluster(cell):
+    """JSON entry for one cluster cell"""
+    status_counts = {status: getattr(cell, column) for status, column in STATUS_COLUMNS.items()}
+    known = [status for status in STATUS_ORDER if status_counts[status] > 0]
+    return {
+        'count': cell.pantry_count,
+        'latitude': round(cell.latitude_micro_sum / cell.pantry_count / MICRO_DEGREES, 6),
+        'longitude': round(cell.longitude_micro_sum / cell.pantry_count / MICRO_DEGREES, 6),
+        'status_counts': status_counts,
+        'worst_status': known[0] if known else 'unknown',
+        'best_status': known[-1] if known else 'unknown',
+    }
+
+
+def clusters_in_view(zoom, bbox=None):
+    """
+    Clusters for a map zoom level, optionally limited to a (minLon, minLat, maxLon, maxLat) box
+    Zoom levels past MAX_CLUSTER_ZOOM use the finest precomputed grid
+    """
+    zoom = max(MIN_CLUSTER_ZOOM, min(MAX_CLUSTER_ZOOM, zoom))
+    query = MapClusterCell.query.filter(MapClusterCell.zoom == zoom, MapClusterCell.pantry_count > 0)
+
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        # Mercator y grows southwards
+        y_filter = MapClusterCell.cell_y.between(cell_y_for(max_lat, zoom), cell_y_for(min_lat, zoom))
+        if min_lon <= max_lon:
+            x_filter = MapClusterCell.cell_x.between(cell_x_for(min_lon, zoom), cell_x_for(max_lon, zoom))
+        else:
+            x_filter = or_(MapClusterCell.cell_x >= cell_x_for(min_lon, zoom),
+                           MapClusterCell.cell_x <= cell_x_for(max_lon, zoom))
+        query = query.filter(and_(x_filter, y_filter))
+
+    return [serialize_cluster(cell) for cell in query.order_by(MapClusterCell.cell_y, MapClusterCell.cell_x)]
@@ -0,0 +1,130 @@
+"""
+Flask CLI commands (run with `flask <command>`)
+"""
+import click
+
+
+def register_commands(app):
+    @app.cli.command('geocode-worker')
+    @click.option('--once', is_flag=True, help='Drain one batch and exit instead of polling forever.')
+    @click.option('--batch-size', default=50, show_default=True, help='Jobs processed per batch.')
+    @click.option('--poll-interval', default=30, show_default=True, help='Seconds to sleep when the queue is empty.')
+    def geocode_worker(once, batch_size, poll_interval):
+        """Process queued geocoding jobs."""
+        from .geocoding import run_geocode_worker
+        run_geocode_worker(poll_interval=poll_interval, batch_size=batch_size, once=once)
+
+    @app.cli.command('rebuild-clusters')
+    def rebuild_clusters_command():
+        """Recompute the map cluster pyramid from scratch."""
+        from .clustering import rebuild_clusters
+        count = rebuild_clusters()
+        click.echo(f"Clustered {count} pantries")
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute the daily report rollups, latest reports and state summaries from the full report history."""
+        from .rollups import rebuild_rollups
+        count = rebuild_rollups()
+        click.echo(f"Rebuilt {count} daily rollups")
+
+    @app.cli.command('backfill-food-items')
+    @click.option('--batch-size', default=500, show_default=True, help='Reports read and written per batch.')
+    def backfill_food_items_command(batch_size):
+        """Index the AI-detected food items of every report with an analysis."""
+        from .food_items import backfill_food_items
+        count = backfill_food_items(batch_size=batch_size)
+        click.echo(f"Indexed {count} food items")
+
+    @app.cli.command('backfill-pantry-events')
+    @click.option('--batch-size', default=500, show_default=True, help='Events written per batch.')
+    def backfill_pantry_events_command(batch_size):
+        """Derive the restock and depletion events of every pantry's report history."""
+        from .pantry_events import backfill_pantry_events
+        count = backfill_pantry_events(batch_size=batch_size)
+        click.echo(f"Derived {count} pantry events")
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recompute the homepage counters exactly."""
+        from .counters import reconcile_counters
+        drift = reconcile_counters()
+        for name, (stored, exact) in drift.items():
+            click.echo(f"{name}: {stored} -> {exact}")
+        click.echo(f"Reconciled counters ({len(drift)} corrected)")
+
+    @app.cli.command('rebuild-analytics-state')
+    def rebuild_analytics_state_command():
+        """Recompute every pantry's persisted analytics state from its reports."""
+        from .pantry_state import rebuild_states
+        count = rebuild_states()
+        click.echo(f"Rebuilt analytics state for {count} pantries")
+
+    @app.cli.command('check-analytics-state')
+    def check_analytics_state_command():
+        """Compare every stored pantry analytics state with a full recomputation."""
+        from .pantry_state import check_states
+        mismatched = check_states()
+        for location_id in mismatched:
+            click.echo(f"Location {location_id}: state differs from its reports")
+        click.echo(f"Checked analytics state ({len(mismatched)} mismatched)")
+
+    @app.cli.command('warm-pantry-analytics')
+    @click.option('--once', is_flag=True, help='Warm one round and exit instead of repeating forever.')
+    @click.option('--limit', default=50, show_default=True, help='Most-viewed pantries kept warm.')
+    @click.option('--interval', default=60, show_default=True, help='Seconds between rounds.')
+    def warm_pantry_analytics_command(once, limit, interval):
+        """Keep the cached analytics of the most-viewed pantries fresh."""
+        import time
+        from . import db
+        from .analytics import PANTRY_CACHE
+        from .cache import cache_stats
+        from .views import warm_pantry_analytics
+        while True:
+            warmed = warm_pantry_analytics(limit=limit)
+            stats = cache_stats(PANTRY_CACHE)
+            click.echo(f"Warmed {len(warmed)} pantries (cache: {stats['hits']} hits, {stats['misses']} misses)")
+            db.session.remove()
+            if once:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('prune-status-events')
+    @click.option('--once', is_flag=True, help='Prune once and exit instead of repeating forever.')
+    @click.option('--interval', default=3600, show_default=True, help='Seconds between prunes.')
+    def prune_status_events_command(once, interval):
+        """Keep deleting old events from the live status stream log."""
+        import time
+        from . import db
+        from .status_stream import prune_status_events
+        while True:
+            removed = prune_status_events()
+            click.echo(f"Removed {removed} status events")
+            db.session.remove()
+            if once:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('geocode-backfill')
+    @click.option('--batch-size', default=100, show_default=True, help='Locations read and written per batch.')
+    @click.option('--workers', default=4, show_default=True, help='Concurrent geocoder requests.')
+    @click.option('--rate', type=float, default=None,
+                  help='Geocoder requests per second (default: GEOCODER_RATE_LIMIT, or 1).')
+    @click.option('--checkpoint', default='.geocode-backfill.json', show_default=True,
+                  help='File recording progress so an interrupted run can resume.')
+    @click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first location.')
+    @click.option('--limit', type=int, default=None, help='Stop after this many locations.')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be geocoded.')
+    def geocode_backfill(batch_size, workers, rate, checkpoint, restart, limit, dry_run):
+        """Geocode every location that is missing coordinates."""
+        from .geocode_backfill import backfill_coordinates
+        stats = backfill_coordinates(batch_size=batch_size, workers=workers, rate=rate,
+                                     checkpoint_path=checkpoint, restart=restart, dry_run=dry_run, limit=limit)
+        if dry_run:
+            click.echo(f"{stats['scanned']} locations need coordinates: {stats['cache_hits']} cached, "
+                       f"{stats['geocoded']} geocoder requests (~{stats['estimated_seconds']} s)")
+        else:
+            click.echo(f"Scanned {stats['scanned']} locations in {stats['elapsed']} s "
+                       f"({stats['locations_per_second']}/s): {stats['updated']} updated, "
+                       f"{stats['cache_hits']} from cache, {stats['geocoded']} geocoder requests "
+                       f"({stats['requests_per_second']}/s), {stats['not_found']} not found, {stats['errors']} errors")
@@ -0,0 +1,129 @@
+"""
+Site-wide counters for the homepage
+
+site_counter keeps the totals the homepage shows (pantries, reports, states
+covered and empty alerts) so rendering it is a single primary-key read instead
+of four aggregate queries. Location and report writes adjust them on the flush
+connection, so they commit with the write; the distinct-state count is
+recomputed from location on location writes, which are rare.
+
+Rows written with Core bypass the events; `flask reconcile-counters` recomputes
+every counter exactly (and reports what had drifted).
+"""
+from sqlalchemy import event, func, inspect, select
+from . import db
+from .models import Location, Report, SiteCounter
+from .db_helpers import upsert
+
+# Reports at or below this fullness count as empty alerts
+EMPTY_ALERT_MAX = 33
+COUNTERS = ('total_pantries', 'total_reports', 'states_covered', 'empty_alerts')
+
+
+def _distinct_states(connection):
+    # Locations without a state count as one, as SELECT DISTINCT does
+    return connection.execute(
+        select(func.count()).select_from(select(Location.state).distinct().subquery())
+    ).scalar() or 0
+
+
+def _exact_counts(connection):
+    """Every counter computed from the source tables"""
+    def scalar(statement):
+        return connection.execute(statement).scalar() or 0
+
+    return {
+        'total_pantries': scalar(select(func.count()).select_from(Location.__table__)),
+        'total_reports': scalar(select(func.count()).select_from(Report.__table__)),
+        'states_covered': _distinct_states(connection),
+        'empty_alerts': scalar(select(func.count()).select_from(Report.__table__)
+                               .where(Report.pantry_fullness <= EMPTY_ALERT_MAX)),
+    }
+
+
+def _set(connection, name, value):
+    upsert(connection, SiteCounter.__table__, {'name': name}, {'value': value},
+           lambda current, new: {'value': new['value']})
+
+
+def _add(connection, name, amount):
+    # Only counters already stored: a missing one is computed exactly on first read
+    if amount:
+        table = SiteCounter.__table__
+        connection.execute(table.update().where(table.c.name == name).values(value=table.c.value + amount))
+
+
+def _is_empty_alert(fullness):
+    return fullness is not None and fullness <= EMPTY_ALERT_MAX
+
+
+def _refresh_states(connection):
+    _set(connection, 'states_covered', _distinct_states(connection))
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the stored fullness when it is assigned, so an edit knows whether the report was an empty alert
+event.listen(Report.pantry_fullness, 'set', _load_previous_value, active_history=True)
+
+
+@event.listens_for(Location, 'after_insert')
+def location_inserted(mapper, connection, target):
+    _add(connection, 'total_pantries', 1)
+    _refresh_states(connection)
+
+
+@event.listens_for(Location, 'after_update')
+def location_updated(mapper, connection, target):
+    if inspect(target).attrs['state'].history.has_changes():
+        _refresh_states(connection)
+
+
+@event.listens_for(Location, 'after_delete')
+def location_deleted(mapper, connection, target):
+    _add(connection, 'total_pantries', -1)
+    _refresh_states(connection)
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, target):
+    _add(connection, 'total_reports', 1)
+    _add(connection, 'empty_alerts', int(_is_empty_alert(target.pantry_fullness)))
+
+
+@event.listens_for(Report, 'after_update')
+def report_updated(mapper, connection, target):
+    history = inspect(target).attrs.pantry_fullness.history
+    if history.has_changes():
+        was_empty = any(_is_empty_alert(value) for value in history.deleted or [])
+        _add(connection, 'empty_alerts', int(_is_empty_alert(target.pantry_fullness)) - int(was_empty))
+
+
+@event.listens_for(Report, 'after_delete')
+def report_deleted(mapper, connection, target):
+    _add(connection, 'total_reports', -1)
+    _add(connection, 'empty_alerts', -int(_is_empty_alert(target.pantry_fullness)))
+
+
+def homepage_stats():
+    """{counter: value} for the homepage, computing any counter that has never been stored"""
+    stored = {row.name: row.value for row in SiteCounter.query.filter(SiteCounter.name.in_(COUNTERS))}
+    if len(stored) < len(COUNTERS):
+        reconcile_counters()
+        stored = {row.name: row.value for row in SiteCounter.query.filter(SiteCounter.name.in_(COUNTERS))}
+    return {name: stored[name] for name in COUNTERS}
+
+
+def reconcile_counters():
+    """Recompute every counter exactly; returns {counter: (stored, exact)} for those that differed"""
+    connection = db.session.connection()
+    stored = {row.name: row.value for row in SiteCounter.query}
+    drift = {}
+    for name, exact in _exact_counts(connection).items():
+        if stored.get(name) != exact:
+            drift[name] = (stored.get(name), exact)
+        _set(connection, name, exact)
+    db.session.commit()
+    return drift
@@ -0,0 +1,128 @@
+"""
+Small SQL helpers shared by the tables that are maintained on write
+"""
+from datetime import datetime, timezone
+from sqlalchemy import literal, select, DateTime
+from sqlalchemy.types import TypeDecorator
+
+
+def as_utc(value):
+    """Aware UTC datetime from a datetime or ISO string; naive values are taken as UTC"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class UTCDateTime(TypeDecorator):
+    """
+    DateTime(timezone=True) that is always written in UTC and read back as an
+    aware UTC datetime. SQLite keeps no offset, so without this a non-UTC value
+    would be stored as its local wall-clock time and compare wrongly as text.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def __init__(self):
+        super().__init__(timezone=True)
+
+    def process_bind_param(self, value, dialect):
+        value = as_utc(value)
+        if value is not None and dialect.name == 'sqlite':
+            # Stored as UTC wall-clock text, as the rest of the SQLite schema expects
+            return value.replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        return as_utc(value)
+
+
+def _insert_for(connection):
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def upsert(connection, table, keys, values, merge, returning=None):
+    """
+    Insert `values` as the row identified by `keys`, or merge them into the
+    existing row. Runs as a single atomic INSERT ... ON CONFLICT DO UPDATE on
+    Postgres and SQLite.
+
+    Args:
+        connection: Connection (e.g. the one passed to a mapper event)
+        table: sqlalchemy Table
+        keys: dict of primary key column -> value
+        values: dict of column -> value for a new row
+        merge: function(current, new) -> dict of column -> SQL expression, where
+            current[column] is the stored value and new[column] the one from `values`
+        returning: optional list of columns to read back from the written row;
+            the row is then returned (with RETURNING where the dialect has it,
+            otherwise read in the same transaction, which holds the row's write lock)
+    """
+    insert = _insert_for(connection)
+    where = [table.c[column] == value for column, value in keys.items()]
+
+    def written():
+        return connection.execute(select(*returning).where(*where)).first()
+
+    if insert is None:
+        # Generic fallback: update, then insert if nothing was there
+        new = {column: literal(value, table.c[column].type) for column, value in values.items()}
+        result = connection.execute(table.update().where(*where).values(**merge(table.c, new)))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**keys, **values))
+        return written() if returning else None
+
+    statement = insert(table).values(**keys, **values)
+    statement = statement.on_conflict_do_update(index_elements=list(keys), set_=merge(table.c, statement.excluded))
+    if not returning:
+        connection.execute(statement)
+        return None
+    if connection.dialect.full_returning:
+        return connection.execute(statement.returning(*returning)).first()
+    connection.execute(statement)
+    return written()
+
+
+def insert_if_absent(connection, table, values):
+    """
+    Insert `values` unless the row with its primary key exists; returns True if
+    it was inserted. Atomic (INSERT ... ON CONFLICT DO NOTHING) on Postgres and
+    SQLite: a concurrent insert of the same key waits for the first to commit.
+    """
+    insert = _insert_for(connection)
+    if insert is None:
+        where = [column == values[column.name] for column in table.primary_key.columns]
+        if connection.execute(select(*table.primary_key.columns).where(*where)).first() is not None:
+            return False
+        connection.execute(table.insert().values(**values))
+        return True
+    return connection.execute(insert(table).values(**values).on_conflict_do_nothing()).rowcount == 1
+
+
+def upsert_increment(connection, table, keys, increments, values=None):
+    """
+    Add `increments` to the row identified by `keys`, creating it if needed,
+    and overwrite the columns in `values` (see upsert)
+
+    Args:
+        increments: dict of column -> amount to add (also the initial value)
+        values: dict of column -> value to set
+    """
+    values = values or {}
+
+    def merge(current, new):
+        set_ = {column: current[column] + new[column] for column in increments}
+        set_.update({column: new[column] for column in values})
+        return set_
+
+    upsert(connection, table, keys, {**increments, **values}, merge)
@@ -0,0 +1,95 @@
+"""
+Compact columnar encoding of the map feed
+
+Selected with `?format=binary` or `Accept: application/x-pantry-feed`. Only the
+fields the map page uses are sent, as parallel little-endian arrays that the
+browser can wrap in typed arrays without parsing:
+
+    offset  type              content
+    0       4 bytes           magic b'PNTF'
+    4       uint32            format version (1)
+    8       uint32            n, number of pantries
+    12      uint32            d, number of dictionary strings
+    16      uint32[n]         location id
+            float32[n]        latitude (NaN when missing)
+            float32[n]        longitude (NaN when missing)
+            uint32[n]         latest report time, epoch seconds (0 = no reports)
+            uint32[n]         zip (0 = missing)
+            uint32[n]         "city, state", index into the dictionary
+            uint8[n]          status code (see STATUS_CODES)
+            uint8[n]          fullness percentage (255 = no reports)
+            padding to a multiple of 4
+            uint32            byte length of the string block
+            UTF-8             d dictionary strings, then name and street of
+                              each pantry, all separated by NUL
+
+The address shown by the map is rebuilt client-side as "street, city, state zip",
+matching serialize_pantry.
+"""
+import numpy as np
+from .map_data import pantry_status
+from .db_helpers import as_utc
+
+BINARY_MIMETYPE = 'application/x-pantry-feed'
+MAGIC = b'PNTF'
+VERSION = 1
+STATUS_CODES = {'unknown': 0, 'full': 1, 'low': 2, 'empty': 3}
+NO_FULLNESS = 255
+
+
+def _text(value):
+    return '' if value is None else str(value).replace('\0', '')
+
+
+def encode_pantry_columns(rows):
+    """
+    Encode (Location, fullness, last report time) rows, e.g. from pantry_feed_query()
+    Returns the binary feed as bytes
+    """
+    rows = list(rows)
+    count = len(rows)
+    dictionary = {}
+
+    def dictionary_index(value):
+        return dictionary.setdefault(_text(value), len(dictionary))
+
+    ids = np.empty(count, dtype='<u4')
+    latitudes = np.empty(count, dtype='<f4')
+    longitudes = np.empty(count, dtype='<f4')
+    updated = np.zeros(count, dtype='<u4')
+    zips = np.zeros(count, dtype='<u4')
+    localities = np.empty(count, dtype='<u4')
+    statuses = np.empty(count, dtype='u1')
+    fullness_values = np.full(count, NO_FULLNESS, dtype='u1')
+    strings = []
+
+    for i, (location, fullness, last_updated) in enumerate(rows):
+        ids[i] = location.id
+        latitudes[i] = location.latitude if location.latitude is not None else np.nan
+        longitudes[i] = location.longitude if location.longitude is not None else np.nan
+        if last_updated is not None:
+            updated[i] = int(as_utc(last_updated).timestamp())
+        if location.zip:
+            zips[i] = location.zip
+        localities[i] = dictionary_index(f"{location.city}, {location.state}")
+        statuses[i] = STATUS_CODES[pantry_status(fullness)[0]]
+        if fullness is not None:
+            fullness_values[i] = max(0, min(100, fullness))
+        strings.append(_text(location.name))
+        strings.append(_text(location.address))
+
+    header = MAGIC + np.array([VERSION, count, len(dictionary)], dtype='<u4').tobytes()
+    columns = b''.join(column.tobytes() for column in (
+        ids, latitudes, longitudes, updated, zips, localities, statuses, fullness_values))
+    padding = b'\0' * (-(len(header) + len(columns)) % 4)
+    text = '\0'.join(list(dictionary) + strings).encode('utf-8')
+
+    return header + columns + padding + np.array([len(text)], dtype='<u4').tobytes() + text
+
+
+def wants_binary(request):
+    """True when the client asked for the columnar format"""
+    requested = request.args.get('format')
+    if requested:
+        return requested == 'binary'
+    return request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE
@@ -0,0 +1,143 @@
+"""
+Food items detected by the AI analysis, one row per item
+
+report_food_item holds the food items of each report's vision_analysis, with
+the report's location and time, written on the flush connection when the report
+is saved. Top-N questions (most common foods at a pantry, in a state or across
+the network, over a recent window) become GROUP BY queries over its indexes
+instead of parsing every analysis blob on every request.
+
+Items are normalized (whitespace collapsed, lower case) so "Canned Beans" and
+"canned beans" count together. Old analyses list items as {'description': ...}
+objects, new ones as plain strings; both are read.
+
+`flask backfill-food-items` indexes reports saved before the table existed.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, func, inspect, select
+from . import db
+from .models import Location, Report, ReportFoodItem
+
+# ?window= values -> days back from now (None for all time)
+WINDOWS = {'7d': 7, '30d': 30, '90d': 90, '365d': 365, 'all': None}
+BATCH_SIZE = 500
+
+
+def normalize_item(item):
+    return ' '.join(str(item).split()).lower()[:150]
+
+
+def extract_food_items(vision_analysis):
+    """Normalized food items of a stored vision_analysis (in listed order, repeats kept)"""
+    if not vision_analysis:
+        return []
+    try:
+        analysis = json.loads(vision_analysis)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    if not isinstance(analysis, dict):
+        return []
+
+    items = []
+    for food_item in analysis.get('food_items') or []:
+        if isinstance(food_item, dict) and 'description' in food_item:
+            food_item = food_item['description']
+        if isinstance(food_item, str) and food_item.strip():
+            items.append(normalize_item(food_item))
+    return items
+
+
+def _rows(report_id, location_id, time, vision_analysis):
+    return [{'report_id': report_id, 'location_id': location_id, 'normalized_item': item, 'time': time}
+            for item in extract_food_items(vision_analysis)]
+
+
+def index_report(connection, report):
+    """Replace a report's rows with the items of its current analysis"""
+    table = ReportFoodItem.__table__
+    connection.execute(table.delete().where(table.c.report_id == report.id))
+    if report.location_id is None or report.time is None:
+        return
+    rows = _rows(report.id, report.location_id, report.time, report.vision_analysis)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, target):
+    if target.vision_analysis:
+        index_report(connection, target)
+
+
+@event.listens_for(Report, 'after_update')
+def report_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('vision_analysis', 'location_id', 'time')):
+        index_report(connection, target)
+
+
+@event.listens_for(Report, 'after_delete')
+def report_deleted(mapper, connection, target):
+    table = ReportFoodItem.__table__
+    connection.execute(table.delete().where(table.c.report_id == target.id))
+
+
+@event.listens_for(Location, 'after_delete')
+def location_deleted(mapper, connection, target):
+    table = ReportFoodItem.__table__
+    connection.execute(table.delete().where(table.c.location_id == target.id))
+
+
+def top_food_items(limit=10, location_id=None, state=None, since=None):
+    """
+    [(item, count)] most common first, for one pantry, one state or the whole
+    network, optionally only from reports at or after `since`. Ties keep the
+    item seen first.
+    """
+    count = func.count(ReportFoodItem.id)
+    query = db.session.query(ReportFoodItem.normalized_item, count)\
+                      .join(Location, Location.id == ReportFoodItem.location_id)
+    if location_id is not None:
+        query = query.filter(ReportFoodItem.location_id == location_id)
+    if state is not None:
+        query = query.filter(Location.state == state)
+    if since is not None:
+        query = query.filter(ReportFoodItem.time >= since)
+    return [(item, total) for item, total in
+            query.group_by(ReportFoodItem.normalized_item)
+                 .order_by(count.desc(), func.min(ReportFoodItem.time), func.min(ReportFoodItem.id))
+                 .limit(limit)]
+
+
+def window_start(window, now=None):
+    """Start of a ?window= value, None for all time; raises KeyError for unknown windows"""
+    days = WINDOWS[window]
+    if days is None:
+        return None
+    return (now or datetime.now(timezone.utc)) - timedelta(days=days)
+
+
+def backfill_food_items(batch_size=BATCH_SIZE):
+    """Index the food items of every report with an analysis; returns the number of items written"""
+    table = ReportFoodItem.__table__
+    written, last_id = 0, 0
+    while True:
+        reports = db.session.execute(
+            select(Report.id, Report.location_id, Report.time, Report.vision_analysis)
+            .where(Report.id > last_id, Report.vision_analysis.isnot(None), Report.vision_analysis != '')
+            .order_by(Report.id)
+            .limit(batch_size)
+        ).all()
+        if not reports:
+            break
+        last_id = reports[-1].id
+
+        db.session.execute(table.delete().where(table.c.report_id.in_([report.id for report in reports])))
+        rows = [row for report in reports if report.location_id is not None and report.time is not None
+                for row in _rows(*report)]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+        written += len(rows)
+    return written
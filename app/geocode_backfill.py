@@ -0,0 +1,193 @@
+"""
+Bulk geocoding backfill (`flask geocode-backfill`)
+
+Walks every location that is missing coordinates in id order, one batch at a
+time. Each batch is resolved from GeocodeCache in one query; the remaining
+distinct addresses are sent to the geocoder from a small thread pool that shares
+a token bucket, so concurrency hides latency without exceeding the
+requests-per-second budget. Results are written with bulk updates and the last
+processed id is saved to a checkpoint file after every batch, so an interrupted
+run resumes where it stopped.
+
+Bulk updates skip the ORM events, so each batch sets grid_cell itself, places
+the pantries in the cluster pyramid, marks the map snapshot stale, records the
+live status stream's 'location' events and invalidates the cached nationwide
+analytics, all in the transaction that writes the coordinates. updated_at is
+set too, so map deltas and the nearest-pantry index pick the pantries up. Cache entries are upserted, since
+the geocode worker may store the same address meanwhile.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import or_
+from . import db
+from .models import Location, GeocodeCache
+from .geocoding import get_geocoder, normalize_address, store_geocode
+from .spatial import grid_cell_for
+from .clustering import place_locations
+from .map_snapshot import mark_snapshot_stale
+from .status_stream import locations_bulk_updated
+from .analytics import NATIONWIDE_CACHE
+from .cache import invalidate
+
+DEFAULT_CHECKPOINT = '.geocode-backfill.json'
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: acquire() blocks until a request may be sent"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def load_checkpoint(path):
+    """Last location id processed by a previous run, or 0"""
+    try:
+        with open(path) as f:
+            return int(json.load(f).get('last_id', 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def save_checkpoint(path, last_id, stats):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump({'last_id': last_id, 'updated_at': datetime.now(timezone.utc).isoformat(), 'stats': stats}, f)
+    os.replace(temporary, path)
+
+
+def _missing_coordinates(after_id, batch_size):
+    return db.session.query(Location.id, Location.address, Location.city, Location.state, Location.zip)\
+                     .filter(or_(Location.latitude.is_(None), Location.longitude.is_(None)))\
+                     .filter(Location.id > after_id)\
+                     .order_by(Location.id)\
+                     .limit(batch_size)\
+                     .all()
+
+
+def _geocode_all(addresses, geocoder, bucket, workers):
+    """
+    Geocode distinct addresses concurrently under the bucket's rate
+    Returns {address: (latitude, longitude)} for answered lookups and {address: error} for failures
+    """
+    def lookup(address):
+        bucket.acquire()
+        result = geocoder.geocode(address)
+        return (result.latitude, result.longitude) if result else (None, None)
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {address: pool.submit(lookup, address) for address in addresses}
+        for address, future in futures.items():
+            try:
+                results[address] = future.result()
+            except Exception as e:
+                errors[address] = str(e)
+    return results, errors
+
+
+def backfill_coordinates(geocoder=None, batch_size=100, workers=4, rate=None,
+                         checkpoint_path=DEFAULT_CHECKPOINT, restart=False, dry_run=False, limit=None):
+    """
+    Geocode every location without coordinates
+    `rate` is the external request budget per second (GEOCODER_RATE_LIMIT, default 1)
+    Returns a stats dict; in dry-run mode nothing is geocoded or written and
+    `geocoded` is the number of external requests a real run would make
+    """
+    geocoder = geocoder or (None if dry_run else get_geocoder())
+    if rate is None:
+        rate = current_app.config.get('GEOCODER_RATE_LIMIT', 1.0)
+    bucket = TokenBucket(rate)
+    last_id = 0 if restart or not checkpoint_path else load_checkpoint(checkpoint_path)
+
+    stats = {'scanned': 0, 'cache_hits': 0, 'geocoded': 0, 'updated': 0, 'not_found': 0, 'errors': 0}
+    start = time.monotonic()
+
+    while limit is None or stats['scanned'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - stats['scanned'])
+        rows = _missing_coordinates(last_id, size)
+        if not rows:
+            break
+        stats['scanned'] += len(rows)
+
+        addresses = {row.id: f"{row.address}, {row.city}, {row.state} {row.zip}" for row in rows}
+        keys = {location_id: normalize_address(address) for location_id, address in addresses.items()}
+        cached = {entry.normalized_address: (entry.latitude, entry.longitude)
+                  for entry in GeocodeCache.query.filter(GeocodeCache.normalized_address.in_(set(keys.values())))}
+
+        # One request per distinct address that is not cached yet
+        to_geocode = {}
+        for location_id, key in keys.items():
+            if key in cached:
+                stats['cache_hits'] += 1
+            else:
+                to_geocode.setdefault(key, addresses[location_id])
+        stats['geocoded'] += len(to_geocode)
+
+        if dry_run:
+            last_id = rows[-1].id
+            continue
+
+        results, errors = _geocode_all(list(to_geocode.values()), geocoder, bucket, workers)
+        stats['errors'] += sum(1 for key in keys.values() if to_geocode.get(key) in errors)
+        for address, error in errors.items():
+            current_app.logger.error(f"Error geocoding address {address}: {error}")
+
+        # Errors are not cached so a later run can retry them; "not found" is
+        found = {normalize_address(address): coordinates for address, coordinates in results.items()}
+        connection = db.session.connection()
+        for key, (latitude, longitude) in found.items():
+            store_geocode(connection, key, latitude, longitude)
+        found.update(cached)
+
+        now = datetime.now(timezone.utc)
+        updates = []
+        for location_id, key in keys.items():
+            latitude, longitude = found.get(key, (None, None))
+            if latitude is None or longitude is None:
+                if key in found:
+                    stats['not_found'] += 1
+                continue
+            updates.append({'id': location_id, 'latitude': latitude, 'longitude': longitude,
+                            'grid_cell': grid_cell_for(latitude, longitude), 'updated_at': now})
+        if updates:
+            db.session.bulk_update_mappings(Location, updates)
+            place_locations(connection, [(update['id'], update['latitude'], update['longitude'])
+                                         for update in updates])
+            mark_snapshot_stale(connection)
+            locations_bulk_updated(connection, [update['id'] for update in updates])
+            invalidate(db.session, NATIONWIDE_CACHE)
+            stats['updated'] += len(updates)
+        db.session.commit()
+
+        last_id = rows[-1].id
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, last_id, stats)
+
+    stats['elapsed'] = round(time.monotonic() - start, 2)
+    stats['locations_per_second'] = round(stats['scanned'] / stats['elapsed'], 1) if stats['elapsed'] else None
+    stats['requests_per_second'] = round(stats['geocoded'] / stats['elapsed'], 2) if stats['elapsed'] else None
+    if dry_run:
+        stats['estimated_seconds'] = round(stats['geocoded'] / rate, 1)
+    return stats
@@ -0,0 +1,190 @@
+"""
+Background geocoding
+
+Locations saved without coordinates get a GeocodeJob instead of being geocoded
+inside a request. A worker (`flask geocode-worker`) drains the queue, and every
+lookup goes through the GeocodeCache table so a normalized address is only ever
+sent to the external geocoder once.
+"""
+import re
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from . import db
+from .models import Location, GeocodeJob, GeocodeCache
+from .db_helpers import upsert
+
+MAX_ATTEMPTS = 3
+
+
+def get_geocoder():
+    """
+    Return the configured geocoder (anything with a geopy-style `geocode(address)`)
+    Tests set GEOCODER to a local stub; otherwise Nominatim is used
+    """
+    geocoder = current_app.config.get('GEOCODER')
+    if geocoder is None:
+        from geopy.geocoders import Nominatim
+        geocoder = Nominatim(user_agent="report_that_pantry")
+        current_app.config['GEOCODER'] = geocoder
+    return geocoder
+
+
+def location_address(location):
+    """Full address string used for geocoding a location"""
+    return f"{location.address}, {location.city}, {location.state} {location.zip}"
+
+
+def normalize_address(address):
+    """
+    Normalize an address for cache lookups: lowercase, drop punctuation, collapse whitespace
+    """
+    address = re.sub(r'[^\w\s]', ' ', (address or '').lower())
+    return ' '.join(address.split())[:255]
+
+
+def parse_coordinate(value):
+    """Convert a form value to a float coordinate, or None if it is empty/invalid"""
+    try:
+        return float(value) if value not in (None, '') else None
+    except (ValueError, TypeError):
+        return None
+
+
+def enqueue_geocode(location):
+    """
+    Queue a geocoding job for a location that has no coordinates
+    Does nothing if the location already has coordinates; refreshes the address of a pending job
+    Returns the job (added to the session, not committed) or None
+    """
+    if location.latitude is not None and location.longitude is not None:
+        return None
+
+    if location.id is None:
+        db.session.flush()
+
+    address = location_address(location)
+    job = GeocodeJob.query.filter_by(location_id=location.id, status='pending').first()
+    if job:
+        job.address = address
+    else:
+        job = GeocodeJob(location_id=location.id, address=address, status='pending', attempts=0)
+        db.session.add(job)
+    return job
+
+
+def lookup_cached(address):
+    """Return the GeocodeCache row for an address, or None if it has never been geocoded"""
+    return GeocodeCache.query.get(normalize_address(address))
+
+
+def store_geocode(connection, normalized_address, latitude, longitude):
+    """
+    Record a geocoder result in the cache, replacing any row another worker or
+    the backfill stored for the same address meanwhile
+    """
+    upsert(connection, GeocodeCache.__table__, {'normalized_address': normalized_address},
+           {'latitude': latitude, 'longitude': longitude, 'created_at': datetime.now(timezone.utc)},
+           lambda current, new: {'latitude': new['latitude'], 'longitude': new['longitude']})
+
+
+def geocode_and_cache(address, geocoder=None):
+    """
+    Call the external geocoder and store the result (including "not found") in the cache
+    Returns (latitude, longitude); exceptions propagate and nothing is cached
+    """
+    geocoder = geocoder or get_geocoder()
+    result = geocoder.geocode(address)
+    latitude = result.latitude if result else None
+    longitude = result.longitude if result else None
+    store_geocode(db.session.connection(), normalize_address(address), latitude, longitude)
+    return latitude, longitude
+
+
+def cached_geocode(address, geocoder=None):
+    """
+    Geocode an address, only calling the external geocoder on a cache miss
+    Returns (latitude, longitude); coordinates are None if the address could not be found
+    """
+    cached = lookup_cached(address)
+    if cached:
+        return cached.latitude, cached.longitude
+    return geocode_and_cache(address, geocoder)
+
+
+def process_geocode_jobs(geocoder=None, limit=50, min_delay=None):
+    """
+    Drain up to `limit` pending jobs and commit the results once at the end
+    `min_delay` seconds are enforced between calls to the external geocoder (cache hits are free)
+    Returns a dict with counts of done, failed and retried jobs and cache hits
+    """
+    if min_delay is None:
+        min_delay = current_app.config.get('GEOCODER_MIN_DELAY_SECONDS', 1.0)
+
+    jobs = GeocodeJob.query.filter_by(status='pending').order_by(GeocodeJob.id).limit(limit).all()
+    stats = {'done': 0, 'failed': 0, 'retried': 0, 'cache_hits': 0}
+    last_call = None
+
+    for job in jobs:
+        location = Location.query.get(job.location_id) if job.location_id else None
+        if location is None or (location.latitude is not None and location.longitude is not None):
+            # Location was deleted or got coordinates some other way
+            job.status = 'done'
+            job.completed_at = datetime.now(timezone.utc)
+            stats['done'] += 1
+            continue
+
+        job.attempts = (job.attempts or 0) + 1
+        cached = lookup_cached(job.address)
+        if cached:
+            latitude, longitude = cached.latitude, cached.longitude
+            stats['cache_hits'] += 1
+        else:
+            # Respect the external service's rate limit
+            if last_call is not None:
+                wait = min_delay - (time.monotonic() - last_call)
+                if wait > 0:
+                    time.sleep(wait)
+            try:
+                latitude, longitude = geocode_and_cache(job.address, geocoder)
+            except Exception as e:
+                print(f"Error geocoding address {job.address}: {e}")
+                job.last_error = str(e)[:250]
+                if job.attempts >= MAX_ATTEMPTS:
+                    job.status = 'failed'
+                    stats['failed'] += 1
+                else:
+                    stats['retried'] += 1
+                continue
+            finally:
+                last_call = time.monotonic()
+
+        if latitude is not None and longitude is not None:
+            location.latitude = latitude
+            location.longitude = longitude
+            job.status = 'done'
+            stats['done'] += 1
+        else:
+            job.status = 'failed'
+            job.last_error = 'Address not found'
+            stats['failed'] += 1
+        job.completed_at = datetime.now(timezone.utc)
+
+    db.session.commit()
+    return stats
+
+
+def run_geocode_worker(poll_interval=30, batch_size=50, once=False):
+    """
+    Worker loop: drain the job queue, then sleep `poll_interval` seconds once it runs dry
+    """
+    while True:
+        stats = process_geocode_jobs(limit=batch_size)
+        processed = stats['done'] + stats['failed'] + stats['retried']
+        if processed:
+            print(f"Geocoded {stats['done']} locations ({stats['cache_hits']} from cache), "
+                  f"{stats['failed']} failed, {stats['retried']} will be retried")
+        if once:
+            return stats
+        if processed < batch_size:
+            time.sleep(poll_interval)
@@ -0,0 +1,227 @@
+"""
+Map feed queries
+
+Builds the /get_pantry_data payload from one set-based query that joins every
+location with its most recent report, instead of one lookup per location.
+
+Viewport queries (`bbox=`) go through the grid index in spatial.py.
+Polling clients can ask for a delta with `?since=<cursor>`. A cursor records the
+newest report id, the newest location update, the location count and the newest
+status_event id at the time it was issued; see `feed_state`. The status_event
+log (written by status_stream.py) records deletions, so a delta lists the
+pantries that are gone, or have moved out of the client's box, under `removed`.
+Transactions can commit out of order, so the location update and event cursors
+are overlapped by CURSOR_OVERLAP; re-sending a pantry is harmless.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, and_
+from . import db
+from .models import Location, Report, StatusEvent
+from .db_helpers import as_utc
+from .spatial import bbox_filter, parse_bbox
+
+FeedState = namedtuple('FeedState', ['last_report_id', 'last_location_update', 'location_count', 'last_event_id'])
+
+# Writes committed up to this long after a cursor was issued, with older ids or timestamps, are still picked up
+CURSOR_OVERLAP = timedelta(seconds=10)
+
+
+def latest_report_subquery(location_ids=None):
+    """
+    Subquery with one row (the most recent report) per location
+    Postgres uses DISTINCT ON; other databases (SQLite) use a ROW_NUMBER() window
+    `location_ids` optionally restricts it to the locations selected by a query of ids
+    """
+    columns = (Report.location_id, Report.id, Report.pantry_fullness, Report.time)
+
+    if db.engine.dialect.name == 'postgresql':
+        query = db.session.query(*columns)
+        if location_ids is not None:
+            query = query.filter(Report.location_id.in_(location_ids))
+        return query.distinct(Report.location_id)\
+                    .order_by(Report.location_id, Report.time.desc(), Report.id.desc())\
+                    .subquery('latest_report')
+
+    ranked = db.session.query(
+        *columns,
+        func.row_number().over(
+            partition_by=Report.location_id,
+            order_by=(Report.time.desc(), Report.id.desc())
+        ).label('row_number')
+    )
+    if location_ids is not None:
+        ranked = ranked.filter(Report.location_id.in_(location_ids))
+    ranked = ranked.subquery('ranked_report')
+
+    return db.session.query(ranked.c.location_id, ranked.c.id, ranked.c.pantry_fullness, ranked.c.time)\
+                     .filter(ranked.c.row_number == 1)\
+                     .subquery('latest_report')
+
+
+def pantry_status(fullness):
+    """
+    Map a fullness percentage to the map's (status, marker_color) pair
+    """
+    if fullness is None:
+        return 'unknown', 'gray'
+    if fullness >= 75:
+        return 'full', 'green'
+    if fullness >= 25:
+        return 'low', 'yellow'
+    return 'empty', 'red'
+
+
+def serialize_pantry(location, fullness, last_updated):
+    """
+    Build the JSON entry for one pantry on the map
+    """
+    status, marker_color = pantry_status(fullness)
+    return {
+        'id': location.id,
+        'name': location.name,
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'address': f"{location.address}, {location.city}, {location.state} {location.zip}",
+        'description': location.description,
+        'contact_info': location.contact_info,
+        'fullness': fullness,
+        'status': status,
+        'marker_color': marker_color,
+        'lastUpdated': last_updated.isoformat() if last_updated else None,
+    }
+
+
+def pantry_feed_query(location_filter=None, limit=None):
+    """
+    Query yielding (Location, latest fullness, latest report time) for every location
+    `location_filter` is an optional SQL expression restricting which locations are returned
+    """
+    location_ids = None
+    if location_filter is not None:
+        # Only rank the reports of the locations being returned
+        location_ids = db.session.query(Location.id).filter(location_filter)
+
+    latest = latest_report_subquery(location_ids)
+    query = db.session.query(Location, latest.c.pantry_fullness, latest.c.time)\
+                      .outerjoin(latest, latest.c.location_id == Location.id)
+    if location_ids is not None:
+        query = query.filter(Location.id.in_(location_ids))
+    query = query.order_by(Location.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def build_pantry_feed(location_filter=None, limit=None):
+    """
+    Return the list of pantries for the map, using a single query
+    """
+    return [serialize_pantry(location, fullness, last_updated)
+            for location, fullness, last_updated in pantry_feed_query(location_filter, limit)]
+
+
+def viewport_filter(bbox):
+    """
+    Location filter for a "minLon,minLat,maxLon,maxLat" query argument, or None if there is no box
+    Raises ValueError if the box is malformed
+    """
+    if not bbox:
+        return None
+    return bbox_filter(*parse_bbox(bbox))
+
+
+def feed_state():
+    """
+    Cheap summary of the feed that changes whenever any pantry on the map does
+    (one query over the report, location.updated_at and status_event indexes)
+    """
+    last_report_id = db.session.query(func.max(Report.id)).scalar_subquery()
+    last_location_update = db.session.query(func.max(Location.updated_at)).scalar_subquery()
+    location_count = db.session.query(func.count(Location.id)).scalar_subquery()
+    last_event_id = db.session.query(func.max(StatusEvent.id)).scalar_subquery()
+    row = db.session.query(last_report_id, last_location_update, location_count, last_event_id).one()
+    return FeedState(row[0] or 0, as_utc(row[1]), row[2] or 0, row[3] or 0)
+
+
+def encode_cursor(state):
+    """Serialize a FeedState into the opaque cursor handed to clients"""
+    updated = int(state.last_location_update.timestamp() * 1000000) if state.last_location_update else 0
+    return f"{state.last_report_id}.{updated}.{state.location_count}.{state.last_event_id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor back into a FeedState; returns None if it is malformed"""
+    try:
+        report_id, updated, count, event_id = (int(part) for part in cursor.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    last_update = datetime.fromtimestamp(updated / 1000000, timezone.utc) if updated else None
+    return FeedState(report_id, last_update, count, event_id)
+
+
+def feed_etag(state, *variant):
+    """Strong ETag for the feed at `state`; `variant` distinguishes different responses (e.g. the cursor asked for)"""
+    key = '|'.join([encode_cursor(state)] + [str(part) for part in variant])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _events_pruned(since, state):
+    """True when status events after cursor `since` may have been pruned, so its deletions can't be listed"""
+    if state.last_event_id < since.last_event_id:
+        return True
+    oldest = db.session.query(func.min(StatusEvent.id)).scalar()
+    return oldest is not None and oldest > since.last_event_id + 1
+
+
+def changed_location_ids(since):
+    """
+    Query of the ids of pantries with a new report, a metadata change or a status
+    event after FeedState `since`, including deleted ones
+    """
+    changed = db.session.query(Report.location_id).filter(Report.id > since.last_report_id)
+    if since.last_location_update is not None:
+        changed = changed.union(db.session.query(Location.id).filter(
+            Location.updated_at > since.last_location_update - CURSOR_OVERLAP))
+    else:
+        changed = changed.union(db.session.query(Location.id))
+
+    events = StatusEvent.id > since.last_event_id
+    cursor_event_time = db.session.query(StatusEvent.created_at)\
+                                  .filter(StatusEvent.id == since.last_event_id).scalar()
+    if cursor_event_time is not None:
+        events = events | (StatusEvent.created_at >= as_utc(cursor_event_time) - CURSOR_OVERLAP)
+    return changed.union(db.session.query(StatusEvent.location_id).filter(events))
+
+
+def changed_since_filter(since):
+    """Location filter for pantries changed after FeedState `since` (see changed_location_ids)"""
+    return Location.id.in_(changed_location_ids(since))
+
+
+def build_pantry_delta(since, state, location_filter=None):
+    """
+    Pantries whose latest report or metadata changed after cursor `since`, and
+    under `removed` the changed pantries that were deleted or are now outside
+    `location_filter`
+    Returns the delta payload; `full` is set when the client must replace its whole list
+    (bad cursor, or the events since the cursor were pruned)
+    """
+    if since is None or _events_pruned(since, state):
+        return {'cursor': encode_cursor(state), 'full': True, 'pantries': build_pantry_feed(location_filter),
+                'removed': []}
+
+    changed = [location_id for (location_id,) in changed_location_ids(since)]
+    changed_filter = Location.id.in_(changed)
+    if location_filter is not None:
+        changed_filter = and_(changed_filter, location_filter)
+    pantries = build_pantry_feed(changed_filter)
+    sent = {pantry['id'] for pantry in pantries}
+
+    return {
+        'cursor': encode_cursor(state),
+        'full': False,
+        'pantries': pantries,
+        'removed': sorted(set(changed) - sent),
+    }
@@ -0,0 +1,143 @@
+"""
+Pre-serialized map snapshot
+
+The full /get_pantry_data payload is the same for every visitor between writes,
+so it is stored in the map_snapshot table as JSON bytes plus gzip (and brotli,
+when the package is installed) variants, next to the columnar binary encoding
+from feed_format.py. Any ORM write to a Location or Report marks the row stale
+inside the same transaction; the next request for the map claims the rebuild,
+and every gunicorn worker serves the stored bytes until the next write. A
+request reads the row's small columns first and then only the one variant it
+sends, and nothing more when the client's ETag still matches.
+"""
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from flask import json
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Location, Report, MapSnapshot
+from .map_data import pantry_feed_query, serialize_pantry, feed_state, encode_cursor
+from .feed_format import encode_pantry_columns
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FEED_SNAPSHOT = 'pantry_feed'
+# Feed format -> (column holding the uncompressed bytes, ETag column, {Content-Encoding: column})
+VARIANTS = {
+    'json': ('body', 'etag', {'br': 'body_brotli', 'gzip': 'body_gzip'}),
+    'binary': ('binary', 'binary_etag', {'gzip': 'binary_gzip'}),
+}
+
+
+def mark_snapshot_stale(connection=None):
+    """
+    Flag the snapshot for regeneration
+    Pass the flush connection from a mapper event so the flag commits with the write
+    Only a fresh snapshot is updated, so writes to an already stale one take no row lock
+    """
+    table = MapSnapshot.__table__
+    statement = table.update().where(table.c.stale == False).values(stale=True)  # noqa: E712
+    if connection is None:
+        db.session.execute(statement)
+    else:
+        connection.execute(statement)
+
+
+@event.listens_for(Location, 'after_insert')
+@event.listens_for(Location, 'after_update')
+@event.listens_for(Location, 'after_delete')
+@event.listens_for(Report, 'after_insert')
+@event.listens_for(Report, 'after_update')
+@event.listens_for(Report, 'after_delete')
+def pantry_written(mapper, connection, target):
+    mark_snapshot_stale(connection)
+
+
+def _claim_rebuild():
+    """Atomically take over a stale snapshot; False if another worker got there first"""
+    table = MapSnapshot.__table__
+    result = db.session.execute(
+        table.update()
+        .where(table.c.name == FEED_SNAPSHOT, table.c.stale == True)  # noqa: E712
+        .values(stale=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def regenerate_snapshot(snapshot=None):
+    """
+    Serialize and compress the full map feed and store it
+    Returns the MapSnapshot (possibly not persisted if another worker inserted it first)
+    """
+    # Take the cursor before reading the feed so clients never skip a change
+    cursor = encode_cursor(feed_state())
+    rows = pantry_feed_query().all()
+    body = json.dumps([serialize_pantry(*row) for row in rows], separators=(',', ':')).encode('utf-8')
+    binary = encode_pantry_columns(rows)
+
+    if snapshot is None:
+        snapshot = MapSnapshot(name=FEED_SNAPSHOT, stale=False)
+        db.session.add(snapshot)
+    snapshot.cursor = cursor
+    snapshot.etag = hashlib.sha1(body).hexdigest()
+    snapshot.body = body
+    snapshot.body_gzip = gzip.compress(body, compresslevel=9)
+    snapshot.body_brotli = brotli.compress(body) if brotli is not None else None
+    snapshot.binary_etag = hashlib.sha1(binary).hexdigest()
+    snapshot.binary = binary
+    snapshot.binary_gzip = gzip.compress(binary, compresslevel=9)
+    snapshot.generated_at = datetime.now(timezone.utc)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row at the same time; theirs is just as fresh
+        db.session.rollback()
+        return MapSnapshot.query.get(FEED_SNAPSHOT)
+    return snapshot
+
+
+def current_snapshot():
+    """
+    The map snapshot, regenerated first if a write made it stale
+    While another worker is regenerating, the previous bytes are served
+    """
+    snapshot = MapSnapshot.query.get(FEED_SNAPSHOT)
+    if snapshot is None:
+        return regenerate_snapshot()
+    if not snapshot.stale or not _claim_rebuild():
+        return snapshot
+
+    try:
+        return regenerate_snapshot(snapshot)
+    except Exception:
+        db.session.rollback()
+        mark_snapshot_stale()
+        db.session.commit()
+        raise
+
+
+def snapshot_variant(snapshot, accept_encodings, feed_format='json'):
+    """
+    Pick the stored variant for a feed format and a request's Accept-Encoding
+    Returns (column holding its bytes, content_encoding or None, etag); each variant gets its
+    own strong ETag. The bytes are only loaded when the column is read (see snapshot_body)
+    """
+    body_column, etag_column, encodings = VARIANTS[feed_format]
+    etag = getattr(snapshot, etag_column)
+    available = [encoding for encoding, column in encodings.items() if getattr(snapshot, f"has_{column}")]
+    encoding = accept_encodings.best_match(available)
+    if encoding is None:
+        return body_column, None, etag
+    return encodings[encoding], encoding, f"{etag}-{encoding}"
+
+
+def snapshot_body(snapshot, column):
+    """The bytes of one stored variant, loaded with a query for that column alone"""
+    return getattr(snapshot, column)
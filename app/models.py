@@ -3,6 +3,7 @@ from flask import url_for
 from flask_login import UserMixin
 from sqlalchemy.sql import func
 from datetime import datetime, timezone
+from .db_helpers import UTCDateTime
 
 
 class User(db.Model, UserMixin):
@@ -31,10 +32,13 @@ class Location(db.Model, UserMixin):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     reports = db.relationship('Report', backref='location')
     notifications = db.relationship('Notification', backref='location')
+    geocode_jobs = db.relationship('GeocodeJob', backref='location', cascade='all, delete-orphan')
 
      # New fields for latitude and longitude
     latitude = db.Column(db.Float, nullable=True)  # Using Float for decimal precision
     longitude = db.Column(db.Float, nullable=True)
+    # Spatial grid cell for bounding-box queries, maintained in spatial.py
+    grid_cell = db.Column(db.Integer, nullable=True, index=True)
     
     # Email-only submission fields
     submitter_email = db.Column(db.String(150), nullable=True)  # Email for non-account users
@@ -43,6 +47,9 @@ class Location(db.Model, UserMixin):
     verified = db.Column(db.Boolean, default=False)  # Whether email is verified
     verified_at = db.Column(db.DateTime(timezone=True), nullable=True)  # When verified
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
+    # Bumped on every change so map clients can poll for deltas
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc), index=True)
 
 
     def to_dict(self):
@@ -54,13 +61,15 @@ class Location(db.Model, UserMixin):
         }
 
 class Report(db.Model):
+    # A location's history, newest first, is read through (location_id, time)
+    __table_args__ = (db.Index('ix_report_location_id_time', 'location_id', 'time'),)
     id = db.Column(db.Integer, primary_key=True)
     pantry_fullness  = db.Column(db.Integer)
-    time = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
+    time = db.Column(UTCDateTime(), default=lambda: datetime.now(timezone.utc), index=True)
     photo = db.Column(db.String(150), nullable=True)
     description = db.Column(db.String(250), nullable=True)
     vision_analysis = db.Column(db.Text, nullable=True)  # Store Vision API results as JSON
-    location_id = db.Column(db.Integer, db.ForeignKey('location.id'))
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     submitted_by_email = db.Column(db.String(150), nullable=True)  # For non-account submissions
 
@@ -132,3 +141,165 @@ class Notification(db.Model):
     unsubscribe_token = db.Column(db.String(100), unique=True, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))   
 
+
+
+class GeocodeJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), index=True)
+    address = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, done or failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(250), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    completed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+class GeocodeCache(db.Model):
+    # Normalized address -> coordinates; a row with null coordinates records a failed lookup
+    normalized_address = db.Column(db.String(255), primary_key=True)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class MapClusterCell(db.Model):
+    # Aggregated pantries in one grid cell of one zoom level (see clustering.py)
+    zoom = db.Column(db.Integer, primary_key=True)
+    cell_x = db.Column(db.Integer, primary_key=True)
+    cell_y = db.Column(db.Integer, primary_key=True)
+    pantry_count = db.Column(db.Integer, default=0)
+    latitude_micro_sum = db.Column(db.BigInteger, default=0)  # millionths of a degree
+    longitude_micro_sum = db.Column(db.BigInteger, default=0)
+    full_count = db.Column(db.Integer, default=0)
+    low_count = db.Column(db.Integer, default=0)
+    empty_count = db.Column(db.Integer, default=0)
+    unknown_count = db.Column(db.Integer, default=0)
+
+
+class MapClusterMember(db.Model):
+    # What each location currently contributes to the cluster cells
+    location_id = db.Column(db.Integer, primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+
+
+class MapSnapshot(db.Model):
+    # Pre-serialized (and pre-compressed) map payload shared by every worker (see map_snapshot.py)
+    # The payloads are deferred: a request loads only the one variant it sends
+    name = db.Column(db.String(50), primary_key=True)
+    stale = db.Column(db.Boolean, default=False, nullable=False)
+    cursor = db.Column(db.String(100))
+    etag = db.Column(db.String(64))
+    body = db.deferred(db.Column(db.LargeBinary))
+    body_gzip = db.deferred(db.Column(db.LargeBinary))
+    body_brotli = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    # Columnar encoding of the same feed (see feed_format.py)
+    binary_etag = db.Column(db.String(64), nullable=True)
+    binary = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    binary_gzip = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    generated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # Which compressed variants are stored, read without loading them
+    has_body_gzip = db.column_property(body_gzip.columns[0].isnot(None))
+    has_body_brotli = db.column_property(body_brotli.columns[0].isnot(None))
+    has_binary_gzip = db.column_property(binary_gzip.columns[0].isnot(None))
+
+
+class StatusEvent(db.Model):
+    # Append-only log of pantry changes pushed to /stream/status; the id is the SSE event id
+    # (ids must never be reused after pruning, hence AUTOINCREMENT on SQLite)
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'report', 'location' or 'deleted'
+    payload = db.Column(db.Text, nullable=False)  # JSON sent to clients
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+
+
+class ReportDailyRollup(db.Model):
+    # Per location and UTC day summary of its reports, maintained on insert (see rollups.py)
+    location_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    report_count = db.Column(db.Integer, nullable=False, default=0)
+    # Over the reports that have a fullness value
+    fullness_sum = db.Column(db.Integer, nullable=False, default=0)
+    fullness_count = db.Column(db.Integer, nullable=False, default=0)
+    fullness_min = db.Column(db.Integer, nullable=True)
+    fullness_max = db.Column(db.Integer, nullable=True)
+    empty_count = db.Column(db.Integer, nullable=False, default=0)  # fullness <= 33
+    full_count = db.Column(db.Integer, nullable=False, default=0)  # fullness > 66
+    # The day's latest report (by time, then id)
+    last_fullness = db.Column(db.Integer, nullable=True)
+    first_report_time = db.Column(UTCDateTime(), nullable=False)
+    last_report_time = db.Column(UTCDateTime(), nullable=False)
+    ai_report_count = db.Column(db.Integer, nullable=False, default=0)
+    # Over the reports whose analysis has a numeric fullness estimate
+    ai_fullness_sum = db.Column(db.Float, nullable=False, default=0)
+    ai_fullness_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CacheEntry(db.Model):
+    # Key/value store shared by all workers when no Redis is configured (see cache.py)
+    key = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.LargeBinary, nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+class LocationLatestReport(db.Model):
+    # Each location's most recent report (by time, then id), maintained on write (see rollups.py)
+    location_id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, nullable=False)
+    pantry_fullness = db.Column(db.Integer, nullable=True)
+    time = db.Column(UTCDateTime(), nullable=False, index=True)
+
+
+class StateSummary(db.Model):
+    # Per state, maintained on write (see rollups.py); state is '' for locations without one
+    state = db.Column(db.String(50), primary_key=True)
+    location_count = db.Column(db.Integer, nullable=False, default=0)
+    active_location_count = db.Column(db.Integer, nullable=False, default=0)  # with at least one report
+    report_count = db.Column(db.Integer, nullable=False, default=0)
+    # Over each active location's latest report
+    fullness_sum = db.Column(db.Integer, nullable=False, default=0)
+    fullness_count = db.Column(db.Integer, nullable=False, default=0)
+    empty_count = db.Column(db.Integer, nullable=False, default=0)  # fullness <= 33
+    low_count = db.Column(db.Integer, nullable=False, default=0)  # 33 < fullness <= 66
+    full_count = db.Column(db.Integer, nullable=False, default=0)  # fullness > 66
+
+
+class ReportFoodItem(db.Model):
+    # One AI-detected food item of a report, maintained on write (see food_items.py)
+    __table_args__ = (db.Index('ix_report_food_item_location_id_time', 'location_id', 'time'),)
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, nullable=False, index=True)
+    location_id = db.Column(db.Integer, nullable=False)
+    normalized_item = db.Column(db.String(150), nullable=False)
+    time = db.Column(UTCDateTime(), nullable=False, index=True)
+
+
+class PantryEvent(db.Model):
+    # A restock or depletion made by a report, maintained on write (see pantry_events.py)
+    __table_args__ = (db.Index('ix_pantry_event_location_id_time', 'location_id', 'time'),)
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, nullable=False, index=True)
+    location_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'restock' or 'depletion'
+    time = db.Column(UTCDateTime(), nullable=False)
+    from_fullness = db.Column(db.Integer, nullable=False)
+    to_fullness = db.Column(db.Integer, nullable=False)
+    elapsed_hours = db.Column(db.Float, nullable=False)  # since the previous report
+
+
+class SiteCounter(db.Model):
+    # Site-wide totals shown on the homepage, maintained on write (see counters.py)
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class LocationAnalyticsState(db.Model):
+    # Running per-pantry analytics (JSON), maintained on write (see pantry_state.py)
+    location_id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.Text, nullable=False)
+    report_count = db.Column(db.Integer, nullable=False, default=0)
+    last_report_id = db.Column(db.Integer, nullable=False, default=0)
+    last_report_time = db.Column(UTCDateTime(), nullable=True)
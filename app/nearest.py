@@ -0,0 +1,294 @@
+"""
+Nearest-pantry search
+
+Each worker keeps an in-memory KD-tree over the pantries' coordinates, stored
+as 3D unit vectors so straight-line (chord) distance orders points exactly like
+great-circle distance, with no special cases at the poles or the antimeridian.
+
+The index is kept current with the same FeedState used for map polling: one
+cheap state query, run at most every NEAREST_REFRESH_SECONDS (and on the next
+search after this worker commits a pantry or report write), and only pantries
+changed since the index's state are reloaded. Searches in between cost no query. Moved or new pantries go into a small overlay that is
+searched by brute force; the tree is rebuilt from memory once the overlay grows
+past OVERLAY_LIMIT or sqrt(n), and from the database when locations were deleted.
+Updates are copy-on-write, so concurrent searches need no lock.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models import Location, Report
+from .map_data import pantry_feed_query, pantry_status, feed_state, changed_since_filter
+
+EARTH_RADIUS_MILES = 3959
+LEAF_SIZE = 8
+OVERLAY_LIMIT = 64
+# Other workers' writes reach this worker's index within this many seconds
+REFRESH_SECONDS = 2
+
+_index_lock = threading.Lock()
+# Bumped when this worker commits a pantry or report write
+_local_writes = 0
+_writes_lock = threading.Lock()
+
+
+def unit_vector(latitude, longitude):
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in miles"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+class KDTree:
+    """
+    Static implicit KD-tree: points are reordered so that every subtree is a
+    contiguous range [lo, hi) split at its median, with leaves of up to LEAF_SIZE
+    """
+
+    def __init__(self, ids, vectors):
+        count = len(ids)
+        # (axis, median value) of each internal node, keyed by its mid index
+        self.splits = {}
+        if count:
+            points = np.asarray(vectors, dtype=float)
+            order = np.arange(count)
+            self._build(points, order, 0, count)
+            points = points[order]
+            self.ids = [ids[i] for i in order.tolist()]
+            self.coords = (points[:, 0].tolist(), points[:, 1].tolist(), points[:, 2].tolist())
+        else:
+            self.ids = []
+            self.coords = ([], [], [])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build(self, points, order, lo, hi):
+        # Split on the axis with the widest spread until the ranges are leaf-sized
+        stack = [(lo, hi)]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            block = points[order[lo:hi]]
+            axis = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            mid = (lo + hi) // 2
+            partition = np.argpartition(block[:, axis], mid - lo)
+            order[lo:hi] = order[lo:hi][partition]
+            # Stored now: splitting the children reorders the points around mid
+            self.splits[mid] = (axis, float(block[partition[mid - lo], axis]))
+            stack.append((lo, mid))
+            stack.append((mid, hi))
+
+    def search(self, query, k, accept, heap):
+        """Push the k nearest accepted points onto `heap` as (-squared chord distance, id)"""
+        if self.ids:
+            self._search(0, len(self.ids), query, k, accept, heap)
+
+    def _search(self, lo, hi, query, k, accept, heap):
+        if hi - lo <= LEAF_SIZE:
+            xs, ys, zs = self.coords
+            qx, qy, qz = query
+            for i in range(lo, hi):
+                location_id = self.ids[i]
+                if not accept(location_id):
+                    continue
+                distance = (xs[i] - qx) ** 2 + (ys[i] - qy) ** 2 + (zs[i] - qz) ** 2
+                if len(heap) < k:
+                    heapq.heappush(heap, (-distance, location_id))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, location_id))
+            return
+
+        mid = (lo + hi) // 2
+        axis, median = self.splits[mid]
+        difference = query[axis] - median
+        if difference < 0:
+            near, far = (lo, mid), (mid, hi)
+        else:
+            near, far = (mid, hi), (lo, mid)
+
+        self._search(near[0], near[1], query, k, accept, heap)
+        if len(heap) < k or difference * difference < -heap[0][0]:
+            self._search(far[0], far[1], query, k, accept, heap)
+
+
+# Everything a search reads, swapped in as a whole so searches never see a half-applied update
+IndexView = namedtuple('IndexView', 'pantries tree tree_positions overlay removed')
+
+
+class NearestPantryIndex:
+    """
+    KD-tree plus overlay of pantries changed since it was built, and every pantry's map status
+    Updates (made under _index_lock) build a new IndexView and swap it in with one
+    assignment; searches read one view without locking
+    """
+
+    def __init__(self, state, pantries):
+        # pantries: {location_id: (latitude, longitude, status)}, coordinates may be None
+        self.state = state
+        self.view = self._build_view(pantries)
+        # When the state was last compared with the database, and the local writes seen then
+        self.checked_at = time.monotonic()
+        self.checked_writes = _local_writes
+
+    @classmethod
+    def load(cls):
+        state = feed_state()
+        pantries = {}
+        for location, fullness, _ in pantry_feed_query():
+            pantries[location.id] = (location.latitude, location.longitude, pantry_status(fullness)[0])
+        return cls(state, pantries)
+
+    @staticmethod
+    def _build_view(pantries):
+        located = [(location_id, latitude, longitude)
+                   for location_id, (latitude, longitude, _) in pantries.items()
+                   if latitude is not None and longitude is not None]
+        tree = KDTree([row[0] for row in located], [unit_vector(row[1], row[2]) for row in located])
+        # Position each id had when the tree was built, to spot moved pantries
+        tree_positions = {row[0]: (row[1], row[2]) for row in located}
+        return IndexView(pantries, tree, tree_positions, {}, frozenset())
+
+    def apply_changes(self, state):
+        """Reload the pantries changed since this index's state"""
+        view = self.view
+        pantries, overlay, removed = dict(view.pantries), dict(view.overlay), set(view.removed)
+        for location, fullness, _ in pantry_feed_query(changed_since_filter(self.state)):
+            latitude, longitude = location.latitude, location.longitude
+            pantries[location.id] = (latitude, longitude, pantry_status(fullness)[0])
+
+            if view.tree_positions.get(location.id) == (latitude, longitude):
+                removed.discard(location.id)
+                overlay.pop(location.id, None)
+                continue
+            if location.id in view.tree_positions:
+                removed.add(location.id)
+            if latitude is not None and longitude is not None:
+                overlay[location.id] = unit_vector(latitude, longitude)
+            else:
+                overlay.pop(location.id, None)
+
+        if len(overlay) + len(removed) > max(OVERLAY_LIMIT, math.isqrt(len(view.tree))):
+            self.view = self._build_view(pantries)
+        else:
+            self.view = view._replace(pantries=pantries, overlay=overlay, removed=frozenset(removed))
+        self.state = state
+
+    def discard(self, location_ids):
+        """Forget pantries that no longer exist"""
+        view = self.view
+        pantries, overlay, removed = dict(view.pantries), dict(view.overlay), set(view.removed)
+        for location_id in location_ids:
+            pantries.pop(location_id, None)
+            overlay.pop(location_id, None)
+            if location_id in view.tree_positions:
+                removed.add(location_id)
+        self.view = view._replace(pantries=pantries, overlay=overlay, removed=frozenset(removed))
+
+    def nearest(self, latitude, longitude, k, statuses=None):
+        """
+        Ids of the k nearest pantries with coordinates, closest first
+        `statuses` optionally limits the search to pantries with one of those map statuses
+        """
+        query = unit_vector(latitude, longitude)
+        pantries, tree, _, overlay, removed = self.view
+
+        def accept(location_id):
+            if location_id in removed or location_id in overlay:
+                return False
+            return statuses is None or pantries[location_id][2] in statuses
+
+        heap = []
+        tree.search(query, k, accept, heap)
+        for location_id, (x, y, z) in overlay.items():
+            if statuses is not None and pantries[location_id][2] not in statuses:
+                continue
+            distance = (x - query[0]) ** 2 + (y - query[1]) ** 2 + (z - query[2]) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-distance, location_id))
+            elif distance < -heap[0][0]:
+                heapq.heapreplace(heap, (-distance, location_id))
+
+        return [location_id for _, location_id in sorted(heap, reverse=True)]
+
+
+@event.listens_for(Session, 'after_flush')
+def note_pantry_writes(session, flush_context):
+    if any(isinstance(target, (Location, Report)) for target in (*session.new, *session.dirty, *session.deleted)):
+        session.info['nearest_index_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def count_pantry_writes(session):
+    global _local_writes
+    if session.info.pop('nearest_index_stale', False):
+        with _writes_lock:
+            _local_writes += 1
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pantry_writes(session):
+    session.info.pop('nearest_index_stale', None)
+
+
+def _is_fresh(index):
+    interval = current_app.config.get('NEAREST_REFRESH_SECONDS', REFRESH_SECONDS)
+    return index.checked_writes == _local_writes and time.monotonic() - index.checked_at < interval
+
+
+def get_nearest_index():
+    """
+    The app's nearest-pantry index, brought up to date with the database
+    Costs no query while the last check is fresh, and a single state query when nothing changed
+    """
+    index = current_app.extensions.get('nearest_pantry_index')
+    if index is not None and _is_fresh(index):
+        return index
+
+    writes = _local_writes
+    state = feed_state()
+    with _index_lock:
+        index = current_app.extensions.get('nearest_pantry_index')
+        if index is None or state.location_count < index.state.location_count:
+            # First use, or locations were deleted: reload everything
+            index = NearestPantryIndex.load()
+            current_app.extensions['nearest_pantry_index'] = index
+        elif state != index.state:
+            index.apply_changes(state)
+        index.checked_at, index.checked_writes = time.monotonic(), writes
+        return index
+
+
+def find_nearest_pantries(latitude, longitude, k, statuses=None):
+    """
+    The k nearest pantries as (Location, fullness, last report time, distance in miles), closest first
+    """
+    index = get_nearest_index()
+    location_ids = index.nearest(latitude, longitude, k, statuses)
+    if not location_ids:
+        return []
+
+    rows = {location.id: (location, fullness, last_updated)
+            for location, fullness, last_updated in pantry_feed_query(Location.id.in_(location_ids))}
+
+    missing = [location_id for location_id in location_ids if location_id not in rows]
+    if missing:
+        # Deleted since the index last looked; drop them and fill the gap
+        with _index_lock:
+            index.discard(missing)
+        return find_nearest_pantries(latitude, longitude, k, statuses)
+
+    return [rows[location_id] + (haversine_miles(latitude, longitude,
+                                                 rows[location_id][0].latitude, rows[location_id][0].longitude),)
+            for location_id in location_ids]
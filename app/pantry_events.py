@@ -0,0 +1,182 @@
+"""
+Restock and depletion events, one row per report that made one
+
+A report is a restock when its fullness is more than RESTOCK_RISE above the
+pantry's previous report, and a depletion when it is more than DEPLETION_DROP
+below it. pantry_event stores each with its from/to fullness and the hours
+since the previous report. It is written on the flush connection when a report
+is saved, by comparing it with its neighbours; edits re-derive the pantry's
+events. The restocking section of the pantry analytics (frequency, average
+restock time, recent restocks) is then read from (location_id, time).
+
+`flask backfill-pantry-events` derives the events of existing history with
+one LAG() window query.
+"""
+from sqlalchemy import and_, event, func, inspect, or_, select
+from . import db
+from .models import Location, Report, PantryEvent
+from .db_helpers import UTCDateTime
+from .report_engine import (_epoch_microseconds, RESTOCK_RISE, DEPLETION_DROP,
+                            QUICK_RESTOCK_HOURS, QUICK_DEPLETION_HOURS)
+
+RESTOCK = 'restock'
+DEPLETION = 'depletion'
+RECENT_RESTOCKS = 3
+BATCH_SIZE = 500
+
+
+def classify(previous_fullness, fullness):
+    """RESTOCK, DEPLETION or None for a report following one with `previous_fullness`"""
+    if previous_fullness is None or fullness is None:
+        return None
+    if fullness > previous_fullness + RESTOCK_RISE:
+        return RESTOCK
+    if previous_fullness > fullness + DEPLETION_DROP:
+        return DEPLETION
+    return None
+
+
+def elapsed_hours(previous_time, time):
+    return (_epoch_microseconds(time) - _epoch_microseconds(previous_time)) / 10 ** 6 / 3600
+
+
+def _event_row(previous, report):
+    kind = classify(previous.pantry_fullness, report.pantry_fullness)
+    if kind is None:
+        return None
+    return {'report_id': report.id, 'location_id': report.location_id, 'kind': kind, 'time': report.time,
+            'from_fullness': previous.pantry_fullness, 'to_fullness': report.pantry_fullness,
+            'elapsed_hours': elapsed_hours(previous.time, report.time)}
+
+
+def _reports():
+    table = Report.__table__
+    return table, select(table.c.id, table.c.location_id, table.c.time, table.c.pantry_fullness)
+
+
+def _neighbour(connection, report, before):
+    """The report just before (or after) `report` at its location, in (time, id) order"""
+    table, query = _reports()
+    if before:
+        query = query.where(or_(table.c.time < report.time, and_(table.c.time == report.time, table.c.id < report.id)))\
+                     .order_by(table.c.time.desc(), table.c.id.desc())
+    else:
+        query = query.where(or_(table.c.time > report.time, and_(table.c.time == report.time, table.c.id > report.id)))\
+                     .order_by(table.c.time, table.c.id)
+    return connection.execute(query.where(table.c.location_id == report.location_id).limit(1)).first()
+
+
+def _derive(connection, report):
+    """Replace the event of `report` with the one its previous report gives"""
+    table = PantryEvent.__table__
+    connection.execute(table.delete().where(table.c.report_id == report.id))
+    previous = _neighbour(connection, report, before=True)
+    row = _event_row(previous, report) if previous is not None else None
+    if row is not None:
+        connection.execute(table.insert(), [row])
+
+
+def rederive_location(connection, location_id):
+    """Recompute every event of one pantry from its reports"""
+    table = PantryEvent.__table__
+    connection.execute(table.delete().where(table.c.location_id == location_id))
+    reports_table, query = _reports()
+    reports = connection.execute(query.where(reports_table.c.location_id == location_id)
+                                      .order_by(reports_table.c.time, reports_table.c.id)).all()
+    rows = [row for row in (_event_row(previous, report) for previous, report in zip(reports, reports[1:]))
+            if row is not None]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, target):
+    if target.location_id is None or target.time is None:
+        return
+    _derive(connection, target)
+    # A back-dated report sits between two others: the next one now follows it
+    following = _neighbour(connection, target, before=False)
+    if following is not None:
+        _derive(connection, following)
+
+
+@event.listens_for(Report, 'after_update')
+def report_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('pantry_fullness', 'time', 'location_id')):
+        for location_id in set((state.attrs.location_id.history.deleted or []) + [target.location_id]):
+            if location_id is not None:
+                rederive_location(connection, location_id)
+
+
+@event.listens_for(Report, 'after_delete')
+def report_deleted(mapper, connection, target):
+    table = PantryEvent.__table__
+    connection.execute(table.delete().where(table.c.report_id == target.id))
+    if target.location_id is None or target.time is None:
+        return
+    following = _neighbour(connection, target, before=False)
+    if following is not None:
+        _derive(connection, following)
+
+
+@event.listens_for(Location, 'after_delete')
+def location_deleted(mapper, connection, target):
+    table = PantryEvent.__table__
+    connection.execute(table.delete().where(table.c.location_id == target.id))
+
+
+def restocking(location_id, days):
+    """The restocking section of the pantry analytics, from the pantry's events over `days` days of history"""
+    query = db.session.query(PantryEvent).filter(PantryEvent.location_id == location_id)
+    counts = dict(query.with_entities(PantryEvent.kind, func.count(PantryEvent.id)).group_by(PantryEvent.kind))
+
+    def quick(kind, hours):
+        total, count = query.with_entities(func.sum(PantryEvent.elapsed_hours), func.count(PantryEvent.id))\
+                            .filter(PantryEvent.kind == kind, PantryEvent.elapsed_hours < hours).one()
+        return round(total / count, 1) if count else None
+
+    recent = query.filter(PantryEvent.kind == RESTOCK)\
+                  .order_by(PantryEvent.time.desc(), PantryEvent.report_id.desc())\
+                  .limit(RECENT_RESTOCKS).all()
+    restocks = counts.get(RESTOCK, 0)
+    return {
+        'total_restocking_events': restocks,
+        'total_depletion_events': counts.get(DEPLETION, 0),
+        'average_restock_time_hours': quick(RESTOCK, QUICK_RESTOCK_HOURS),
+        'average_depletion_time_hours': quick(DEPLETION, QUICK_DEPLETION_HOURS),
+        'recent_restocking_events': [{
+            'time': restock.time,
+            'from_fullness': restock.from_fullness,
+            'to_fullness': restock.to_fullness,
+            'time_since_last': restock.elapsed_hours,
+        } for restock in reversed(recent)],
+        'restocking_frequency_per_week': round(restocks / max(1, days / 7), 1),
+    }
+
+
+def backfill_pantry_events(batch_size=BATCH_SIZE):
+    """Derive every pantry's events from its report history with LAG(); returns the number of events"""
+    table, _ = _reports()
+    window = {'partition_by': table.c.location_id, 'order_by': (table.c.time, table.c.id)}
+    lagged = select(table.c.id, table.c.location_id, table.c.time, table.c.pantry_fullness,
+                    func.lag(table.c.pantry_fullness).over(**window).label('previous_fullness'),
+                    func.lag(table.c.time, type_=UTCDateTime()).over(**window).label('previous_time'))\
+        .where(table.c.location_id.isnot(None), table.c.time.isnot(None))\
+        .subquery()
+    changes = db.session.execute(
+        select(lagged).where(or_(lagged.c.pantry_fullness > lagged.c.previous_fullness + RESTOCK_RISE,
+                                 lagged.c.previous_fullness > lagged.c.pantry_fullness + DEPLETION_DROP))
+                      .order_by(lagged.c.location_id, lagged.c.time, lagged.c.id)
+    ).all()
+
+    events = PantryEvent.__table__
+    db.session.execute(events.delete())
+    rows = [{'report_id': change.id, 'location_id': change.location_id,
+             'kind': classify(change.previous_fullness, change.pantry_fullness), 'time': change.time,
+             'from_fullness': change.previous_fullness, 'to_fullness': change.pantry_fullness,
+             'elapsed_hours': elapsed_hours(change.previous_time, change.time)} for change in changes]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(events.insert(), rows[start:start + batch_size])
+    db.session.commit()
+    return len(rows)
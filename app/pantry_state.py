@@ -0,0 +1,395 @@
+"""
+Persisted per-pantry analytics state
+
+location_analytics_state keeps, per location, everything the pantry analytics
+need as running values: fullness sums and extremes, weekday/hour/month
+accumulators (in the order first seen, which decides ties), the last five known
+fullness values, the last 30 reports for the chart, distribution buckets and
+per-reporter counts. Apart from the reporter counts its size does not grow
+with the number of reports. The restocking section is read from pantry_event
+(see pantry_events.py).
+
+A report inserted after the pantry's latest one (the usual case: views.report
+stamps it with the current time) is folded into the state on the flush
+connection, without reading the history, with the state row locked. Anything
+else (back-dated inserts, edits, deletes) drops the state, and the next read
+rebuilds it from the reports; the rebuild is only stored if the row is still
+the one that was read (same report_count and last_report_id).
+analytics_from_state() gives the same result as report_engine.pantry_analytics()
+over the full history; `flask check-analytics-state` compares the two for every
+pantry.
+"""
+import calendar
+import json
+import math
+from datetime import timedelta
+from sqlalchemy import event, func, inspect, select
+from . import db
+from .models import Location, Report, LocationAnalyticsState
+from .db_helpers import upsert, insert_if_absent
+from .report_engine import (ReportColumns, pantry_analytics, _epoch_microseconds, _parse_analysis,
+                            EPOCH, MICROSECONDS_PER_DAY, MICROSECONDS_PER_HOUR, DISTRIBUTION)
+from .pantry_events import restocking
+
+RECENT_KNOWN = 5
+CHART_REPORTS = 30
+# Averages are rounded to one decimal, so adding up in another order can move one by 0.1
+CHECK_TOLERANCE = 0.1
+# Bumped when the layout changes; stored states of another version are rebuilt
+STATE_VERSION = 2
+
+
+def new_state():
+    return {
+        'version': STATE_VERSION,
+        'count': 0, 'first': None, 'last': None, 'last_id': 0,
+        'fullness_sum': 0, 'fullness_count': 0, 'minimum': None, 'maximum': None,
+        'current': None, 'previous': None, 'recent_known': [],
+        # [weekday, reports, fullness sum, fullness count], [hour, sum, count], [month, sum, count]
+        'days': [], 'hours': [], 'months': [],
+        'empty': 0, 'critical': 0,
+        'ai_reports': 0, 'ai_sum': 0, 'ai_count': 0,
+        # [epoch microseconds, fullness, AI estimate, has analysis]
+        'chart': [],
+        'distribution': [0] * len(DISTRIBUTION),
+        'users': {}, 'anonymous': 0,
+    }
+
+
+def _entry(entries, key, empty):
+    for entry in entries:
+        if entry[0] == key:
+            return entry
+    entries.append([key, *empty])
+    return entries[-1]
+
+
+def apply_report(state, report_id, micros, fullness, has_analysis, estimate, user_id):
+    """Fold the pantry's newest report into `state`"""
+    known = fullness is not None
+
+    state['count'] += 1
+    state['first'] = micros if state['first'] is None else state['first']
+    state['last'], state['last_id'] = micros, report_id
+    state['previous'], state['current'] = state['current'], fullness
+
+    day = (micros // MICROSECONDS_PER_DAY + 3) % 7  # 1970-01-01 was a Thursday
+    hour = (micros % MICROSECONDS_PER_DAY) // MICROSECONDS_PER_HOUR
+    month = (EPOCH + timedelta(microseconds=micros)).month
+    day_entry = _entry(state['days'], day, (0, 0, 0))
+    day_entry[1] += 1
+    hour_entry = _entry(state['hours'], hour, (0, 0))
+    month_entry = _entry(state['months'], month, (0, 0))
+
+    if known:
+        state['fullness_sum'] += fullness
+        state['fullness_count'] += 1
+        state['minimum'] = fullness if state['minimum'] is None else min(state['minimum'], fullness)
+        state['maximum'] = fullness if state['maximum'] is None else max(state['maximum'], fullness)
+        state['recent_known'] = (state['recent_known'] + [fullness])[-RECENT_KNOWN:]
+        day_entry[2] += fullness
+        day_entry[3] += 1
+        hour_entry[1] += fullness
+        hour_entry[2] += 1
+        month_entry[1] += fullness
+        month_entry[2] += 1
+        state['empty'] += fullness <= 33
+        state['critical'] += fullness <= 10
+        state['distribution'][sum(upper < fullness for _, upper in DISTRIBUTION[:-1])] += 1
+
+    if has_analysis:
+        state['ai_reports'] += 1
+        if isinstance(estimate, (int, float)):
+            state['ai_sum'] += estimate
+            state['ai_count'] += 1
+    state['chart'] = (state['chart'] + [[micros, fullness, estimate, has_analysis]])[-CHART_REPORTS:]
+
+    if user_id:
+        state['users'][str(user_id)] = state['users'].get(str(user_id), 0) + 1
+    else:
+        state['anonymous'] += 1
+    return state
+
+
+def state_from_columns(columns):
+    state = new_state()
+    for i in range(len(columns)):
+        fullness = None if math.isnan(columns.fullness[i]) else int(columns.fullness[i])
+        apply_report(state, int(columns.ids[i]), int(columns.micros[i]), fullness, bool(columns.has_analysis[i]),
+                     columns.ai_estimates[i], int(columns.user_ids[i]))
+    return state
+
+
+def _time(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _days(state):
+    return (_time(state['last']) - _time(state['first'])).days + 1
+
+
+def _fullness_stats(location_id, state, common_items):
+    return {
+        'average': round(state['fullness_sum'] / state['fullness_count'], 1),
+        'minimum': state['minimum'],
+        'maximum': state['maximum'],
+        'current': state['current'],
+        'previous': state['previous'],
+    }
+
+
+def _trends(location_id, state, common_items):
+    recent = state['recent_known']
+    older_count = state['fullness_count'] - len(recent)
+    recent_average = sum(recent) / len(recent) if recent else 0
+
+    if len(recent) >= 2:
+        direction = "stable"
+        older_average = (state['fullness_sum'] - sum(recent)) / older_count if older_count > 0 else recent_average
+        difference = recent_average - older_average
+        if difference > 10:
+            direction = "improving"
+        elif difference < -10:
+            direction = "declining"
+    else:
+        direction = "insufficient_data"
+
+    current, previous = state['current'], state['previous']
+    return {
+        'direction': direction,
+        'recent_average': round(recent_average, 1) if recent else 0,
+        'change_from_previous': current - previous if previous and current is not None else 0,
+    }
+
+
+def _patterns(location_id, state, common_items):
+    count = state['count']
+    day_counts = [(calendar.day_name[day], reports) for day, reports, _, _ in state['days']]
+    hours = [(hour, total / known) for hour, total, known in state['hours'] if known]
+    months = [(calendar.month_name[month], total, known) for month, total, known in state['months']]
+    return {
+        'most_active_day': max(day_counts, key=lambda day: day[1])[0] if day_counts else None,
+        'least_active_day': min(day_counts, key=lambda day: day[1])[0] if day_counts else None,
+        'empty_periods': state['empty'],
+        'critical_periods': state['critical'],
+        'empty_percentage': round((state['empty'] / count) * 100, 1),
+        'day_averages': {calendar.day_name[day]: round(total / known, 1)
+                         for day, _, total, known in state['days'] if known},
+        'peak_depletion_hours': [f"{hour:02d}:00 ({average:.1f}% avg)"
+                                 for hour, average in sorted(hours, key=lambda hour: hour[1])[:3]],
+        'month_averages': {month: round(total / known, 1) for month, total, known in months if known},
+        'busiest_months': sorted(((month, known) for month, _, known in months),
+                                 key=lambda month: month[1], reverse=True)[:3],
+    }
+
+
+def _ai_insights(location_id, state, common_items):
+    if not state['ai_reports']:
+        return {}
+    return {
+        'total_ai_reports': state['ai_reports'],
+        'most_common_items': common_items,
+        'average_ai_fullness': round(state['ai_sum'] / state['ai_count'], 1) if state['ai_count'] else None,
+        'ai_coverage_percentage': round((state['ai_reports'] / state['count']) * 100, 1),
+    }
+
+
+def _chart_data(location_id, state, common_items):
+    chart = [(_time(micros), fullness, estimate, analyzed) for micros, fullness, estimate, analyzed in state['chart']]
+    points = [{
+        'timestamp': time.isoformat(),
+        'date': time.strftime('%Y-%m-%d'),
+        'datetime': time.strftime('%Y-%m-%d %H:%M'),
+        'fullness': fullness,
+        'ai_fullness': estimate,
+    } for time, fullness, estimate, _ in chart]
+    return {
+        'data_points': points,
+        'dates': [point['date'] for point in points],
+        'timestamps': [point['timestamp'] for point in points],
+        'fullness_values': [fullness for _, fullness, _, _ in chart],
+        'ai_fullness_values': [estimate or 0 for _, _, estimate, analyzed in chart if analyzed],
+        'report_count_by_month': {},
+        'fullness_distribution': {name: total for (name, _), total in zip(DISTRIBUTION, state['distribution'])},
+    }
+
+
+def _engagement(location_id, state, common_items):
+    reporters = len(state['users'])
+    return {
+        'unique_reporters': reporters,
+        'anonymous_reports': state['anonymous'],
+        'average_reports_per_user': round(state['count'] / max(1, reporters), 1),
+        'most_active_reporter': max(state['users'].values()) if reporters else 0,
+        'engagement_rate': round((reporters / max(1, _days(state))) * 7, 2),
+    }
+
+
+def _restocking(location_id, state, common_items):
+    return restocking(location_id, _days(state))
+
+
+# Section name -> provider(location_id, state, common_items); only the requested ones run
+SECTIONS = {
+    'fullness_stats': _fullness_stats,
+    'trends': _trends,
+    'patterns': _patterns,
+    'ai_insights': _ai_insights,
+    'chart_data': _chart_data,
+    'engagement': _engagement,
+    'restocking': _restocking,
+}
+
+
+def analytics_from_state(location_id, state, common_items, sections=None):
+    """
+    The pantry_analytics() result for the reports of `location_id` folded into
+    `state` (at least two); with `sections`, only those sections (plus
+    total_reports and date_range). common_items is only read by ai_insights.
+    """
+    analytics = {
+        'total_reports': state['count'],
+        'date_range': {'start': _time(state['first']), 'end': _time(state['last']), 'days': _days(state)},
+    }
+    for name, provider in SECTIONS.items():
+        if sections is None or name in sections:
+            analytics[name] = provider(location_id, state, common_items)
+    return analytics
+
+
+def _row_values(state):
+    return {'state': json.dumps(state), 'report_count': state['count'],
+            'last_report_time': _time(state['last']) if state['last'] is not None else None,
+            'last_report_id': state['last_id']}
+
+
+def _save(connection, location_id, state):
+    values = _row_values(state)
+    upsert(connection, LocationAnalyticsState.__table__, {'location_id': location_id}, values,
+           lambda current, new: {column: new[column] for column in values})
+
+
+def _save_if_unchanged(connection, location_id, state, read):
+    """
+    Store a rebuilt state unless the row changed since it was `read` (None: there
+    was none), so a rebuild never overwrites a report folded in meanwhile
+    """
+    table = LocationAnalyticsState.__table__
+    values = _row_values(state)
+    if read is None:
+        insert_if_absent(connection, table, {'location_id': location_id, **values})
+        return
+    connection.execute(table.update().where(table.c.location_id == location_id,
+                                            table.c.report_count == read.report_count,
+                                            table.c.last_report_id == read.last_report_id).values(**values))
+
+
+def _drop(connection, location_id):
+    table = LocationAnalyticsState.__table__
+    connection.execute(table.delete().where(table.c.location_id == location_id))
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, target):
+    if target.location_id is None or target.time is None:
+        return
+    table = LocationAnalyticsState.__table__
+    # Locked, so concurrent reports for the same pantry are folded in one after the other
+    row = connection.execute(select(table.c.state).where(table.c.location_id == target.location_id)
+                             .with_for_update()).first()
+    if row is None:
+        return  # Built on the next read
+    state = json.loads(row.state)
+    micros = _epoch_microseconds(target.time)
+    if state.get('version') != STATE_VERSION or (state['last'] is not None and micros < state['last']):
+        _drop(connection, target.location_id)  # Outdated or back-dated: rebuilt on the next read
+        return
+    analysis, estimate = _parse_analysis(target.vision_analysis)
+    _save(connection, target.location_id, apply_report(state, target.id, micros, target.pantry_fullness,
+                                                       analysis is not None, estimate, target.user_id))
+
+
+@event.listens_for(Report, 'after_update')
+def report_updated(mapper, connection, target):
+    state = inspect(target)
+    watched = ('location_id', 'time', 'pantry_fullness', 'vision_analysis', 'user_id')
+    if any(state.attrs[name].history.has_changes() for name in watched):
+        for location_id in set((state.attrs.location_id.history.deleted or []) + [target.location_id]):
+            if location_id is not None:
+                _drop(connection, location_id)
+
+
+@event.listens_for(Report, 'after_delete')
+def report_deleted(mapper, connection, target):
+    if target.location_id is not None:
+        _drop(connection, target.location_id)
+
+
+@event.listens_for(Location, 'after_delete')
+def location_deleted(mapper, connection, target):
+    _drop(connection, target.id)
+
+
+def load_state(location_id):
+    """
+    The pantry's state, rebuilt from its reports when there is none, it is of
+    another STATE_VERSION or it does not cover as many reports as the pantry has
+    (e.g. reports written with Core)
+    """
+    row = LocationAnalyticsState.query.get(location_id)
+    if row is not None and row.report_count == db.session.query(func.count(Report.id))\
+                                                          .filter(Report.location_id == location_id).scalar():
+        state = json.loads(row.state)
+        if state.get('version') == STATE_VERSION:
+            return state
+
+    state = state_from_columns(ReportColumns.load(Report.location_id == location_id))
+    # Own transaction, so a page view does not commit (and expire) the request's session
+    with db.engine.begin() as connection:
+        _save_if_unchanged(connection, location_id, state, row)
+    return state
+
+
+def location_analytics(location_id, common_items, sections=None):
+    """Pantry analytics (or only `sections` of them) from the persisted state; None with fewer than two reports"""
+    state = load_state(location_id)
+    if state['count'] < 2:
+        return None
+    return analytics_from_state(location_id, state, common_items, sections)
+
+
+def rebuild_states():
+    """Recompute every pantry's state from its reports; returns the number of pantries"""
+    db.session.execute(LocationAnalyticsState.__table__.delete())
+    location_ids = [location_id for (location_id,) in db.session.query(Location.id).order_by(Location.id)]
+    for location_id in location_ids:
+        _save(db.session.connection(), location_id,
+              state_from_columns(ReportColumns.load(Report.location_id == location_id)))
+    db.session.commit()
+    return len(location_ids)
+
+
+def _close(stored, recomputed):
+    """Equal analytics, allowing CHECK_TOLERANCE on floats"""
+    if isinstance(stored, float) or isinstance(recomputed, float):
+        return isinstance(stored, (int, float)) and isinstance(recomputed, (int, float)) \
+            and math.isclose(stored, recomputed, abs_tol=CHECK_TOLERANCE + 1e-9)
+    if isinstance(stored, dict) and isinstance(recomputed, dict):
+        return stored.keys() == recomputed.keys() and all(_close(stored[key], recomputed[key]) for key in stored)
+    if isinstance(stored, (list, tuple)) and isinstance(recomputed, (list, tuple)):
+        return len(stored) == len(recomputed) and all(map(_close, stored, recomputed))
+    return stored == recomputed
+
+
+def check_states(common_items=()):
+    """Location ids whose stored state disagrees with a full recomputation (floats within CHECK_TOLERANCE)"""
+    mismatched = []
+    for row in LocationAnalyticsState.query.order_by(LocationAnalyticsState.location_id):
+        state = json.loads(row.state)
+        columns = ReportColumns.load(Report.location_id == row.location_id)
+        if state.get('version') != STATE_VERSION or len(columns) != state['count']:
+            mismatched.append(row.location_id)
+        elif len(columns) >= 2 and not _close(analytics_from_state(row.location_id, state, list(common_items)),
+                                              pantry_analytics(columns, list(common_items))):
+            mismatched.append(row.location_id)
+    return mismatched
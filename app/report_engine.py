@@ -0,0 +1,312 @@
+"""
+Columnar report analytics
+
+ReportColumns loads a slice of report history with one query into contiguous
+NumPy arrays (location id, epoch time, fullness, AI fullness estimate, user id),
+oldest first. The section functions below compute the per-pantry analytics from
+those arrays with vectorized operations instead of walking ORM objects.
+
+The arrays keep report order, so "first seen" orderings of the old Python loops
+(most active day, day and month averages) are reproduced exactly. Only the
+handful of values that are displayed as-is (the original timestamps and raw AI
+estimates) are kept as Python lists. Food items come from the report_food_item
+index (see food_items.py).
+
+Reports without a fullness value are ignored by the fullness statistics.
+"""
+import calendar
+import json
+from datetime import datetime, timezone
+import numpy as np
+from . import db
+from .models import Report
+from .db_helpers import as_utc
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECONDS_PER_HOUR = 3600 * 10 ** 6
+MICROSECONDS_PER_DAY = 24 * MICROSECONDS_PER_HOUR
+
+RESTOCK_RISE = 30
+DEPLETION_DROP = 20
+# Only restocks within a week and depletions within three days count towards the average times
+QUICK_RESTOCK_HOURS = 24 * 7
+QUICK_DEPLETION_HOURS = 24 * 3
+# (bucket, highest fullness in it) for chart_data.fullness_distribution
+DISTRIBUTION = [('empty', 10), ('low', 33), ('medium', 66), ('high', 90), ('full', 100)]
+
+
+def _epoch_microseconds(value):
+    return (as_utc(value) - EPOCH) // np.timedelta64(1, 'us').item()
+
+
+def _parse_analysis(raw):
+    """(analysis dict or None, AI fullness estimate) like the Report helpers"""
+    if not raw:
+        return None, None
+    try:
+        analysis = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return None, None
+    if not analysis:
+        return None, None
+    return analysis, analysis.get('fullness_estimate')
+
+
+def _fullness(value):
+    """A stored fullness (an integer column) back from the float arrays"""
+    return int(value)
+
+
+class ReportColumns:
+    """A report history as parallel arrays, oldest first"""
+
+    def __init__(self, rows):
+        count = len(rows)
+        self.ids = np.empty(count, dtype=np.int64)
+        self.location_ids = np.zeros(count, dtype=np.int64)
+        self.micros = np.empty(count, dtype=np.int64)
+        self.fullness = np.full(count, np.nan)
+        self.ai_fullness = np.full(count, np.nan)
+        self.user_ids = np.zeros(count, dtype=np.int64)  # 0 = anonymous
+        self.has_analysis = np.zeros(count, dtype=bool)
+        # Shown as stored
+        self.times = []
+        self.ai_estimates = []
+
+        for i, (report_id, location_id, time, fullness, vision_analysis, user_id) in enumerate(rows):
+            self.ids[i] = report_id
+            self.location_ids[i] = location_id or 0
+            self.micros[i] = _epoch_microseconds(time)
+            if fullness is not None:
+                self.fullness[i] = fullness
+            if user_id:
+                self.user_ids[i] = user_id
+            analysis, estimate = _parse_analysis(vision_analysis)
+            self.has_analysis[i] = analysis is not None
+            if isinstance(estimate, (int, float)):
+                self.ai_fullness[i] = estimate
+            self.times.append(time)
+            self.ai_estimates.append(estimate)
+
+    @classmethod
+    def load(cls, *criteria):
+        """Reports matching `criteria`, in one query ordered by time"""
+        rows = db.session.query(Report.id, Report.location_id, Report.time, Report.pantry_fullness,
+                                Report.vision_analysis, Report.user_id)\
+                         .filter(Report.time.isnot(None), *criteria)\
+                         .order_by(Report.time, Report.id)\
+                         .all()
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def epoch_seconds(self):
+        return self.micros / 10 ** 6
+
+    def weekdays(self):
+        """Monday = 0, as datetime.weekday()"""
+        return (self.micros // MICROSECONDS_PER_DAY + 3) % 7  # 1970-01-01 was a Thursday
+
+    def hours(self):
+        return (self.micros % MICROSECONDS_PER_DAY) // MICROSECONDS_PER_HOUR
+
+    def months(self):
+        """1-12"""
+        return self.micros.astype('datetime64[us]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+    def date_range(self):
+        start, end = self.times[0], self.times[-1]
+        return {'start': start, 'end': end, 'days': (end - start).days + 1}
+
+
+def _grouped_by_first_seen(keys, values):
+    """[(key, values of that key)] in the order keys first appear"""
+    unique, first = np.unique(keys, return_index=True)
+    order = np.argsort(first, kind='stable')
+    return [(unique[i].item(), values[keys == unique[i]]) for i in order]
+
+
+def _mean(values):
+    return values.sum() / len(values)
+
+
+def average_hours(total_microseconds, count):
+    """Mean of `count` gaps summing to `total_microseconds`, in hours to one decimal (None without gaps)"""
+    return round(total_microseconds / count / 10 ** 6 / 3600, 1) if count else None
+
+
+def fullness_stats(columns):
+    known = columns.fullness[~np.isnan(columns.fullness)]
+    current, previous = columns.fullness[-1], columns.fullness[-2] if len(columns) > 1 else np.nan
+    return {
+        'average': round(float(_mean(known)), 1),
+        'minimum': _fullness(known.min()),
+        'maximum': _fullness(known.max()),
+        'current': None if np.isnan(current) else _fullness(current),
+        'previous': None if np.isnan(previous) else _fullness(previous),
+    }
+
+
+def trends(columns, stats):
+    known = columns.fullness[~np.isnan(columns.fullness)]
+    recent = known[-5:]
+    if len(recent) >= 2:
+        direction = "stable"
+        recent_average = _mean(recent)
+        older_average = known[:-5].sum() / max(1, len(known[:-5])) if len(known) > 5 else recent_average
+        difference = recent_average - older_average
+        if difference > 10:
+            direction = "improving"
+        elif difference < -10:
+            direction = "declining"
+    else:
+        direction = "insufficient_data"
+
+    change = 0
+    if stats['previous'] and stats['current'] is not None:
+        change = stats['current'] - stats['previous']
+    return {
+        'direction': direction,
+        'recent_average': round(float(_mean(recent)), 1) if len(recent) else 0,
+        'change_from_previous': change,
+    }
+
+
+def patterns(columns):
+    fullness = columns.fullness
+    known = ~np.isnan(fullness)
+    days = _grouped_by_first_seen(columns.weekdays(), fullness)
+    counts = [(calendar.day_name[day], len(values)) for day, values in days]
+    empty = int(np.count_nonzero(fullness[known] <= 33))
+    critical = int(np.count_nonzero(fullness[known] <= 10))
+
+    hours = [(hour, _mean(values[~np.isnan(values)])) for hour, values in _grouped_by_first_seen(columns.hours(), fullness)
+             if np.any(~np.isnan(values))]
+    months = [(calendar.month_name[month], values[~np.isnan(values)])
+              for month, values in _grouped_by_first_seen(columns.months(), fullness)]
+    peak_hours = sorted(hours, key=lambda hour: hour[1])[:3]
+
+    return {
+        'most_active_day': max(counts, key=lambda day: day[1])[0] if counts else None,
+        'least_active_day': min(counts, key=lambda day: day[1])[0] if counts else None,
+        'empty_periods': empty,
+        'critical_periods': critical,
+        'empty_percentage': round((empty / len(columns)) * 100, 1),
+        'day_averages': {calendar.day_name[day]: round(float(_mean(values[~np.isnan(values)])), 1)
+                         for day, values in days if np.any(~np.isnan(values))},
+        'peak_depletion_hours': [f"{hour:02d}:00 ({average:.1f}% avg)" for hour, average in peak_hours],
+        'month_averages': {month: round(float(_mean(values)), 1) for month, values in months if len(values)},
+        'busiest_months': sorted(((month, len(values)) for month, values in months),
+                                 key=lambda month: month[1], reverse=True)[:3],
+    }
+
+
+def ai_insights(columns, common_items):
+    """`common_items` are the pantry's most common food items, from the food item index"""
+    analyzed = np.flatnonzero(columns.has_analysis)
+    if not len(analyzed):
+        return {}
+    estimates = columns.ai_fullness[analyzed]
+    estimates = estimates[~np.isnan(estimates)]
+    return {
+        'total_ai_reports': len(analyzed),
+        'most_common_items': common_items,
+        # Summed in report order, like the persisted state (see pantry_state.py)
+        'average_ai_fullness': round(sum(estimates.tolist()) / len(estimates), 1) if len(estimates) else None,
+        'ai_coverage_percentage': round((len(analyzed) / len(columns)) * 100, 1),
+    }
+
+
+def chart_data(columns, recent=30):
+    """The last `recent` reports as chart points, and the fullness distribution of all of them"""
+    start = max(0, len(columns) - recent)
+    points, dates, timestamps, values, ai_values = [], [], [], [], []
+    for i in range(start, len(columns)):
+        time = columns.times[i]
+        fullness = None if np.isnan(columns.fullness[i]) else _fullness(columns.fullness[i])
+        points.append({
+            'timestamp': time.isoformat(),
+            'date': time.strftime('%Y-%m-%d'),
+            'datetime': time.strftime('%Y-%m-%d %H:%M'),
+            'fullness': fullness,
+            'ai_fullness': columns.ai_estimates[i],
+        })
+        dates.append(points[-1]['date'])
+        timestamps.append(points[-1]['timestamp'])
+        values.append(fullness)
+        if columns.has_analysis[i]:
+            ai_values.append(columns.ai_estimates[i] or 0)
+
+    known = columns.fullness[~np.isnan(columns.fullness)]
+    edges = [upper for _, upper in DISTRIBUTION[:-1]]
+    counts = np.bincount(np.searchsorted(edges, known, side='left'), minlength=len(DISTRIBUTION))
+    return {
+        'data_points': points,
+        'dates': dates,
+        'timestamps': timestamps,
+        'fullness_values': values,
+        'ai_fullness_values': ai_values,
+        'report_count_by_month': {},
+        'fullness_distribution': {name: int(count) for (name, _), count in zip(DISTRIBUTION, counts)},
+    }
+
+
+def engagement(columns, days):
+    identified = columns.user_ids[columns.user_ids != 0]
+    per_user = np.unique(identified, return_counts=True)[1]
+    reporters = len(per_user)
+    return {
+        'unique_reporters': reporters,
+        'anonymous_reports': len(columns) - len(identified),
+        'average_reports_per_user': round(len(columns) / max(1, reporters), 1),
+        'most_active_reporter': int(per_user.max()) if reporters else 0,
+        'engagement_rate': round((reporters / max(1, days)) * 7, 2),
+    }
+
+
+def restocking(columns, days):
+    """Restocks (fullness up by more than 30) and depletions (down by more than 20) between consecutive reports"""
+    previous, current = columns.fullness[:-1], columns.fullness[1:]
+    gaps = np.diff(columns.micros)
+    hours = gaps / 10 ** 6 / 3600
+    restocked = current > previous + RESTOCK_RISE
+    depleted = ~restocked & (previous > current + DEPLETION_DROP)
+
+    quick_restocks = gaps[restocked & (hours < QUICK_RESTOCK_HOURS)]
+    quick_depletions = gaps[depleted & (hours < QUICK_DEPLETION_HOURS)]
+
+    recent = [{
+        'time': columns.times[i + 1],
+        'from_fullness': _fullness(previous[i]),
+        'to_fullness': _fullness(current[i]),
+        'time_since_last': float(hours[i]),
+    } for i in np.flatnonzero(restocked)[-3:]]
+
+    restock_count = int(np.count_nonzero(restocked))
+    return {
+        'total_restocking_events': restock_count,
+        'total_depletion_events': int(np.count_nonzero(depleted)),
+        'average_restock_time_hours': average_hours(int(quick_restocks.sum()), len(quick_restocks)),
+        'average_depletion_time_hours': average_hours(int(quick_depletions.sum()), len(quick_depletions)),
+        'recent_restocking_events': recent,
+        'restocking_frequency_per_week': round(restock_count / max(1, days / 7), 1),
+    }
+
+
+def pantry_analytics(columns, common_items):
+    """Every per-pantry section, computed from one location's columns (at least two reports)"""
+    date_range = columns.date_range()
+    stats = fullness_stats(columns)
+    return {
+        'total_reports': len(columns),
+        'date_range': date_range,
+        'fullness_stats': stats,
+        'trends': trends(columns, stats),
+        'patterns': patterns(columns),
+        'ai_insights': ai_insights(columns, common_items),
+        'chart_data': chart_data(columns),
+        'engagement': engagement(columns, date_range['days']),
+        'restocking': restocking(columns, date_range['days']),
+    }
@@ -0,0 +1,379 @@
+"""
+Daily report rollups
+
+report_daily_rollup holds one row per location and UTC day with the report
+count, fullness sum/count/min/max, empty and full counts, the latest report's
+fullness, the number of reports with an AI analysis and the sum/count of their
+AI fullness estimates. Inserting a Report merges it into its row with a single
+upsert on the flush connection, so the rollup commits with the report. Edits and
+deletes, which are rare, recompute the affected days from the reports; the AI
+estimates live in the vision_analysis JSON, so that part is parsed in Python.
+
+Anything coarser than a single report (per-day charts, weekly/monthly/yearly
+trends, per-location totals) reads these rows instead of scanning reports.
+
+location_latest_report keeps each location's most recent report the same way,
+for pages that list every pantry with its current status.
+
+state_summary holds per state the number of locations, active locations and
+reports, and the fullness sum/count and status buckets of each active location's
+latest report. A new report adjusts its state's row by the difference it makes;
+location writes and report edits/deletes recompute the states they touch.
+
+`flask rebuild-rollups` recomputes all three tables from the full history.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from sqlalchemy import event, func, case, and_, cast, Date, select, inspect, bindparam
+from . import db
+from .models import Location, Report, ReportDailyRollup, LocationLatestReport, StateSummary
+from .map_data import latest_report_subquery
+from .db_helpers import upsert, insert_if_absent, as_utc
+from .report_engine import _parse_analysis
+
+# Status buckets used by the analytics (stricter than the map's colors)
+EMPTY_MAX = 33
+LOW_MAX = 66
+
+ROLLUP_COLUMNS = ['location_id', 'day', 'report_count', 'fullness_sum', 'fullness_count',
+                  'fullness_min', 'fullness_max', 'empty_count', 'full_count', 'last_fullness',
+                  'first_report_time', 'last_report_time', 'ai_report_count']
+STATE_COLUMNS = ['location_count', 'active_location_count', 'report_count', 'fullness_sum', 'fullness_count',
+                 'empty_count', 'low_count', 'full_count']
+
+
+def utc_date(column, dialect):
+    """SQL expression for the UTC calendar day of a timestamp column"""
+    if dialect == 'postgresql':
+        return cast(func.timezone('UTC', column), Date)
+    # SQLite stores UTC wall-clock strings
+    return func.date(column)
+
+
+def day_start(day):
+    """Aware UTC datetime at midnight starting `day`"""
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _when(condition, value):
+    return case((condition, value))
+
+
+def _rollup_select(dialect, *criteria):
+    """INSERT-ready SELECT aggregating the reports matching `criteria` into rollup rows"""
+    day = utc_date(Report.time, dialect)
+    ranked = select(
+        Report.location_id,
+        day.label('day'),
+        Report.pantry_fullness.label('fullness'),
+        Report.time,
+        case((and_(Report.vision_analysis.isnot(None), Report.vision_analysis != ''), 1), else_=0).label('ai'),
+        func.row_number().over(partition_by=(Report.location_id, day),
+                               order_by=(Report.time.desc(), Report.id.desc())).label('position'),
+    ).where(Report.location_id.isnot(None), *criteria).subquery('ranked')
+
+    fullness = ranked.c.fullness
+    return select(
+        ranked.c.location_id,
+        ranked.c.day,
+        func.count(),
+        func.coalesce(func.sum(fullness), 0),
+        func.count(fullness),
+        func.min(fullness),
+        func.max(fullness),
+        func.count(_when(fullness <= EMPTY_MAX, 1)),
+        func.count(_when(fullness > LOW_MAX, 1)),
+        func.max(_when(ranked.c.position == 1, fullness)),
+        func.min(ranked.c.time),
+        func.max(ranked.c.time),
+        func.sum(ranked.c.ai),
+    ).group_by(ranked.c.location_id, ranked.c.day)
+
+
+def ai_estimate(vision_analysis):
+    """A report's numeric AI fullness estimate, None without one"""
+    _, estimate = _parse_analysis(vision_analysis)
+    return estimate if isinstance(estimate, (int, float)) else None
+
+
+def _fill_ai_fullness(connection, *criteria):
+    """Set the AI estimate sums of the rollup rows of the reports matching `criteria`"""
+    sums = defaultdict(lambda: [0, 0])
+    rows = connection.execute(select(Report.location_id, Report.time, Report.vision_analysis).where(
+        Report.location_id.isnot(None), Report.time.isnot(None),
+        Report.vision_analysis.isnot(None), Report.vision_analysis != '', *criteria))
+    for location_id, reported_at, vision_analysis in rows:
+        estimate = ai_estimate(vision_analysis)
+        if estimate is not None:
+            totals = sums[(location_id, as_utc(reported_at).date())]
+            totals[0] += estimate
+            totals[1] += 1
+    if not sums:
+        return
+    table = ReportDailyRollup.__table__
+    connection.execute(
+        table.update().where(table.c.location_id == bindparam('key_location_id'), table.c.day == bindparam('key_day'))
+                      .values(ai_fullness_sum=bindparam('total'), ai_fullness_count=bindparam('count')),
+        [{'key_location_id': location_id, 'key_day': day, 'total': total, 'count': count}
+         for (location_id, day), (total, count) in sums.items()])
+
+
+def refresh_rollup(connection, location_id, day):
+    """Recompute one (location, day) row from its reports"""
+    table = ReportDailyRollup.__table__
+    connection.execute(table.delete().where(table.c.location_id == location_id, table.c.day == day))
+    start = day_start(day)
+    criteria = (Report.location_id == location_id, Report.time >= start, Report.time < start + timedelta(days=1))
+    connection.execute(table.insert().from_select(ROLLUP_COLUMNS, _rollup_select(connection.dialect.name, *criteria)))
+    _fill_ai_fullness(connection, *criteria)
+
+
+def refresh_latest(connection, location_id):
+    """Recompute a location's latest report"""
+    table = LocationLatestReport.__table__
+    connection.execute(table.delete().where(table.c.location_id == location_id))
+    latest = select(Report.location_id, Report.id, Report.pantry_fullness, Report.time)\
+        .where(Report.location_id == location_id)\
+        .order_by(Report.time.desc(), Report.id.desc())\
+        .limit(1)
+    connection.execute(table.insert().from_select(['location_id', 'report_id', 'pantry_fullness', 'time'], latest))
+
+
+def state_key(state):
+    """state_summary key of a location's state"""
+    return state or ''
+
+
+def _state_select(*criteria):
+    """INSERT-ready SELECT summarizing the locations matching `criteria` per state"""
+    report_counts = select(ReportDailyRollup.location_id, func.sum(ReportDailyRollup.report_count).label('reports'))\
+        .where(ReportDailyRollup.location_id.in_(select(Location.id).where(*criteria)))\
+        .group_by(ReportDailyRollup.location_id)\
+        .subquery('report_counts')
+    latest = LocationLatestReport.__table__
+    fullness = latest.c.pantry_fullness
+    state = func.coalesce(Location.state, '')
+    return select(
+        state,
+        func.count(Location.id),
+        func.count(latest.c.location_id),
+        func.coalesce(func.sum(report_counts.c.reports), 0),
+        func.coalesce(func.sum(fullness), 0),
+        func.count(fullness),
+        func.count(_when(fullness <= EMPTY_MAX, 1)),
+        func.count(_when(and_(fullness > EMPTY_MAX, fullness <= LOW_MAX), 1)),
+        func.count(_when(fullness > LOW_MAX, 1)),
+    ).select_from(Location.__table__.outerjoin(latest, latest.c.location_id == Location.id)
+                                    .outerjoin(report_counts, report_counts.c.location_id == Location.id))\
+     .where(*criteria)\
+     .group_by(state)
+
+
+def refresh_state(connection, state):
+    """Recompute one state_summary row from its locations"""
+    table = StateSummary.__table__
+    connection.execute(table.delete().where(table.c.state == state))
+    connection.execute(table.insert().from_select(['state'] + STATE_COLUMNS,
+                                                  _state_select(func.coalesce(Location.state, '') == state)))
+
+
+def _refresh_location_states(connection, location_ids):
+    states = connection.execute(select(Location.state).where(Location.id.in_(list(location_ids)))).scalars()
+    for state in {state_key(state) for state in states}:
+        refresh_state(connection, state)
+
+
+def _latest_counts(fullness):
+    """state_summary columns counting one latest report's fullness"""
+    if fullness is None:
+        return {'fullness_sum': 0, 'fullness_count': 0, 'empty_count': 0, 'low_count': 0, 'full_count': 0}
+    return {
+        'fullness_sum': fullness,
+        'fullness_count': 1,
+        'empty_count': 1 if fullness <= EMPTY_MAX else 0,
+        'low_count': 1 if EMPTY_MAX < fullness <= LOW_MAX else 0,
+        'full_count': 1 if fullness > LOW_MAX else 0,
+    }
+
+
+def _add_to_state(connection, report, reported_at, previous):
+    """Adjust the report's state row; `previous` is the location's latest report before it"""
+    location = connection.execute(select(Location.state).where(Location.id == report.location_id)).first()
+    if location is None:
+        return
+    changes = dict.fromkeys(STATE_COLUMNS, 0)
+    changes['report_count'] = 1
+    if previous is None:
+        changes['active_location_count'] = 1
+    # Equal times: the new report is the latest, as in ORDER BY time, id
+    if previous is None or reported_at >= as_utc(previous.time):
+        replaced = _latest_counts(previous.pantry_fullness if previous is not None else None)
+        for column, value in _latest_counts(report.pantry_fullness).items():
+            changes[column] = value - replaced[column]
+
+    upsert(connection, StateSummary.__table__, {'state': state_key(location.state)}, changes,
+           lambda current, new: {column: current[column] + new[column] for column in STATE_COLUMNS})
+
+
+def _add_latest(connection, report, reported_at):
+    """
+    Make the report its location's latest if it is; returns the previous latest
+    row (None if there was none), read under the row's lock so concurrent
+    reports for the same pantry each see the one committed before them
+    """
+    table = LocationLatestReport.__table__
+    values = {'report_id': report.id, 'pantry_fullness': report.pantry_fullness, 'time': reported_at}
+    if insert_if_absent(connection, table, {'location_id': report.location_id, **values}):
+        return None
+    where = table.c.location_id == report.location_id
+    previous = connection.execute(select(table.c.pantry_fullness, table.c.time).where(where)
+                                  .with_for_update()).first()
+    # Equal times: the report inserted last wins, as in ORDER BY time, id
+    if reported_at >= as_utc(previous.time):
+        connection.execute(table.update().where(where).values(**values))
+    return previous
+
+
+def add_report(connection, report):
+    """Merge a newly inserted report into its day's row"""
+    if report.location_id is None or report.time is None:
+        return
+    reported_at = as_utc(report.time)
+    fullness = report.pantry_fullness
+    has_fullness = fullness is not None
+    estimate = ai_estimate(report.vision_analysis)
+
+    def merge(current, new):
+        def first_known(column, better):
+            # Keep the stored extreme unless it is missing or the new value beats it
+            return case((current[column].is_(None), new[column]),
+                        (better(new[column], current[column]), new[column]),
+                        else_=current[column])
+
+        # Equal times: the report inserted last is the latest, as in ORDER BY time, id
+        is_latest = new['last_report_time'] >= current['last_report_time']
+        set_ = {column: current[column] + new[column]
+                for column in ('report_count', 'fullness_sum', 'fullness_count',
+                               'empty_count', 'full_count', 'ai_report_count',
+                               'ai_fullness_sum', 'ai_fullness_count')}
+        set_.update({
+            'fullness_min': first_known('fullness_min', lambda a, b: a < b),
+            'fullness_max': first_known('fullness_max', lambda a, b: a > b),
+            'last_fullness': case((is_latest, new['last_fullness']), else_=current['last_fullness']),
+            'first_report_time': case((new['first_report_time'] < current['first_report_time'],
+                                       new['first_report_time']), else_=current['first_report_time']),
+            'last_report_time': case((is_latest, new['last_report_time']), else_=current['last_report_time']),
+        })
+        return set_
+
+    upsert(connection, ReportDailyRollup.__table__,
+           {'location_id': report.location_id, 'day': reported_at.date()},
+           {
+               'report_count': 1,
+               'fullness_sum': fullness if has_fullness else 0,
+               'fullness_count': 1 if has_fullness else 0,
+               'fullness_min': fullness,
+               'fullness_max': fullness,
+               'empty_count': 1 if has_fullness and fullness <= EMPTY_MAX else 0,
+               'full_count': 1 if has_fullness and fullness > LOW_MAX else 0,
+               'last_fullness': fullness,
+               'first_report_time': reported_at,
+               'last_report_time': reported_at,
+               'ai_report_count': 1 if report.vision_analysis else 0,
+               'ai_fullness_sum': estimate if estimate is not None else 0,
+               'ai_fullness_count': 1 if estimate is not None else 0,
+           },
+           merge)
+
+    previous = _add_latest(connection, report, reported_at)
+    _add_to_state(connection, report, reported_at, previous)
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, target):
+    add_report(connection, target)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the stored value when these are assigned, so an edit knows which day the report left
+event.listen(Report.location_id, 'set', _load_previous_value, active_history=True)
+event.listen(Report.time, 'set', _load_previous_value, active_history=True)
+
+
+@event.listens_for(Report, 'after_update')
+def report_updated(mapper, connection, target):
+    state = inspect(target)
+    location_history = state.attrs.location_id.history
+    time_history = state.attrs.time.history
+    watched = ('pantry_fullness', 'vision_analysis')
+    if not (location_history.has_changes() or time_history.has_changes()
+            or any(state.attrs[name].history.has_changes() for name in watched)):
+        return
+
+    # Both the day the report left and the day it is now in
+    keys = set()
+    for location_id in (location_history.deleted or []) + [target.location_id]:
+        for reported_at in (time_history.deleted or []) + [target.time]:
+            if location_id is not None and reported_at is not None:
+                keys.add((location_id, as_utc(reported_at).date()))
+    for location_id, day in keys:
+        refresh_rollup(connection, location_id, day)
+    location_ids = {location_id for location_id, _ in keys}
+    for location_id in location_ids:
+        refresh_latest(connection, location_id)
+    _refresh_location_states(connection, location_ids)
+
+
+@event.listens_for(Report, 'after_delete')
+def report_deleted(mapper, connection, target):
+    if target.location_id is not None and target.time is not None:
+        refresh_rollup(connection, target.location_id, as_utc(target.time).date())
+        refresh_latest(connection, target.location_id)
+        _refresh_location_states(connection, [target.location_id])
+
+
+# The state a location is moved out of is recomputed too
+event.listen(Location.state, 'set', _load_previous_value, active_history=True)
+
+
+@event.listens_for(Location, 'after_insert')
+def location_inserted(mapper, connection, target):
+    refresh_state(connection, state_key(target.state))
+
+
+@event.listens_for(Location, 'after_update')
+def location_updated(mapper, connection, target):
+    history = inspect(target).attrs['state'].history
+    if history.has_changes():
+        for state in {state_key(state) for state in (history.deleted or []) + [target.state]}:
+            refresh_state(connection, state)
+
+
+@event.listens_for(Location, 'after_delete')
+def location_deleted(mapper, connection, target):
+    for table in (ReportDailyRollup.__table__, LocationLatestReport.__table__):
+        connection.execute(table.delete().where(table.c.location_id == target.id))
+    refresh_state(connection, state_key(target.state))
+
+
+def rebuild_rollups():
+    """Recompute the daily rollups, latest reports and state summaries from the full report history; returns the number of daily rows"""
+    table = ReportDailyRollup.__table__
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(ROLLUP_COLUMNS, _rollup_select(db.engine.dialect.name)))
+    _fill_ai_fullness(db.session.connection())
+
+    latest = latest_report_subquery()
+    db.session.execute(LocationLatestReport.__table__.delete())
+    db.session.execute(LocationLatestReport.__table__.insert().from_select(
+        ['location_id', 'report_id', 'pantry_fullness', 'time'],
+        select(latest.c.location_id, latest.c.id, latest.c.pantry_fullness, latest.c.time)
+        .where(latest.c.location_id.isnot(None))))
+
+    db.session.execute(StateSummary.__table__.delete())
+    db.session.execute(StateSummary.__table__.insert().from_select(['state'] + STATE_COLUMNS, _state_select()))
+    db.session.commit()
+    return db.session.query(func.count()).select_from(table).scalar()
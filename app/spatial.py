@@ -0,0 +1,86 @@
+"""
+Spatial grid index for locations
+
+Every location stores the id of the fixed-size lat/lon grid cell it falls in
+(`Location.grid_cell`, indexed). A bounding-box query becomes one indexed range
+scan per grid row followed by an exact latitude/longitude check, so its cost
+follows the size of the viewport instead of the number of pantries.
+"""
+import math
+from sqlalchemy import and_, or_, event
+from .models import Location
+
+GRID_CELL_DEGREES = 0.25
+GRID_COLUMNS = int(360 / GRID_CELL_DEGREES)
+GRID_ROWS = int(180 / GRID_CELL_DEGREES)
+# Viewports spanning more rows than this (continent-sized) skip the cell ranges
+MAX_GRID_ROWS = 64
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def grid_row(latitude):
+    return min(GRID_ROWS - 1, max(0, int(math.floor((latitude + 90) / GRID_CELL_DEGREES))))
+
+
+def grid_column(longitude):
+    return min(GRID_COLUMNS - 1, max(0, int(math.floor((longitude + 180) / GRID_CELL_DEGREES))))
+
+
+def grid_cell_for(latitude, longitude):
+    """
+    Grid cell id for a coordinate pair, or None if either coordinate is missing
+    """
+    latitude, longitude = _to_float(latitude), _to_float(longitude)
+    if latitude is None or longitude is None:
+        return None
+    return grid_row(latitude) * GRID_COLUMNS + grid_column(longitude)
+
+
+def parse_bbox(value):
+    """
+    Parse "minLon,minLat,maxLon,maxLat" into a tuple of floats
+    Raises ValueError if the box is malformed
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError("bbox must have four comma-separated numbers")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (-90 <= min_lat <= max_lat <= 90) or not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError("bbox is out of range")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def bbox_filter(min_lon, min_lat, max_lon, max_lat):
+    """
+    SQL filter selecting locations inside the box
+    A box with min_lon > max_lon crosses the antimeridian
+    """
+    if min_lon <= max_lon:
+        longitude_check = Location.longitude.between(min_lon, max_lon)
+        column_ranges = [(grid_column(min_lon), grid_column(max_lon))]
+    else:
+        longitude_check = or_(Location.longitude >= min_lon, Location.longitude <= max_lon)
+        column_ranges = [(grid_column(min_lon), GRID_COLUMNS - 1), (0, grid_column(max_lon))]
+
+    exact = and_(Location.latitude.between(min_lat, max_lat), longitude_check)
+
+    rows = range(grid_row(min_lat), grid_row(max_lat) + 1)
+    if len(rows) > MAX_GRID_ROWS:
+        return exact
+
+    cell_ranges = [Location.grid_cell.between(row * GRID_COLUMNS + first, row * GRID_COLUMNS + last)
+                   for row in rows for first, last in column_ranges]
+    return and_(or_(*cell_ranges), exact)
+
+
+@event.listens_for(Location, 'before_insert')
+@event.listens_for(Location, 'before_update')
+def update_grid_cell(mapper, connection, location):
+    """Keep Location.grid_cell in step with its coordinates on every ORM write"""
+    location.grid_cell = grid_cell_for(location.latitude, location.longitude)
@@ -5,6 +5,17 @@ let markers = [];
 let filteredPantries = [];
 const foodPantries = [];
 const MAX_DISTANCE_MILES = 10;
+const PANTRY_POLL_INTERVAL_MS = 60000;
+let pantryCursor = null;
+let pantryPollTimer = null;
+let statusStream = null;
+// Ids of applied stream events; the server resends recent ones after a reconnect
+const seenStatusEvents = new Set();
+const SEEN_STATUS_EVENTS_MAX = 1000;
+// Below this zoom the map shows server-side clusters instead of one marker per pantry
+const CLUSTER_MAX_ZOOM = 10;
+let clusterMarkers = [];
+let clusterRequest = 0;
 
 // Initialize filter states
 let currentFilters = {
@@ -58,6 +69,7 @@ function initMap() {
     setupAutocomplete(placesService);
     setupGeolocation();
     setupEventListeners();
+    map.addListener('idle', refreshClusters);
     loadPantryData();
 }
 
@@ -254,7 +266,7 @@ function addUserMarker(location) {
     }, 100);
 }
 
-function applyFilters() {
+function applyFilters(fitBounds = true) {
     // Show all pantries - no distance filtering
     filteredPantries = [...foodPantries];
 
@@ -263,7 +275,7 @@ function applyFilters() {
     
     // Update display
     updatePantryList();
-    updateMapMarkers();
+    updateMapMarkers(fitBounds);
     updateResultsCount();
 }
 
@@ -448,7 +460,7 @@ function focusOnPantry(lat, lng, name) {
     }
 }
 
-function updateMapMarkers() {
+function updateMapMarkers(fitBounds = true) {
     // Clear existing markers
     markers.forEach(marker => {
         if (marker.infoWindow) {
@@ -467,7 +479,7 @@ function updateMapMarkers() {
         
         const marker = new google.maps.Marker({
             position: position,
-            map: map,
+            map: showingClusters() ? null : map,
             title: pantry.name,
             icon: {
                 url: `data:image/svg+xml;charset=UTF-8,${encodeURIComponent(`
@@ -497,7 +509,7 @@ function updateMapMarkers() {
     });
     
     // Fit map to show all markers if we have any
-    if (markers.length > 0) {
+    if (fitBounds && markers.length > 0) {
         map.fitBounds(bounds);
         
         // Add some padding to the bounds
@@ -507,6 +519,81 @@ function updateMapMarkers() {
     }
 }
 
+function showingClusters() {
+    return map.getZoom() < CLUSTER_MAX_ZOOM;
+}
+
+function clearClusterMarkers() {
+    clusterMarkers.forEach(marker => marker.setMap(null));
+    clusterMarkers = [];
+}
+
+// Swap between cluster markers and pantry markers for the current zoom and viewport
+function refreshClusters() {
+    if (!showingClusters()) {
+        clearClusterMarkers();
+        markers.forEach(marker => marker.setMap(map));
+        return;
+    }
+
+    markers.forEach(marker => {
+        if (marker.infoWindow) {
+            marker.infoWindow.close();
+        }
+        marker.setMap(null);
+    });
+
+    const bounds = map.getBounds();
+    if (!bounds) return;
+    const sw = bounds.getSouthWest();
+    const ne = bounds.getNorthEast();
+    const bbox = [sw.lng(), sw.lat(), ne.lng(), ne.lat()].map(value => value.toFixed(4)).join(',');
+    const request = ++clusterRequest;
+
+    fetch(`/api/clusters?zoom=${map.getZoom()}&bbox=${bbox}`)
+        .then(response => response.json())
+        .then(data => {
+            // Ignore responses for viewports the user has already left
+            if (request !== clusterRequest || !showingClusters()) return;
+            clearClusterMarkers();
+            data.clusters.forEach(cluster => {
+                clusterMarkers.push(createClusterMarker(cluster));
+            });
+        })
+        .catch(error => {
+            console.error('Error loading clusters:', error);
+        });
+}
+
+function createClusterMarker(cluster) {
+    const position = { lat: cluster.latitude, lng: cluster.longitude };
+    const size = cluster.count === 1 ? 40 : Math.min(64, 36 + Math.log10(cluster.count) * 10);
+    const markerColor = getMarkerColor(cluster.worst_status);
+    const counts = cluster.status_counts;
+
+    const marker = new google.maps.Marker({
+        position: position,
+        map: map,
+        title: `${cluster.count} pantries (${counts.full} full, ${counts.low} low, ${counts.empty} empty, ${counts.unknown} unknown)`,
+        icon: {
+            url: `data:image/svg+xml;charset=UTF-8,${encodeURIComponent(`
+                <svg width="${size}" height="${size}" viewBox="0 0 40 40" xmlns="http://www.w3.org/2000/svg">
+                    <circle cx="20" cy="20" r="18" fill="${markerColor}" stroke="white" stroke-width="2"/>
+                    <text x="20" y="25" text-anchor="middle" fill="white" font-family="Arial, sans-serif" font-size="14" font-weight="bold">${cluster.count}</text>
+                </svg>
+            `)}`,
+            scaledSize: new google.maps.Size(size, size),
+            anchor: new google.maps.Point(size / 2, size / 2)
+        }
+    });
+
+    marker.addListener('click', () => {
+        map.setCenter(position);
+        map.setZoom(Math.min(map.getZoom() + 2, CLUSTER_MAX_ZOOM));
+    });
+    return marker;
+}
+
 function getMarkerColor(status) {
     switch (status) {
         case 'full': return '#28a745';
@@ -562,11 +649,66 @@ function createInfoWindowContent(pantry) {
     `;
 }
 
+// Layout documented in app/feed_format.py
+const FEED_STATUSES = ['unknown', 'full', 'low', 'empty'];
+const FEED_MARKER_COLORS = ['gray', 'green', 'yellow', 'red'];
+
+function decodePantryFeed(buffer) {
+    const header = new Uint32Array(buffer, 4, 3);
+    const [version, count, dictionarySize] = header;
+    if (new TextDecoder().decode(new Uint8Array(buffer, 0, 4)) !== 'PNTF' || version !== 1) {
+        throw new Error('Unsupported pantry feed format');
+    }
+
+    let offset = 16;
+    const column = (ArrayType) => {
+        const values = new ArrayType(buffer, offset, count);
+        offset += count * ArrayType.BYTES_PER_ELEMENT;
+        return values;
+    };
+    const ids = column(Uint32Array);
+    const latitudes = column(Float32Array);
+    const longitudes = column(Float32Array);
+    const updated = column(Uint32Array);
+    const zips = column(Uint32Array);
+    const localities = column(Uint32Array);
+    const statuses = column(Uint8Array);
+    const fullness = column(Uint8Array);
+    offset += (4 - offset % 4) % 4;
+
+    const textLength = new DataView(buffer).getUint32(offset, true);
+    const strings = new TextDecoder().decode(new Uint8Array(buffer, offset + 4, textLength)).split('\0');
+    const dictionary = strings.slice(0, dictionarySize);
+
+    const pantries = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const street = strings[dictionarySize + 2 * i + 1];
+        pantries[i] = {
+            id: ids[i],
+            name: strings[dictionarySize + 2 * i],
+            // float32 keeps ~1m precision; round off the float noise
+            latitude: isNaN(latitudes[i]) ? null : Math.round(latitudes[i] * 1e6) / 1e6,
+            longitude: isNaN(longitudes[i]) ? null : Math.round(longitudes[i] * 1e6) / 1e6,
+            address: `${street}, ${dictionary[localities[i]]} ${zips[i] || ''}`.trim(),
+            fullness: fullness[i] === 255 ? null : fullness[i],
+            status: FEED_STATUSES[statuses[i]],
+            marker_color: FEED_MARKER_COLORS[statuses[i]],
+            lastUpdated: updated[i] ? new Date(updated[i] * 1000).toISOString() : null
+        };
+    }
+    return pantries;
+}
+
 function loadPantryData() {
     foodPantries.length = 0; // Clear previous pantries
+    const binary = typeof TextDecoder !== 'undefined';
     
-    fetch('/get_pantry_data')
-        .then(response => response.json())
+    fetch(binary ? '/get_pantry_data?format=binary' : '/get_pantry_data')
+        .then(response => {
+            // Cursor for asking the server only for pantries that changed later
+            pantryCursor = response.headers.get('X-Pantry-Cursor');
+            return binary ? response.arrayBuffer().then(decodePantryFeed) : response.json();
+        })
         .then(pantries => {
             pantries.forEach(pantry => {
                 foodPantries.push(pantry);
@@ -577,6 +719,8 @@ function loadPantryData() {
             
             // Apply initial filters and display
             applyFilters();
+
+            startLiveUpdates();
         })
         .catch(error => {
             console.error('Error loading pantry data:', error);
@@ -593,6 +737,114 @@ function loadPantryData() {
         });
 }
 
+// Prefer the live status stream; fall back to polling where EventSource is unavailable or keeps failing
+function startLiveUpdates() {
+    if (statusStream || pantryPollTimer) return;
+    if (!window.EventSource) {
+        pantryPollTimer = setInterval(pollPantryUpdates, PANTRY_POLL_INTERVAL_MS);
+        return;
+    }
+
+    statusStream = new EventSource('/stream/status');
+    // Catch anything that changed between loading the map and the stream opening
+    statusStream.addEventListener('open', pollPantryUpdates);
+    statusStream.addEventListener('report', event => {
+        if (firstSeen(event)) mergePantryUpdate(JSON.parse(event.data));
+    });
+    statusStream.addEventListener('location', event => {
+        if (firstSeen(event)) mergePantryUpdate(JSON.parse(event.data));
+    });
+    statusStream.addEventListener('deleted', event => {
+        if (!firstSeen(event)) return;
+        const { id } = JSON.parse(event.data);
+        const index = foodPantries.findIndex(pantry => pantry.id === id);
+        if (index !== -1) {
+            foodPantries.splice(index, 1);
+            applyFilters(false);
+        }
+    });
+    // The server no longer has the events we missed; reload everything
+    statusStream.addEventListener('reset', () => {
+        pantryCursor = null;
+        fetch('/get_pantry_data')
+            .then(response => {
+                pantryCursor = response.headers.get('X-Pantry-Cursor');
+                return response.json();
+            })
+            .then(pantries => {
+                foodPantries.length = 0;
+                foodPantries.push(...pantries);
+                applyFilters(false);
+            });
+    });
+    statusStream.addEventListener('error', () => {
+        // EventSource retries on its own unless the server refused the stream
+        if (statusStream.readyState === EventSource.CLOSED) {
+            statusStream = null;
+            pantryPollTimer = setInterval(pollPantryUpdates, PANTRY_POLL_INTERVAL_MS);
+        }
+    });
+}
+
+// True the first time a stream event id is seen
+function firstSeen(event) {
+    if (seenStatusEvents.has(event.lastEventId)) return false;
+    seenStatusEvents.add(event.lastEventId);
+    if (seenStatusEvents.size > SEEN_STATUS_EVENTS_MAX) {
+        seenStatusEvents.delete(seenStatusEvents.values().next().value);
+    }
+    return true;
+}
+
+// Apply a (possibly partial) pantry from the status stream
+function mergePantryUpdate(update) {
+    const existing = foodPantries.find(pantry => pantry.id === update.id);
+    if (existing) {
+        Object.assign(existing, update);
+    } else if (update.name !== undefined) {
+        foodPantries.push(update);
+    } else {
+        return;
+    }
+    applyFilters(false);
+}
+
+// Fetch only the pantries that changed since the last cursor and merge them in
+function pollPantryUpdates() {
+    if (!pantryCursor) return;
+
+    fetch(`/get_pantry_data?since=${encodeURIComponent(pantryCursor)}`)
+        .then(response => response.json())
+        .then(delta => {
+            pantryCursor = delta.cursor;
+            const removed = new Set(delta.removed || []);
+            if (!delta.full && delta.pantries.length === 0 && removed.size === 0) return;
+
+            if (delta.full) {
+                foodPantries.length = 0;
+            } else if (removed.size > 0) {
+                // Deleted, or moved out of the area this map loaded
+                const kept = foodPantries.filter(pantry => !removed.has(pantry.id));
+                foodPantries.length = 0;
+                foodPantries.push(...kept);
+            }
+            const indexById = new Map(foodPantries.map((pantry, index) => [pantry.id, index]));
+            delta.pantries.forEach(pantry => {
+                if (indexById.has(pantry.id)) {
+                    foodPantries[indexById.get(pantry.id)] = pantry;
+                } else {
+                    foodPantries.push(pantry);
+                }
+            });
+
+            // Keep the user's current viewport while refreshing markers
+            applyFilters(false);
+        })
+        .catch(error => {
+            console.error('Error polling pantry updates:', error);
+        });
+}
+
 function calculateDistance(lat1, lon1, lat2, lon2) {
     const R = 3959; // Radius of the earth in miles
     const dLat = deg2rad(lat2 - lat1);
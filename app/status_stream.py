@@ -0,0 +1,285 @@
+"""
+Live pantry status stream (Server-Sent Events)
+
+Report inserts and location edits append a row to status_event inside the
+writing transaction; the row id doubles as the SSE event id, so a reconnecting
+browser resumes from its Last-Event-ID. Open streams sleep on an in-process
+condition that is woken after commit in the same worker. On Postgres the write
+also sends NOTIFY, and a LISTEN thread in every worker wakes its streams, so
+events fan out across gunicorn workers. Without NOTIFY (SQLite) streams in other
+workers still pick events up at the next heartbeat.
+
+Ids are taken at INSERT but transactions can commit out of order, so a
+lower id can become visible after a higher one was streamed. Each read
+therefore also re-reads the events of the last REORDER_SECONDS and sends the
+ones this stream has not sent yet; a resumed stream resends that window and
+the client drops event ids it has already applied.
+
+The status-pruner process (see Procfile) deletes events older than RETENTION;
+a stream or map delta resuming from a pruned event reloads the whole map.
+
+Every open stream holds a worker thread, so each worker serves at most
+SSE_MAX_STREAMS of them at once; past that the stream is refused with 503 and
+the map falls back to polling.
+"""
+import json
+import select
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, func, or_, text
+from sqlalchemy.orm import Session, object_session
+from . import db
+from .models import Location, Report, StatusEvent
+from .map_data import pantry_status, serialize_pantry, pantry_feed_query
+from .db_helpers import as_utc
+
+CHANNEL = 'pantry_status'
+HEARTBEAT_SECONDS = 15
+# Browsers reconnect after this many ms; streams end after SSE_STREAM_SECONDS to free the worker
+RETRY_MS = 3000
+DEFAULT_STREAM_SECONDS = 300
+# Per worker; gunicorn runs 16 threads per worker (see Procfile), most are left for normal requests
+DEFAULT_MAX_STREAMS = 4
+# Events of this window are re-read to catch transactions that committed out of id order
+REORDER_SECONDS = 10
+BATCH_SIZE = 200
+RETENTION = timedelta(days=2)
+
+
+class StatusBroker:
+    """Wakes the streams of this process when new events may be available"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+
+    def publish(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        """Block until publish() is called after `version` was read; False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.version != version, timeout)
+
+
+class StreamSlots:
+    """Counts the open streams of this process, refusing more than `limit`"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+
+    def acquire(self, limit):
+        with self.lock:
+            if self.open >= limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.open -= 1
+
+    def releaser(self):
+        """A function giving back one acquired slot, however many times it is called"""
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                self.release()
+        return release
+
+
+broker = StatusBroker()
+stream_slots = StreamSlots()
+_listener_lock = threading.Lock()
+_listener_started = False
+
+
+def _latest_report(connection, location_id):
+    reports = Report.__table__
+    return connection.execute(
+        reports.select().with_only_columns([reports.c.id, reports.c.pantry_fullness, reports.c.time])
+        .where(reports.c.location_id == location_id)
+        .order_by(reports.c.time.desc(), reports.c.id.desc())
+        .limit(1)
+    ).first()
+
+
+def _record(connection, target, location_id, kind, payload):
+    result = connection.execute(StatusEvent.__table__.insert().values(
+        location_id=location_id, kind=kind, payload=json.dumps(payload),
+        created_at=datetime.now(timezone.utc)))
+    if connection.dialect.name == 'postgresql':
+        # Delivered to every LISTENing worker when the transaction commits
+        connection.execute(text("SELECT pg_notify(:channel, :event_id)"),
+                           {'channel': CHANNEL, 'event_id': str(result.inserted_primary_key[0])})
+    session = object_session(target)
+    if session is not None:
+        session.info['status_events_pending'] = True
+
+
+@event.listens_for(Report, 'after_insert')
+def report_inserted(mapper, connection, report):
+    if report.location_id is None:
+        return
+    latest = _latest_report(connection, report.location_id)
+    if latest is None or latest.id != report.id:
+        # A backdated report does not change what the map shows
+        return
+    status, marker_color = pantry_status(latest.pantry_fullness)
+    _record(connection, report, report.location_id, 'report', {
+        'id': report.location_id,
+        'fullness': latest.pantry_fullness,
+        'status': status,
+        'marker_color': marker_color,
+        'lastUpdated': latest.time.isoformat() if latest.time else None,
+    })
+
+
+@event.listens_for(Location, 'after_insert')
+@event.listens_for(Location, 'after_update')
+def location_written(mapper, connection, location):
+    latest = _latest_report(connection, location.id)
+    fullness, last_updated = (latest.pantry_fullness, latest.time) if latest else (None, None)
+    _record(connection, location, location.id, 'location', serialize_pantry(location, fullness, last_updated))
+
+
+def locations_bulk_updated(connection, location_ids):
+    """Record 'location' events for pantries written with bulk updates, which skip location_written"""
+    for location, fullness, last_updated in pantry_feed_query(Location.id.in_(location_ids)).populate_existing():
+        _record(connection, location, location.id, 'location', serialize_pantry(location, fullness, last_updated))
+
+
+@event.listens_for(Location, 'after_delete')
+def location_deleted(mapper, connection, location):
+    _record(connection, location, location.id, 'deleted', {'id': location.id})
+
+
+@event.listens_for(Session, 'after_commit')
+def wake_streams(session):
+    if session.info.pop('status_events_pending', False):
+        broker.publish()
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending(session):
+    session.info.pop('status_events_pending', None)
+
+
+def _listen(engine):
+    """Forward Postgres notifications on CHANNEL to this worker's broker, reconnecting on errors"""
+    while True:
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            connection = raw.connection
+            connection.set_isolation_level(0)  # autocommit, required for LISTEN
+            connection.cursor().execute(f"LISTEN {CHANNEL}")
+            # Notifications sent while the listener was down were lost; let the streams look
+            broker.publish()
+            while True:
+                if select.select([connection], [], [], HEARTBEAT_SECONDS) != ([], [], []):
+                    connection.poll()
+                    if connection.notifies:
+                        connection.notifies.clear()
+                        broker.publish()
+        except Exception as e:
+            print(f"Status stream listener error, retrying: {e}")
+            time.sleep(5)
+        finally:
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+def ensure_listener():
+    """Start this worker's LISTEN thread on Postgres (once)"""
+    global _listener_started
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with _listener_lock:
+        if not _listener_started:
+            threading.Thread(target=_listen, args=(db.engine,), daemon=True, name='status-listener').start()
+            _listener_started = True
+
+
+def format_event(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+def latest_event_id():
+    return db.session.query(func.max(StatusEvent.id)).scalar() or 0
+
+
+def stream_status_events(last_event_id=None, max_seconds=DEFAULT_STREAM_SECONDS):
+    """
+    Generator of SSE text for events after `last_event_id` (or from now on if None)
+    Sends a `reset` event when the requested events were already pruned, telling
+    the client to reload the whole map
+    """
+    yield f"retry: {RETRY_MS}\n\n"
+
+    # Ids of the recent events already sent (or, on a fresh stream, already reflected in the page)
+    sent = set()
+    if last_event_id is None:
+        last_id = latest_event_id()
+        sent.update(_recent_ids(last_id))
+    else:
+        last_id = last_event_id
+        oldest = db.session.query(func.min(StatusEvent.id)).scalar()
+        if oldest is not None and oldest > last_id + 1:
+            last_id = latest_event_id()
+            sent.update(_recent_ids(last_id))
+            yield format_event(last_id, 'reset', '{}')
+    db.session.rollback()
+
+    deadline = time.monotonic() + max_seconds
+    while True:
+        version = broker.version
+        cutoff = _reorder_cutoff()
+        events = StatusEvent.query.filter(or_(StatusEvent.id > last_id, StatusEvent.created_at >= cutoff))\
+                                  .order_by(StatusEvent.id)\
+                                  .limit(BATCH_SIZE + len(sent)).all()
+        # Give the connection back to the pool while idle
+        db.session.rollback()
+
+        new_events = [status_event for status_event in events if status_event.id not in sent]
+        for status_event in new_events:
+            yield format_event(status_event.id, status_event.kind, status_event.payload)
+            sent.add(status_event.id)
+            last_id = max(last_id, status_event.id)
+        # Forget what has left the window
+        sent.intersection_update(status_event.id for status_event in events if as_utc(status_event.created_at) >= cutoff)
+        if len(new_events) >= BATCH_SIZE:
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not broker.wait(version, min(HEARTBEAT_SECONDS, remaining)):
+            yield ": keepalive\n\n"
+
+
+def _reorder_cutoff():
+    return datetime.now(timezone.utc) - timedelta(seconds=REORDER_SECONDS)
+
+
+def _recent_ids(last_id):
+    """Ids up to `last_id` inside the reorder window (already reflected in a freshly loaded map)"""
+    return [event_id for (event_id,) in db.session.query(StatusEvent.id)
+            .filter(StatusEvent.id <= last_id, StatusEvent.created_at >= _reorder_cutoff())]
+
+
+def prune_status_events(retention=RETENTION):
+    """Delete events older than `retention`; returns how many were removed"""
+    cutoff = datetime.now(timezone.utc) - retention
+    removed = StatusEvent.query.filter(StatusEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -1,14 +1,14 @@
-from flask import Blueprint, render_template, request, flash, jsonify, redirect, url_for, current_app, send_from_directory, abort
+from flask import Blueprint, render_template, request, flash, jsonify, redirect, url_for, current_app, send_from_directory, abort, stream_with_context
 from flask_login import login_required, current_user
 from sqlalchemy.sql.expression import true
-from sqlalchemy.orm import joinedload
-from .models import Location, Report, Notification, User
+from sqlalchemy.orm import joinedload, defer, load_only
+from .models import Location, Report, Notification, User, LocationLatestReport, StateSummary
 from app.helpers import send_email, allowed_file, upload_photo_to_s3, delete_photo_from_s3, generate_qr_poster_pdf, get_state_full_name, convert_heic_to_jpeg, is_heic_file
 from . import db, Message, mail
 import json
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from time import mktime
-from sqlalchemy import func, and_, desc
+from sqlalchemy import func, and_, or_, case, desc
 from werkzeug.utils import secure_filename
 import os
 import base64  # Import base64 for encoding images
@@ -17,14 +17,28 @@ import io
 import uuid
 import boto3
 from boto3 import s3
-import calendar
 import numpy as np
-from collections import defaultdict, Counter
 import statistics
 # Google Vision API imports
 from google.cloud import vision
 # Import our enhanced vision analysis
 from .vision import analyze_pantry_image_hybrid
+from .map_data import build_pantry_feed, build_pantry_delta, pantry_feed_query, serialize_pantry, feed_state, feed_etag, encode_cursor, decode_cursor, viewport_filter
+from .db_helpers import as_utc
+from .geocoding import enqueue_geocode, parse_coordinate
+from .spatial import parse_bbox
+from .clustering import clusters_in_view
+from .map_snapshot import current_snapshot, snapshot_variant, snapshot_body
+from .feed_format import encode_pantry_columns, wants_binary, BINARY_MIMETYPE
+from .analytics import (calculate_nationwide_analytics, location_time_trends, location_trend_buckets,
+                        latest_report_id, most_viewed_pantries,
+                        pantry_cache_name, pantry_views_name, NATIONWIDE_CACHE, PANTRY_CACHE)
+from .pantry_state import location_analytics, SECTIONS as PANTRY_SECTIONS
+from .food_items import top_food_items, window_start, WINDOWS
+from .cache import cached, flush_counts, get_cache, increment
+from .counters import homepage_stats
+from .nearest import find_nearest_pantries
+from .status_stream import stream_status_events, ensure_listener, stream_slots, DEFAULT_STREAM_SECONDS, DEFAULT_MAX_STREAMS
 
 views = Blueprint('views', __name__)
 
@@ -57,319 +71,39 @@ def analyze_pantry_image(image_content):
     return analyze_pantry_image_hybrid(image_content)
 
 
-def calculate_pantry_analytics(location):
+# Sections of calculate_pantry_analytics(): the running-state ones, then the daily rollup trends and the insights text
+PANTRY_FIELDS = (*PANTRY_SECTIONS, 'time_trends', 'insights')
+# Sections generate_pantry_insights() reads
+INSIGHT_FIELDS = ('fullness_stats', 'trends', 'patterns', 'ai_insights')
+
+
+def calculate_pantry_analytics(location, fields=None):
     """
     Calculate comprehensive analytics for a pantry location
-    Returns analytics data for charts and insights
+    Returns analytics data for charts and insights; with `fields`, only those
+    sections are computed (total_reports and date_range are always included)
     """
     try:
-        reports = Report.query.filter_by(location_id=location.id).order_by(Report.time.asc()).all()
+        requested = set(PANTRY_FIELDS if fields is None else fields)
+        needed = requested | set(INSIGHT_FIELDS) if 'insights' in requested else requested
+        common_items = top_food_items(limit=5, location_id=location.id) if 'ai_insights' in needed else []
+
+        # From the pantry's persisted running state (see pantry_state.py), not its full history
+        analytics = location_analytics(location.id, common_items, needed)
         
-        if len(reports) < 2:
+        if analytics is None:
             return None  # Need at least 2 reports for meaningful analytics
         
-        analytics = {
-            'total_reports': len(reports),
-            'date_range': {
-                'start': reports[0].time,
-                'end': reports[-1].time,
-                'days': (reports[-1].time - reports[0].time).days + 1
-            },
-            'fullness_stats': {},
-            'trends': {},
-            'patterns': {},
-            'ai_insights': {},
-            'chart_data': {},
-            'engagement': {},
-            'restocking': {}
-        }
-        
-        # Calculate fullness statistics
-        fullness_values = [r.pantry_fullness for r in reports]
-        analytics['fullness_stats'] = {
-            'average': round(sum(fullness_values) / len(fullness_values), 1),
-            'minimum': min(fullness_values),
-            'maximum': max(fullness_values),
-            'current': reports[-1].pantry_fullness,
-            'previous': reports[-2].pantry_fullness if len(reports) > 1 else None
-        }
-        
-        # Calculate trends
-        recent_reports = reports[-5:] if len(reports) >= 5 else reports
-        recent_fullness = [r.pantry_fullness for r in recent_reports]
-        
-        if len(recent_fullness) >= 2:
-            trend_direction = "stable"
-            recent_avg = sum(recent_fullness) / len(recent_fullness)
-            older_avg = sum(fullness_values[:-5]) / max(1, len(fullness_values[:-5])) if len(fullness_values) > 5 else recent_avg
-            
-            difference = recent_avg - older_avg
-            if difference > 10:
-                trend_direction = "improving"
-            elif difference < -10:
-                trend_direction = "declining"
-        else:
-            trend_direction = "insufficient_data"
-        
-        analytics['trends'] = {
-            'direction': trend_direction,
-            'recent_average': round(sum(recent_fullness) / len(recent_fullness), 1) if recent_fullness else 0,
-            'change_from_previous': analytics['fullness_stats']['current'] - analytics['fullness_stats']['previous'] if analytics['fullness_stats']['previous'] else 0
-        }
-        
-        # Calculate usage patterns
-        
-        # Group by day of week
-        day_counts = defaultdict(int)
-        day_fullness = defaultdict(list)
-        
-        for report in reports:
-            day_name = calendar.day_name[report.time.weekday()]
-            day_counts[day_name] += 1
-            day_fullness[day_name].append(report.pantry_fullness)
-        
-        # Find most/least active days
-        most_active_day = max(day_counts, key=day_counts.get) if day_counts else None
-        least_active_day = min(day_counts, key=day_counts.get) if day_counts else None
-        
-        # Calculate empty/critical periods
-        empty_reports = [r for r in reports if r.pantry_fullness <= 33]
-        critical_reports = [r for r in reports if r.pantry_fullness <= 10]
-        
-        analytics['patterns'] = {
-            'most_active_day': most_active_day,
-            'least_active_day': least_active_day,
-            'empty_periods': len(empty_reports),
-            'critical_periods': len(critical_reports),
-            'empty_percentage': round((len(empty_reports) / len(reports)) * 100, 1),
-            'day_averages': {day: round(sum(fullness) / len(fullness), 1) for day, fullness in day_fullness.items()}
-        }
-        
-        # AI insights (if available)
-        ai_reports = [r for r in reports if r.get_vision_analysis()]
-        if ai_reports:
-            all_detected_items = []
-            ai_fullness_estimates = []
-            
-            for report in ai_reports:
-                detected_items = report.get_detected_food_items()
-                if detected_items:
-                    all_detected_items.extend(detected_items)
-                
-                ai_fullness = report.get_ai_fullness_estimate()
-                if ai_fullness is not None:
-                    ai_fullness_estimates.append(ai_fullness)
-            
-            # Count most common food items
-            food_item_counts = Counter(all_detected_items)
-            
-            analytics['ai_insights'] = {
-                'total_ai_reports': len(ai_reports),
-                'most_common_items': food_item_counts.most_common(5),
-                'average_ai_fullness': round(sum(ai_fullness_estimates) / len(ai_fullness_estimates), 1) if ai_fullness_estimates else None,
-                'ai_coverage_percentage': round((len(ai_reports) / len(reports)) * 100, 1)
-            }
-        
-        # Prepare chart data - FIX: Use actual timestamps for proper time-based x-axis
-        chart_reports = reports[-30:] if len(reports) > 30 else reports  # Last 30 reports or all
-        
-        # Generate proper time-based chart data
-        chart_data_points = []
-        for report in chart_reports:
-            chart_data_points.append({
-                'timestamp': report.time.isoformat(),
-                'date': report.time.strftime('%Y-%m-%d'),
-                'datetime': report.time.strftime('%Y-%m-%d %H:%M'),
-                'fullness': report.pantry_fullness,
-                'ai_fullness': report.get_ai_fullness_estimate()
-            })
-        
-        analytics['chart_data'] = {
-            'data_points': chart_data_points,
-            'dates': [r.time.strftime('%Y-%m-%d') for r in chart_reports],
-            'timestamps': [r.time.isoformat() for r in chart_reports],
-            'fullness_values': [r.pantry_fullness for r in chart_reports],
-            'ai_fullness_values': [r.get_ai_fullness_estimate() or 0 for r in chart_reports if r.get_vision_analysis()],
-            'report_count_by_month': {},
-            'fullness_distribution': {'empty': 0, 'low': 0, 'medium': 0, 'high': 0, 'full': 0}
-        }
-        
-        # ENHANCED ANALYTICS - Time Period Trends
-        from datetime import timedelta
-        
-        # Calculate weekly, monthly, and yearly trends
-        weekly_trends = []
-        monthly_trends = []
-        yearly_trends = []
-        
-        # Group reports by time periods
-        report_groups = {
-            'weekly': defaultdict(list),
-            'monthly': defaultdict(list),
-            'yearly': defaultdict(list)
-        }
-        
-        for report in reports:
-            # Weekly grouping (Monday as start of week)
-            week_start = report.time - timedelta(days=report.time.weekday())
-            week_key = week_start.strftime('%Y-%m-%d')
-            report_groups['weekly'][week_key].append(report)
-            
-            # Monthly grouping
-            month_key = report.time.strftime('%Y-%m')
-            report_groups['monthly'][month_key].append(report)
-            
-            # Yearly grouping
-            year_key = report.time.strftime('%Y')
-            report_groups['yearly'][year_key].append(report)
-        print("report_groups", report_groups)
-        # Calculate averages for each period
-        for week_key, week_reports in report_groups['weekly'].items():
-            if len(week_reports) >= 2:  # Need at least 2 reports for meaningful average
-                avg_fullness = sum(r.pantry_fullness for r in week_reports) / len(week_reports)
-                weekly_trends.append({
-                    'period': week_key,
-                    'label': f"Week of {week_key}",
-                    'average_fullness': round(avg_fullness, 1),
-                    'report_count': len(week_reports),
-                    'min_fullness': min(r.pantry_fullness for r in week_reports),
-                    'max_fullness': max(r.pantry_fullness for r in week_reports)
-                })
-        
-        for month_key, month_reports in report_groups['monthly'].items():
-            if len(month_reports) >= 2:
-                avg_fullness = sum(r.pantry_fullness for r in month_reports) / len(month_reports)
-                monthly_trends.append({
-                    'period': month_key,
-                    'label': datetime.strptime(month_key, '%Y-%m').strftime('%B %Y'),
-                    'average_fullness': round(avg_fullness, 1),
-                    'report_count': len(month_reports),
-                    'min_fullness': min(r.pantry_fullness for r in month_reports),
-                    'max_fullness': max(r.pantry_fullness for r in month_reports)
-                })
-        
-        for year_key, year_reports in report_groups['yearly'].items():
-            if len(year_reports) >= 5:  # Need more reports for yearly average
-                avg_fullness = sum(r.pantry_fullness for r in year_reports) / len(year_reports)
-                yearly_trends.append({
-                    'period': year_key,
-                    'label': year_key,
-                    'average_fullness': round(avg_fullness, 1),
-                    'report_count': len(year_reports),
-                    'min_fullness': min(r.pantry_fullness for r in year_reports),
-                    'max_fullness': max(r.pantry_fullness for r in year_reports)
-                })
-        
-        # Sort trends chronologically
-        weekly_trends.sort(key=lambda x: x['period'])
-        monthly_trends.sort(key=lambda x: x['period'])
-        yearly_trends.sort(key=lambda x: x['period'])
-        
-        # Add to analytics
-        analytics['time_trends'] = {
-            'weekly': weekly_trends,
-            'monthly': monthly_trends,
-            'yearly': yearly_trends,
-            'has_weekly_data': len(weekly_trends) >= 2,
-            'has_monthly_data': len(monthly_trends) >= 2,
-            'has_yearly_data': len(yearly_trends) >= 2
-        }
-        
-        # Calculate fullness distribution
-        for fullness in fullness_values:
-            if fullness <= 10:
-                analytics['chart_data']['fullness_distribution']['empty'] += 1
-            elif fullness <= 33:
-                analytics['chart_data']['fullness_distribution']['low'] += 1
-            elif fullness <= 66:
-                analytics['chart_data']['fullness_distribution']['medium'] += 1
-            elif fullness <= 90:
-                analytics['chart_data']['fullness_distribution']['high'] += 1
-            else:
-                analytics['chart_data']['fullness_distribution']['full'] += 1
-        
-        # ENHANCED ANALYTICS - Community Engagement
-        unique_users = set()
-        user_report_counts = {}
-        for report in reports:
-            if report.user_id:
-                unique_users.add(report.user_id)
-                user_report_counts[report.user_id] = user_report_counts.get(report.user_id, 0) + 1
-        
-        analytics['engagement'] = {
-            'unique_reporters': len(unique_users),
-            'anonymous_reports': sum(1 for r in reports if not r.user_id),
-            'average_reports_per_user': round(len(reports) / max(1, len(unique_users)), 1),
-            'most_active_reporter': max(user_report_counts.values()) if user_report_counts else 0,
-            'engagement_rate': round((len(unique_users) / max(1, analytics['date_range']['days'])) * 7, 2)  # reporters per week
-        }
-        
-        # ENHANCED ANALYTICS - Restocking Patterns
-        restocking_events = []
-        depletion_events = []
-        
-        for i in range(1, len(reports)):
-            prev_report = reports[i-1]
-            curr_report = reports[i]
-            
-            # Detect restocking (significant increase in fullness)
-            if curr_report.pantry_fullness > prev_report.pantry_fullness + 30:
-                time_diff = (curr_report.time - prev_report.time).total_seconds() / 3600  # hours
-                restocking_events.append({
-                    'time': curr_report.time,
-                    'from_fullness': prev_report.pantry_fullness,
-                    'to_fullness': curr_report.pantry_fullness,
-                    'time_since_last': time_diff
-                })
-            
-            # Detect depletion (significant decrease)
-            elif prev_report.pantry_fullness > curr_report.pantry_fullness + 20:
-                time_diff = (curr_report.time - prev_report.time).total_seconds() / 3600  # hours
-                depletion_events.append({
-                    'time': curr_report.time,
-                    'from_fullness': prev_report.pantry_fullness,
-                    'to_fullness': curr_report.pantry_fullness,
-                    'depletion_rate': time_diff
-                })
-        
-        # Calculate restocking analytics
-        restock_times = [event['time_since_last'] for event in restocking_events if event['time_since_last'] < 24*7]  # within a week
-        depletion_rates = [event['depletion_rate'] for event in depletion_events if event['depletion_rate'] < 24*3]  # within 3 days
-        
-        analytics['restocking'] = {
-            'total_restocking_events': len(restocking_events),
-            'total_depletion_events': len(depletion_events),
-            'average_restock_time_hours': round(sum(restock_times) / len(restock_times), 1) if restock_times else None,
-            'average_depletion_time_hours': round(sum(depletion_rates) / len(depletion_rates), 1) if depletion_rates else None,
-            'recent_restocking_events': restocking_events[-3:],  # Last 3
-            'restocking_frequency_per_week': round(len(restocking_events) / max(1, analytics['date_range']['days'] / 7), 1)
-        }
-        
-        # ENHANCED ANALYTICS - Peak Usage Patterns  
-        hour_patterns = defaultdict(list)
-        month_patterns = defaultdict(list)
-        
-        for report in reports:
-            hour_patterns[report.time.hour].append(report.pantry_fullness)
-            month_patterns[report.time.strftime('%B')].append(report.pantry_fullness)
-        
-        # Find peak depletion hours (hours with lowest average fullness)
-        hour_averages = {hour: sum(fullness_list) / len(fullness_list) 
-                        for hour, fullness_list in hour_patterns.items()}
-        
-        sorted_hours = sorted(hour_averages.items(), key=lambda x: x[1])
-        peak_depletion_hours = sorted_hours[:3] if len(sorted_hours) >= 3 else sorted_hours
-        
-        analytics['patterns'].update({
-            'peak_depletion_hours': [f"{hour:02d}:00 ({avg:.1f}% avg)" for hour, avg in peak_depletion_hours],
-            'month_averages': {month: round(sum(fullness_list) / len(fullness_list), 1) 
-                             for month, fullness_list in month_patterns.items()},
-            'busiest_months': sorted(month_patterns.items(), key=lambda x: len(x[1]), reverse=True)[:3]
-        })
+        # ENHANCED ANALYTICS - Time Period Trends (from the daily rollups)
+        if 'time_trends' in needed:
+            analytics['time_trends'] = location_time_trends(location.id)
         
         # Add advanced insights
-        analytics['insights'] = generate_pantry_insights(analytics, reports)
-        
+        if 'insights' in needed:
+            analytics['insights'] = generate_pantry_insights(analytics)
+
+        for name in needed - requested:
+            del analytics[name]
         return analytics
         
     except Exception as e:
@@ -377,7 +111,7 @@ def calculate_pantry_analytics(location):
         return None
 
 
-def generate_pantry_insights(analytics, reports):
+def generate_pantry_insights(analytics, reports=None):
     """
     Generate human-readable insights and recommendations based on analytics
     """
@@ -552,22 +286,8 @@ us_states = {
 @views.route('/index')
 def home(id=0):
     """New improved homepage with focus on pantry visibility"""
-    # Get some basic stats for the homepage
-    total_pantries = Location.query.count()
-    total_reports = Report.query.count()
-    
-    # Count unique states
-    states = db.session.query(Location.state).distinct().count()
-    
-    # Count empty alerts (reports with fullness <= 33%)
-    empty_alerts = Report.query.filter(Report.pantry_fullness <= 33).count()
-    
-    stats = {
-        'total_pantries': total_pantries,
-        'total_reports': total_reports,
-        'states_covered': states,
-        'empty_alerts': empty_alerts
-    }
+    # Basic stats for the homepage, kept up to date on write (see counters.py)
+    stats = homepage_stats()
     
     return render_template("index-new.html", 
                          user=current_user, 
@@ -588,34 +308,66 @@ def home_old():
     return render_template("index.html", user=current_user, title="Home - Original")
 
 
+# Reports shown per page of a pantry's reporting history
+HISTORY_PAGE_SIZE = 20
+
+
+def report_page(query, location_id, limit, before=None):
+    """
+    One page of `query` (over a pantry's reports), newest first, after the
+    report `before`: (rows, whether older reports follow).
+    Raises ValueError when `before` is not a report of this pantry.
+    """
+    if before is not None:
+        anchor = db.session.query(Report.time, Report.id).filter_by(id=before, location_id=location_id).first()
+        if anchor is None:
+            raise ValueError('before must be a report of this location')
+        query = query.filter(or_(Report.time < anchor.time, and_(Report.time == anchor.time, Report.id < anchor.id)))
+
+    rows = query.order_by(Report.time.desc(), Report.id.desc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
 @views.route('/location/<int:location_id>')
 def location(location_id):
     # Unauthenticated user has no subscribed locations
     subscribed_locations = None
-    # Eager load reports for the location
-    location = Location.query.options(joinedload(Location.reports)).get_or_404(location_id)
+    location = Location.query.get_or_404(location_id)
 
     # Get user's subscribed locations if authenticated
     if current_user.is_authenticated:
             subscribed_locations = [notification.location_id for notification in current_user.notifications]
-            print(subscribed_locations)
 
     # Check if user can edit this location
     can_edit = current_user.is_authenticated and location.user_id == current_user.id
-    print("pantry reports: ", location.reports)
-    print("pantry reports type: ", type(location.reports))
-    # order the location.reports by time
-    location.reports = sorted(location.reports, key=lambda report: report.id, reverse=True)  # Descending order
+
+    # One page of the reporting history, newest first, with only the columns the page shows
+    # (?before=<id of the last report shown> for older ones)
+    columns = load_only(Report.id, Report.time, Report.pantry_fullness, Report.description, Report.photo,
+                        Report.vision_analysis)
+    before = request.args.get('before', type=int)
+    try:
+        reports, more = report_page(Report.query.options(columns).filter(Report.location_id == location.id),
+                                    location.id, HISTORY_PAGE_SIZE, before)
+    except ValueError:
+        abort(404)
+    older = reports[-1].id if more else None
     # Get most recent report
-    latest_report = location.reports[0] if location.reports else None
+    if before is None:
+        latest_report = reports[0] if reports else None
+    else:
+        latest_report = Report.query.options(columns).filter(Report.location_id == location.id)\
+                                    .order_by(Report.time.desc(), Report.id.desc()).first()
     
-    # Calculate analytics for this pantry
-    analytics = calculate_pantry_analytics(location)
+    # Calculate analytics for this pantry (persisted state and shared cache; no report history is read)
+    analytics = cached_pantry_analytics(location)
     
     return render_template("pantry.html", 
                          user=current_user, 
                          pantry=location, 
                          latest_report=latest_report, 
+                         reports=reports,
+                         older_reports=older,
                          subscribed_locations=subscribed_locations, 
                          can_edit=can_edit, 
                          current_app=current_app, 
@@ -647,8 +399,8 @@ def add_location():
         contact_info = request.form.get('contactInfo')
         photo = request.files.get('locationPhoto')  # Get the uploaded file
 
-        latitude = request.form.get('latitude')
-        longitude = request.form.get('longitude')
+        latitude = parse_coordinate(request.form.get('latitude'))
+        longitude = parse_coordinate(request.form.get('longitude'))
 
 
         # checks if the location exists
@@ -682,6 +434,8 @@ def add_location():
         s3_key = upload_photo_to_s3(photo, new_location.id)
         if s3_key:
             new_location.photo = s3_key
+        # Geocode in the background if the form had no coordinates
+        enqueue_geocode(new_location)
         db.session.commit()
 
         # # Check if photo exists and file type is allowed
@@ -737,8 +491,8 @@ def edit_location(location_id):
         description = request.form.get('description')
         photo = request.files.get('locationPhoto')
         contact_info = request.form.get('contactInfo')
-        latitude = request.form.get('latitude')
-        longitude = request.form.get('longitude')
+        latitude = parse_coordinate(request.form.get('latitude'))
+        longitude = parse_coordinate(request.form.get('longitude'))
 
         # Validate and convert zip code (or set to None if invalid/empty)
         if zip_code.isdigit():
@@ -747,9 +501,10 @@ def edit_location(location_id):
             zip_code = None
 
         # Basic input validation (add more as needed)
-        if not all([name, latitude, longitude]):
+        if not all([name, address]):
             flash('All fields are required.', category='error')
         else:
+            address_changed = (address, city, state, zip_code) != (location.address, location.city, location.state, location.zip)
             # Update location details
             location.name = name
             location.address = address
@@ -758,8 +513,13 @@ def edit_location(location_id):
             location.zip = zip_code
             location.description = description
             location.contact_info = contact_info
-            location.latitude = latitude
-            location.longitude = longitude
+            if latitude is not None and longitude is not None:
+                location.latitude = latitude
+                location.longitude = longitude
+            elif address_changed:
+                # Old coordinates no longer match the address; the geocoding worker will fill them in
+                location.latitude = None
+                location.longitude = None
             
 
             # Handle photo update (if a new photo is uploaded)
@@ -772,6 +532,8 @@ def edit_location(location_id):
                 s3_key = upload_photo_to_s3(photo, location_id)
                 if s3_key:
                     location.photo = s3_key
+            # Geocode in the background if the form had no coordinates
+            enqueue_geocode(location)
             # Commit changes
             db.session.commit()
             flash('Location updated successfully!', category='success')
@@ -913,16 +675,10 @@ def uploaded_file(filename):
 
 @views.route('/status', methods=['GET', 'POST'])
 def status():
-    # Get every report for every location, ordered by report time
-    locations = db.session.query(Location).options(joinedload(Location.reports)).all()
+    # The pantry table loads one page at a time from /api/status/locations
 
-    # sort reports in time ascending order
-    for location in locations:
-        location.reports = sorted(location.reports, key=lambda report: report.id, reverse=False)  # Ascending order
-
-    # Calculate nationwide analytics and insights
-    nationwide_analytics = calculate_nationwide_analytics()
-    nationwide_insights = generate_nationwide_insights(nationwide_analytics) if nationwide_analytics else []
+    # Nationwide analytics and insights, shared by all workers until the next write
+    nationwide_analytics, nationwide_insights = cached_nationwide_analytics()
 
     # Safely access subscribed_locations only if the user is authenticated
     subscribed_locations = [notification.location_id for notification in current_user.notifications] if current_user.is_authenticated else []
@@ -930,7 +686,6 @@ def status():
     return render_template("status.html", 
                          user=current_user, 
                          title="Dashboard", 
-                         locations=locations, 
                          subscribed_locations=subscribed_locations,
                          nationwide_analytics=nationwide_analytics,
                          nationwide_insights=nationwide_insights)
@@ -1103,67 +858,225 @@ def subscribe_location(location_id):
     return redirect(url_for('views.location', location_id=location_id))  # Redirect back to the location page
 
 
-from geopy.geocoders import Nominatim
-
-geolocator = Nominatim(user_agent="report_that_pantry") 
-
 # Route to get pantry data for the map
+# Locations without coordinates are geocoded by the background worker (see geocoding.py)
+# Pass ?since=<cursor> (from the X-Pantry-Cursor header or a previous delta) to get only changed pantries
+# Pass ?bbox=minLon,minLat,maxLon,maxLat (and optionally &limit=N) to get only the visible pantries
 @views.route('/get_pantry_data')
 def get_pantry_data():
-    locations = Location.query.all()
-    pantry_data = []
-    for location in locations:
-        # Geocode the address if coordinates are missing (you might have already done this)
-        if not location.latitude or not location.longitude:
-            address = f"{location.address}, {location.city}, {location.state} {location.zip}"
-            try:
-                geocode_result = geolocator.geocode(address)
-                print("geocode_result", geocode_result)
-                if geocode_result:
-                    location.latitude = geocode_result.latitude
-                    location.longitude = geocode_result.longitude
-                    db.session.commit() 
-            except Exception as e:
-                print(f"Error geocoding address {address}: {e}")
-                continue 
-            
-        # Get the most recent status update for this location
-        latest_report = Report.query.filter_by(location_id=location.id)\
-                                    .order_by(desc(Report.time)).first()
-        
-        # Determine status and marker color based on fullness
-        fullness = latest_report.pantry_fullness if latest_report else None
-        
-        if fullness is not None:
-            if fullness >= 75:
-                status = 'full'
-                marker_color = 'green'
-            elif fullness >= 25:
-                status = 'low'
-                marker_color = 'yellow'
-            else:
-                status = 'empty'
-                marker_color = 'red'
-        else:
-            status = 'unknown'
-            marker_color = 'gray'
+    since = request.args.get('since')
+    bbox = request.args.get('bbox')
+    limit = request.args.get('limit', type=int)
+    try:
+        location_filter = viewport_filter(bbox)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid bbox: {e}'}), 400
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    # Deltas are always JSON; full lists can use the compact columnar format
+    feed_format = 'binary' if since is None and wants_binary(request) else 'json'
+
+    if since is None and location_filter is None and limit is None:
+        return pantry_snapshot_response(feed_format)
+
+    state = feed_state()
+    etag = feed_etag(state, 'full' if since is None else since, bbox, limit, feed_format)
+
+    if request.if_none_match.contains(etag):
+        # Nothing changed since the client's copy
+        response = current_app.response_class(status=304)
+    elif feed_format == 'binary':
+        response = current_app.response_class(
+            encode_pantry_columns(pantry_feed_query(location_filter, limit)), mimetype=BINARY_MIMETYPE)
+    elif since is None:
+        response = jsonify(build_pantry_feed(location_filter, limit))
+    else:
+        response = jsonify(build_pantry_delta(decode_cursor(since), state, location_filter))
+
+    response.set_etag(etag)
+    response.headers['X-Pantry-Cursor'] = encode_cursor(state)
+    response.vary.add('Accept')
+    # Let browsers cache the feed but always revalidate it with If-None-Match
+    response.cache_control.no_cache = True
+    return response
 
-        pantry_data.append({
+
+def pantry_snapshot_response(feed_format):
+    # The whole map is served from the stored snapshot, compressed ahead of time
+    snapshot = current_snapshot()
+    column, encoding, etag = snapshot_variant(snapshot, request.accept_encodings, feed_format)
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        mimetype = BINARY_MIMETYPE if feed_format == 'binary' else 'application/json'
+        response = current_app.response_class(snapshot_body(snapshot, column), mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['X-Pantry-Cursor'] = snapshot.cursor
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response
+
+
+# Live pantry changes as Server-Sent Events; browsers resume with Last-Event-ID
+@views.route('/stream/status')
+def stream_status():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    # Each open stream holds a worker thread; past the cap the map polls /get_pantry_data instead
+    if not stream_slots.acquire(current_app.config.get('SSE_MAX_STREAMS', DEFAULT_MAX_STREAMS)):
+        response = jsonify({'error': 'Too many open status streams; poll /get_pantry_data instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '60'
+        return response
+
+    release = stream_slots.releaser()
+
+    def events():
+        try:
+            yield from stream_status_events(last_event_id, max_seconds)
+        finally:
+            release()
+
+    ensure_listener()
+    max_seconds = current_app.config.get('SSE_STREAM_SECONDS', DEFAULT_STREAM_SECONDS)
+    response = current_app.response_class(stream_with_context(events()), mimetype='text/event-stream')
+    # Also when the client goes away before the stream started
+    response.call_on_close(release)
+    response.cache_control.no_cache = True
+    # Keep proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Closest pantries to a point, optionally only those with a given status
+# Usage: /api/pantries/nearest?lat=39.8&lon=-89.6&k=5&status=full,low
+@views.route('/api/pantries/nearest')
+def api_nearest_pantries():
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    k = request.args.get('k', 5, type=int)
+    status = request.args.get('status')
+
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'error': 'lat and lon are required and must be valid coordinates'}), 400
+    if not 1 <= k <= 100:
+        return jsonify({'error': 'k must be between 1 and 100'}), 400
+    statuses = None
+    if status:
+        statuses = set(status.split(','))
+        if not statuses <= {'full', 'low', 'empty', 'unknown'}:
+            return jsonify({'error': 'status must be full, low, empty or unknown'}), 400
+
+    pantries = []
+    for location, fullness, last_updated, distance in find_nearest_pantries(latitude, longitude, k, statuses):
+        pantry = serialize_pantry(location, fullness, last_updated)
+        pantry['distance_miles'] = round(distance, 2)
+        pantries.append(pantry)
+    return jsonify({'pantries': pantries})
+
+
+# One page of the /status table: the latest report of each pantry that has one
+# Usage: /api/status/locations?offset=0&limit=10&search=oak&sort=time&order=desc
+@views.route('/api/status/locations')
+def api_status_locations():
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    sort = request.args.get('sort') or 'time'
+    order = request.args.get('order') or 'desc'
+    search = (request.args.get('search') or '').strip()
+
+    sort_columns = {'time': LocationLatestReport.time, 'location': Location.name}
+    if offset < 0 or not 1 <= limit <= 100:
+        return jsonify({'error': 'offset must be >= 0 and limit between 1 and 100'}), 400
+    if sort not in sort_columns or order not in ('asc', 'desc'):
+        return jsonify({'error': 'sort must be time or location and order asc or desc'}), 400
+
+    query = db.session.query(Location, LocationLatestReport.pantry_fullness, LocationLatestReport.time)\
+                      .join(LocationLatestReport, LocationLatestReport.location_id == Location.id)
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(or_(Location.name.ilike(pattern), Location.address.ilike(pattern),
+                                 Location.city.ilike(pattern), Location.state.ilike(pattern)))
+
+    total = query.count()
+    column = sort_columns[sort]
+    rows = query.order_by(column.desc() if order == 'desc' else column.asc(), Location.id)\
+                .offset(offset)\
+                .limit(limit)\
+                .all()
+
+    return jsonify({
+        'total': total,
+        'rows': [{
             'id': location.id,
             'name': location.name,
-            'latitude': location.latitude,
-            'longitude': location.longitude,
-            'address': f"{location.address}, {location.city}, {location.state} {location.zip}",
-            'description': location.description, 
-            'contact_info': location.contact_info, 
+            'address': f"{location.address}, {location.city}, {location.state}",
             'fullness': fullness,
-            'status': status,
-            'marker_color': marker_color,
-            'lastUpdated': latest_report.time.isoformat() if latest_report else None,
-            # ... other relevant data
-        })
+            'time': as_utc(last_updated).timestamp(),
+        } for location, fullness, last_updated in rows]
+    })
+
+
+# A pantry's reports, newest first, one page at a time (expanded rows on /status)
+# Usage: /api/locations/<id>/history?limit=20&before=<id of the last report already shown>
+@views.route('/api/locations/<int:location_id>/history')
+def api_location_history(location_id):
+    limit = request.args.get('limit', 20, type=int)
+    before = request.args.get('before', type=int)
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit must be between 1 and 100'}), 400
+    if db.session.query(Location.id).filter_by(id=location_id).first() is None:
+        return jsonify({'error': 'Location not found'}), 404
+
+    has_ai = case((and_(Report.vision_analysis.isnot(None), Report.vision_analysis != ''), True), else_=False)
+    query = db.session.query(Report, has_ai)\
+                      .options(defer(Report.vision_analysis))\
+                      .filter(Report.location_id == location_id)
+    try:
+        page, more = report_page(query, location_id, limit, before)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'location_id': location_id,
+        'reports': [{
+            'id': report.id,
+            'time': as_utc(report.time).isoformat(),
+            'fullness': report.pantry_fullness,
+            'status': report.get_status(),
+            'description': report.description,
+            'photo_url': report.get_photo_url(),
+            'has_ai': bool(ai),
+        } for report, ai in page],
+        'next': page[-1][0].id if more else None
+    })
+
+
+# Precomputed marker clusters for the map at a given zoom level
+# Usage: /api/clusters?zoom=5&bbox=minLon,minLat,maxLon,maxLat
+@views.route('/api/clusters')
+def api_clusters():
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None:
+        return jsonify({'error': 'zoom is required'}), 400
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid bbox: {e}'}), 400
 
-    return jsonify(pantry_data)
+    return jsonify({
+        'zoom': zoom,
+        'clusters': clusters_in_view(zoom, bbox)
+    })
 
 
 @views.route('/map')
@@ -1308,9 +1221,16 @@ def api_analyze_image():
 def api_analytics(location_id):
     """
     API endpoint to get analytics data for a location in JSON format
+    ?fields=fullness_stats,restocking computes only those sections (default: all)
     """
+    fields = [field for field in (request.args.get('fields') or '').split(',') if field]
+    unknown = [field for field in fields if field not in PANTRY_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(PANTRY_FIELDS)}"}), 400
+
     location = Location.query.get_or_404(location_id)
-    analytics = calculate_pantry_analytics(location)
+    # The full response is shared through the cache; a selection is computed directly
+    analytics = calculate_pantry_analytics(location, fields) if fields else cached_pantry_analytics(location)
     
     if analytics:
         # Convert datetime objects to strings for JSON serialization
@@ -1332,252 +1252,69 @@ def api_analytics(location_id):
         })
 
 
-def calculate_nationwide_analytics():
+# ?granularity= values -> location_trend_buckets() granularities
+TREND_GRANULARITIES = {'week': 'weekly', 'month': 'monthly', 'year': 'yearly'}
+
+
+@views.route('/api/analytics/<int:location_id>/trends')
+def api_analytics_trends(location_id):
     """
-    Calculate analytics and trends across all pantries in the network
+    Average, minimum and maximum fullness and report count of a pantry per
+    week, month or year, for the days from `from` to `to` (YYYY-MM-DD, inclusive)
     """
-    from datetime import datetime, timedelta
-    from collections import defaultdict
-    import statistics
-    
-    # Get all locations with their reports
-    locations = db.session.query(Location).options(joinedload(Location.reports)).all()
-    
-    if not locations:
-        return None
-    
-    # Filter out locations without reports
-    active_locations = [loc for loc in locations if loc.reports]
-    
-    if len(active_locations) < 1:
-        return None
-    
-    # Collect all reports for analysis
-    all_reports = []
-    for location in active_locations:
-        all_reports.extend(location.reports)
-    
-    if len(all_reports) < 2:
-        return None
-    
-    # Sort reports by time
-    all_reports.sort(key=lambda r: r.time)
-    
-    # Time range analysis - with safe datetime handling
+    granularity = request.args.get('granularity') or 'month'
+    if granularity not in TREND_GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(TREND_GRANULARITIES)}"}), 400
     try:
-        start_date = normalize_datetime(all_reports[0].time)
-        end_date = normalize_datetime(all_reports[-1].time)
-        days_active = (end_date - start_date).days + 1
-    except Exception as e:
-        print(f"Error calculating date range: {e}")
-        start_date = normalize_datetime(datetime.now(timezone.utc))
-        end_date = start_date
-        days_active = 1
-    
-    # Current status across all pantries
-    current_reports = []
-    for location in active_locations:
-        if location.reports:
-            current_reports.append(location.reports[-1])
-    
-    # Calculate current metrics
-    current_fullness_values = [r.pantry_fullness for r in current_reports if r.pantry_fullness is not None]
-    avg_current_fullness = statistics.mean(current_fullness_values) if current_fullness_values else 0
-    
-    # Count pantries by status
-    empty_pantries = sum(1 for r in current_reports if r.pantry_fullness is not None and r.pantry_fullness <= 33)
-    low_pantries = sum(1 for r in current_reports if r.pantry_fullness is not None and 33 < r.pantry_fullness <= 66)
-    full_pantries = sum(1 for r in current_reports if r.pantry_fullness is not None and r.pantry_fullness > 66)
-    
-    # Historical trends - use timezone-aware datetime
-    from datetime import timezone
-    now = datetime.now(timezone.utc)
-    recent_cutoff = now - timedelta(days=30)
-    last_week_cutoff = now - timedelta(days=7)
-    
-    recent_reports = safe_datetime_filter(all_reports, recent_cutoff)
-    last_week_reports = safe_datetime_filter(all_reports, last_week_cutoff)
-    
-    # Activity metrics
-    total_reports = len(all_reports)
-    reports_last_30_days = len(recent_reports)
-    reports_last_7_days = len(last_week_reports)
-    
-    # Average reports per location
-    avg_reports_per_location = total_reports / len(active_locations) if active_locations else 0
-    
-    # Time series data for charts (last 30 days) - safe datetime handling
-    daily_data = defaultdict(list)
-    for report in recent_reports:
-        try:
-            # Normalize the report time to handle timezone issues
-            normalized_time = normalize_datetime(report.time)
-            day_key = normalized_time.strftime('%Y-%m-%d')
-            if report.pantry_fullness is not None:
-                daily_data[day_key].append(report.pantry_fullness)
-        except Exception as e:
-            print(f"Error processing report {report.id} for chart data: {e}")
-            continue
-    
-    # Calculate daily averages
-    chart_data = []
-    for day in sorted(daily_data.keys()):
-        avg_fullness = statistics.mean(daily_data[day])
-        chart_data.append({
-            'date': day,
-            'avg_fullness': round(avg_fullness, 1),
-            'report_count': len(daily_data[day])
-        })
-    
-    # State/regional breakdown
-    def new_state_stats():
-        return {'locations': 0, 'reports': 0, 'avg_fullness': 0.0, 'fullness_values': []}
-    state_stats = defaultdict(new_state_stats)
-    for location in active_locations:
-        state = location.state
-        state_stats[state]['locations'] += 1
-        state_stats[state]['reports'] += len(location.reports)
-        
-        if location.reports:
-            latest_fullness = location.reports[-1].pantry_fullness
-            if latest_fullness is not None:
-                state_stats[state]['fullness_values'].append(latest_fullness)
-    
-    # Calculate state averages and convert to full state names
-    state_breakdown_with_full_names = {}
-    for state_abbrev, state_data in state_stats.items():
-        if state_data['fullness_values']:
-            state_data['avg_fullness'] = round(statistics.mean(state_data['fullness_values']), 1)
-        del state_data['fullness_values']  # Remove raw data
-        
-        # Use full state name as the key
-        full_state_name = get_state_full_name(state_abbrev)
-        state_breakdown_with_full_names[full_state_name] = state_data
-    
-    # Vision API analytics (if available)
-    vision_reports = [r for r in all_reports if r.vision_analysis]
-    food_items_detected = []
-    ai_fullness_scores = []
-    
-    for report in vision_reports:
-        try:
-            analysis = report.get_vision_analysis()
-            if analysis:
-                if 'food_items' in analysis and analysis['food_items']:
-                    # Extract food item descriptions from the dictionary objects
-                    for food_item in analysis['food_items']:
-                        if isinstance(food_item, dict) and 'description' in food_item:
-                            food_items_detected.append(food_item['description'])
-                        elif isinstance(food_item, str):
-                            food_items_detected.append(food_item)
-                if 'fullness_estimate' in analysis:
-                    ai_fullness_scores.append(analysis['fullness_estimate'])
-        except Exception as e:
-            print(f"Error processing vision analysis for report: {e}")
-            continue
-    
-    # Most common food items
-    from collections import Counter
-    common_foods = Counter(food_items_detected).most_common(10) if food_items_detected else []
-    
-    # Calculate trends (compare periods for more meaningful insights)
-    two_weeks_ago = now - timedelta(days=14)
-    one_week_ago = now - timedelta(days=7)
-    
-    # Get reports from different time periods
-    last_week_reports = safe_datetime_filter(all_reports, one_week_ago)
-    previous_week_reports = []
-    last_month_reports = safe_datetime_filter(all_reports, recent_cutoff)
-    
-    # Get reports from week before last (for week-over-week comparison)
-    for report in all_reports:
-        try:
-            normalized_time = normalize_datetime(report.time)
-            normalized_two_weeks = normalize_datetime(two_weeks_ago)
-            normalized_one_week = normalize_datetime(one_week_ago);
-            
-            if normalized_two_weeks <= normalized_time < normalized_one_week:
-                previous_week_reports.append(report)
-        except Exception as e:
-            print(f"Error processing report {report.id} for weekly comparison: {e}")
-            continue
-    
-    # Calculate empty vs full trends
-    def count_empty_full(reports):
-        empty = sum(1 for r in reports if r.pantry_fullness is not None and r.pantry_fullness <= 33)
-        full = sum(1 for r in reports if r.pantry_fullness is not None and r.pantry_fullness > 66)
-        return empty, full
-    
-    last_week_empty, last_week_full = count_empty_full(last_week_reports)
-    prev_week_empty, prev_week_full = count_empty_full(previous_week_reports)
-    
-    # Calculate trends
-    empty_trend = "stable"
-    full_trend = "stable"
-    
-    if prev_week_empty > 0:
-        empty_change = ((last_week_empty - prev_week_empty) / prev_week_empty) * 100
-        if empty_change > 10:
-            empty_trend = "increasing"
-        elif empty_change < -10:
-            empty_trend = "decreasing"
-    
-    if prev_week_full > 0:
-        full_change = ((last_week_full - prev_week_full) / prev_week_full) * 100
-        if full_change > 10:
-            full_trend = "increasing"
-        elif full_change < -10:
-            full_trend = "decreasing"
-    
-    # Overall fullness trend
-    old_fullness = [r.pantry_fullness for r in previous_week_reports if r.pantry_fullness is not None]
-    new_fullness = [r.pantry_fullness for r in last_week_reports if r.pantry_fullness is not None]
-    
-    fullness_trend = None
-    if old_fullness and new_fullness:
-        old_avg = statistics.mean(old_fullness)
-        new_avg = statistics.mean(new_fullness)
-        fullness_trend = new_avg - old_avg
-    
-    return {
-        'network_overview': {
-            'total_locations': len(locations),
-            'active_locations': len(active_locations),
-            'total_reports': total_reports,
-            'avg_reports_per_location': round(avg_reports_per_location, 1),
-            'days_active': days_active,
-            'reports_last_30_days': reports_last_30_days,
-            'reports_last_7_days': reports_last_7_days
-        },
-        'current_status': {
-            'avg_fullness': round(avg_current_fullness, 1),
-            'empty_pantries': empty_pantries,
-            'low_pantries': low_pantries,
-            'full_pantries': full_pantries,
-            'total_reporting': len(current_reports)
-        },
-        'trends': {
-            'fullness_trend_weekly': round(fullness_trend, 1) if fullness_trend is not None else None,
-            'empty_trend': empty_trend,
-            'full_trend': full_trend,
-            'last_week_empty': last_week_empty,
-            'last_week_full': last_week_full,
-            'prev_week_empty': prev_week_empty,
-            'prev_week_full': prev_week_full,
-            'community_engagement': 'high' if reports_last_7_days > reports_last_30_days / 3 else 'moderate' if reports_last_7_days > reports_last_30_days / 6 else 'low'
-        },
-        'chart_data': chart_data,
-        'state_breakdown': state_breakdown_with_full_names,
-        'ai_insights': {
-            'reports_with_ai': len(vision_reports),
-            'common_foods': common_foods,
-            'avg_ai_fullness': round(statistics.mean(ai_fullness_scores), 1) if ai_fullness_scores else None
-        },
-        'date_range': {
-            'start': normalize_datetime(start_date),
-            'end': normalize_datetime(end_date)
-        }
-    }
+        start, end = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                      for name in ('from', 'to'))
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+    if start is not None and end is not None and start > end:
+        return jsonify({'error': 'from must not be after to'}), 400
+
+    location = Location.query.get_or_404(location_id)
+    return jsonify({
+        'location_id': location.id,
+        'granularity': granularity,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'trends': location_trend_buckets(location.id, TREND_GRANULARITIES[granularity], start, end),
+    })
+
+
+def cached_pantry_analytics(location, count=True):
+    """
+    calculate_pantry_analytics(location) from the shared cache, keyed by the
+    pantry's latest report id; hits, misses and views are counted unless `count`
+    is False (warming)
+    """
+    if count:
+        increment(pantry_views_name(location.id))
+    return cached(pantry_cache_name(location.id), lambda: calculate_pantry_analytics(location),
+                  current_app.config.get('ANALYTICS_CACHE_SECONDS', 300),
+                  version=latest_report_id(location.id), stats=PANTRY_CACHE if count else None)
+
+
+def warm_pantry_analytics(limit=50):
+    """Compute the cached analytics of the most-viewed pantries that are missing or stale; returns the pantry ids"""
+    flush_counts()
+    location_ids = most_viewed_pantries(get_cache(), limit)
+    for location in Location.query.filter(Location.id.in_(location_ids)):
+        cached_pantry_analytics(location, count=False)
+    return location_ids
+
+
+def cached_nationwide_analytics():
+    """
+    (analytics, insights) for the whole network, from the shared cache
+    Recomputed when a report or location is written, or after ANALYTICS_CACHE_SECONDS
+    """
+    def compute():
+        analytics = calculate_nationwide_analytics()
+        return analytics, generate_nationwide_insights(analytics) if analytics else []
+
+    return cached(NATIONWIDE_CACHE, compute, current_app.config.get('ANALYTICS_CACHE_SECONDS', 300))
 
 
 def generate_nationwide_insights(analytics):
@@ -1675,14 +1412,14 @@ def api_nationwide_analytics():
     """
     API endpoint to get nationwide analytics data in JSON format
     """
-    analytics = calculate_nationwide_analytics()
+    analytics, insights = cached_nationwide_analytics()
     
     if analytics:
-        # Convert datetime objects to strings for JSON serialization
-        analytics['date_range']['start'] = analytics['date_range']['start'].isoformat()
-        analytics['date_range']['end'] = analytics['date_range']['end'].isoformat()
-        
-        insights = generate_nationwide_insights(analytics)
+        # Convert datetime objects to strings for JSON serialization (without touching the cached copy)
+        analytics = {**analytics, 'date_range': {
+            'start': analytics['date_range']['start'].isoformat(),
+            'end': analytics['date_range']['end'].isoformat()
+        }}
         
         return jsonify({
             'success': True,
@@ -1696,42 +1433,58 @@ def api_nationwide_analytics():
         })
 
 
-def normalize_datetime(dt):
-    """
-    Normalize datetime to UTC timezone-aware datetime
-    Handles both timezone-aware and timezone-naive datetime objects
-    """
-    from datetime import timezone
-    
-    if dt is None:
-        return None
-    
-    # If datetime is timezone-naive, assume it's UTC
-    if dt.tzinfo is None:
-        return dt.replace(tzinfo=timezone.utc)
-    
-    # If datetime is timezone-aware, convert to UTC
-    return dt.astimezone(timezone.utc)
-
-
-def safe_datetime_filter(reports, cutoff_datetime):
+@views.route('/api/states')
+def api_states():
     """
-    Safely filter reports by datetime, handling timezone issues
+    Per-state pantry counts and current fullness, from the maintained state summary
     """
-    filtered_reports = []
-    for report in reports:
-        try:
-            normalized_report_time = normalize_datetime(report.time)
-            normalized_cutoff = normalize_datetime(cutoff_datetime)
-            
-            if normalized_report_time >= normalized_cutoff:
-                filtered_reports.append(report)
-        except Exception as e:
-            # If there's an error with timezone conversion, skip this report
-            print(f"Error comparing datetime for report {report.id}: {e}")
-            continue
-    
-    return filtered_reports
+    states = []
+    for row in StateSummary.query.filter(StateSummary.location_count > 0).order_by(StateSummary.state):
+        average = row.fullness_sum / row.fullness_count if row.fullness_count else None
+        states.append({
+            'state': row.state or None,
+            'name': get_state_full_name(row.state or None),
+            'locations': row.location_count,
+            'active_locations': row.active_location_count,
+            'reports': row.report_count,
+            'avg_fullness': round(average, 1) if average is not None else None,
+            'empty_pantries': row.empty_count,
+            'low_pantries': row.low_count,
+            'full_pantries': row.full_count,
+        })
+    return jsonify({'success': True, 'states': states})
+
+
+# Most common AI-detected food items
+# Usage: /api/food-items?scope=network|state:IL|location:42&window=7d|30d|90d|365d|all&limit=10
+@views.route('/api/food-items')
+def api_food_items():
+    scope = request.args.get('scope') or 'network'
+    window = request.args.get('window') or 'all'
+    limit = request.args.get('limit', 10, type=int)
+
+    if window not in WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(WINDOWS)}"}), 400
+    if not 1 <= limit <= 50:
+        return jsonify({'error': 'limit must be between 1 and 50'}), 400
+
+    kind, _, value = scope.partition(':')
+    filters = {}
+    if kind == 'state' and value:
+        filters['state'] = value
+    elif kind == 'location' and value.isdigit():
+        if Location.query.get(int(value)) is None:
+            return jsonify({'error': 'Location not found'}), 404
+        filters['location_id'] = int(value)
+    elif scope != 'network':
+        return jsonify({'error': 'scope must be network, state:<abbreviation> or location:<id>'}), 400
+
+    items = top_food_items(limit=limit, since=window_start(window), **filters)
+    return jsonify({
+        'scope': scope,
+        'window': window,
+        'items': [{'item': item, 'count': count} for item, count in items],
+    })
 
 
 @views.route('/analyze_image', methods=['POST'])
@@ -1860,8 +1613,8 @@ def submit_location():
             city = request.form.get('city', '').strip()
             state = request.form.get('state', '').strip()
             zip_code = request.form.get('zipCode', '').strip()
-            latitude = request.form.get('latitude', '').strip()
-            longitude = request.form.get('longitude', '').strip()
+            latitude = parse_coordinate(request.form.get('latitude', '').strip())
+            longitude = parse_coordinate(request.form.get('longitude', '').strip())
             description = request.form.get('description', '').strip()
             email = request.form.get('email', '').strip()
             submitter_name = request.form.get('submitterName', '').strip()
@@ -1873,8 +1626,6 @@ def submit_location():
                 return jsonify({'error': 'Address is required'}), 400
             if not email:
                 return jsonify({'error': 'Email is required'}), 400
-            if not latitude or not longitude:
-                return jsonify({'error': 'Please select a valid address from the suggestions'}), 400
                 
             # Validate email format
             import re
@@ -1896,8 +1647,8 @@ def submit_location():
                 city=city,
                 state=state,
                 zip=int(zip_code) if zip_code and zip_code.isdigit() else None,
-                latitude=float(latitude) if latitude else None,
-                longitude=float(longitude) if longitude else None,
+                latitude=latitude,
+                longitude=longitude,
                 name=pantry_name if pantry_name else f"Pantry at {address}",
                 description=description,
                 user_id=None,  # No user account required
@@ -1909,6 +1660,9 @@ def submit_location():
             )
             
             db.session.add(new_location)
+            db.session.flush()
+            # Addresses typed without picking a suggestion are geocoded in the background
+            enqueue_geocode(new_location)
             db.session.commit()
             
             # Upload photo to S3 (if provided)
@@ -25,6 +25,8 @@ class Config:
     S3_LOCATION = f'http://{S3_BUCKET}.s3.amazonaws.com/'
     # TODO - handle oversized uploads
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB upload limit (adjust as needed)
+    # Shared cache (see app/cache.py): a redis:// URL, or unset to use the database
+    CACHE_URL = os.getenv("CACHE_URL")
 
 
 class ProductionConfig(Config):
@@ -42,3 +44,10 @@ class DevelopmentConfig(Config):
     DEBUG = True
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///database.db")
+
+
+class TestingConfig(Config):
+    FLASK_ENV = 'testing'
+    TESTING = True
+    SECRET_KEY = 'testing'
+    SQLALCHEMY_DATABASE_URI = os.getenv("TEST_DATABASE_URL", "sqlite://")
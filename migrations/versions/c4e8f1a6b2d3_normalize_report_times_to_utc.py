@@ -0,0 +1,62 @@
+"""normalize report times to utc
+
+Revision ID: c4e8f1a6b2d3
+Revises: 71d3c8b5e0a9
+Create Date: 2026-10-17 21:05:12.604219
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8f1a6b2d3'
+down_revision = '71d3c8b5e0a9'
+branch_labels = None
+depends_on = None
+
+# How SQLAlchemy stores datetimes in SQLite
+SQLITE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+BATCH_SIZE = 1000
+
+
+def _as_utc_text(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime(SQLITE_FORMAT)
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        # TIMESTAMP WITH TIME ZONE holds instants; only a column left without a zone needs converting
+        columns = {column['name']: column for column in sa.inspect(connection).get_columns('report')}
+        if not getattr(columns['time']['type'], 'timezone', False):
+            op.alter_column('report', 'time', type_=sa.DateTime(timezone=True), existing_type=sa.DateTime(),
+                            postgresql_using="time AT TIME ZONE 'UTC'")
+        return
+
+    # SQLite keeps whatever text was written: rewrite ISO strings with a 'T' or an
+    # offset as UTC wall-clock times, the format the app writes and compares against
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            "SELECT id, time FROM report WHERE id > :last_id AND time IS NOT NULL ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        for report_id, value in rows:
+            if isinstance(value, str):
+                normalized = _as_utc_text(value)
+                if normalized != value:
+                    connection.execute(sa.text("UPDATE report SET time = :time WHERE id = :id"),
+                                       {'time': normalized, 'id': report_id})
+        last_id = rows[-1][0]
+    # Rebuild the rollups with `flask rebuild-rollups` after upgrading
+
+
+def downgrade():
+    # The original offsets are not kept; the UTC values are equivalent
+    pass
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared cache used by the nationwide and per-pantry analytics
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report
+from app.cache import DatabaseCache, cached, cache_stats, flush_counts, get_cache
+from app.analytics import NATIONWIDE_CACHE, PANTRY_CACHE, most_viewed_pantries, pantry_cache_name
+from app.views import warm_pantry_analytics
+from config.config import TestingConfig
+
+
+def make_app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def test_database_store_behaves_like_redis():
+    app = make_app()
+
+    with app.app_context():
+        store = DatabaseCache(db.engine)
+        assert store.get('missing') is None
+        assert store.set('greeting', 'hello') is True
+        assert store.get('greeting') == b'hello'
+
+        assert store.set('lock', 'first', ex=30, nx=True) is True
+        assert store.set('lock', 'second', ex=30, nx=True) is False
+        assert store.get('lock') == b'first'
+
+        # An expired key is gone, and can be taken again with nx
+        store.set('lock', 'old', ex=1)
+        db.session.execute(store.table.update().values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)))
+        db.session.commit()
+        assert store.get('lock') is None
+        assert store.set('lock', 'new', ex=30, nx=True) is True
+
+        assert [store.incr('counter') for _ in range(3)] == [1, 2, 3]
+        assert store.incr('counter', 7) == 10
+        store.set('counter', 3)
+        assert store.get('counter') == b'3'
+        assert store.delete('counter', 'greeting') == 2
+        assert store.get('counter') is None
+        assert store.mget(['lock', 'missing']) == [b'new', None]
+
+
+def test_cached_values_are_shared_until_a_write_commits():
+    app = make_app()
+
+    with app.app_context():
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {'computed': len(calls)}
+
+        assert cached('example', compute, ttl=60) == {'computed': 1}
+        assert cached('example', compute, ttl=60) == {'computed': 1}
+        assert len(calls) == 1
+
+        # A committed report makes the nationwide analytics stale
+        location = Location(name="Corner Pantry", address="5 Oak Ave", city="Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.commit()
+        assert cached(NATIONWIDE_CACHE, compute, ttl=60) == {'computed': 2}
+        db.session.add(Report(location_id=location.id, pantry_fullness=40, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        assert cached(NATIONWIDE_CACHE, compute, ttl=60) == {'computed': 3}
+        assert cached(NATIONWIDE_CACHE, compute, ttl=60) == {'computed': 3}
+
+        # A rolled back write does not
+        db.session.add(Report(location_id=location.id, pantry_fullness=90, time=datetime.now(timezone.utc)))
+        db.session.flush()
+        db.session.rollback()
+        assert cached(NATIONWIDE_CACHE, compute, ttl=60) == {'computed': 3}
+
+        # While another worker holds the lock the stale value is served
+        get_cache().incr(f"{NATIONWIDE_CACHE}:generation")
+        assert get_cache().set(f"{NATIONWIDE_CACHE}:lock", 'other-worker', ex=30, nx=True)
+        assert cached(NATIONWIDE_CACHE, compute, ttl=60) == {'computed': 3}
+        assert len(calls) == 3
+
+        # Expired by TTL
+        assert cached('short', compute, ttl=0.01) == {'computed': 4}
+        time.sleep(0.02)
+        assert cached('short', compute, ttl=0.01) == {'computed': 5}
+
+
+def test_nationwide_endpoint_uses_cache():
+    app = make_app()
+
+    with app.app_context():
+        client = app.test_client()
+        location = Location(name="Corner Pantry", address="5 Oak Ave", city="Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.commit()
+        for hours, fullness in ((30, 20), (2, 80)):
+            db.session.add(Report(location_id=location.id, pantry_fullness=fullness,
+                                  time=datetime.now(timezone.utc) - timedelta(hours=hours)))
+        db.session.commit()
+
+        first = client.get('/api/nationwide-analytics').get_json()
+        assert first['success'] and first['analytics']['network_overview']['total_reports'] == 2
+        assert isinstance(first['analytics']['date_range']['start'], str)
+        # The second request is served from the cache (and the cached copy was not modified)
+        assert client.get('/api/nationwide-analytics').get_json() == first
+        assert client.get('/status').status_code == 200
+
+        db.session.add(Report(location_id=location.id, pantry_fullness=50, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        refreshed = client.get('/api/nationwide-analytics').get_json()
+        assert refreshed['analytics']['network_overview']['total_reports'] == 3
+
+
+def test_pantry_analytics_cache():
+    app = make_app()
+
+    with app.app_context():
+        client = app.test_client()
+        busy = Location(name="Busy", address="5 Oak Ave", city="Springfield", state="IL", zip=62701)
+        quiet = Location(name="Quiet", address="7 Elm St", city="Springfield", state="IL", zip=62701)
+        db.session.add_all([busy, quiet])
+        db.session.commit()
+        for location in (busy, quiet):
+            for hours, fullness in ((30, 20), (2, 80)):
+                db.session.add(Report(location_id=location.id, pantry_fullness=fullness,
+                                      time=datetime.now(timezone.utc) - timedelta(hours=hours)))
+        db.session.commit()
+
+        first = client.get(f'/api/analytics/{busy.id}').get_json()
+        assert first['success'] and first['analytics']['total_reports'] == 2
+        assert client.get(f'/api/analytics/{busy.id}').get_json() == first
+        assert client.get(f'/location/{busy.id}').status_code == 200
+        assert cache_stats(PANTRY_CACHE) == {'hits': 2, 'misses': 1}
+
+        # A new report changes the latest report id, so the next view recomputes
+        db.session.add(Report(location_id=busy.id, pantry_fullness=50, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        assert client.get(f'/api/analytics/{busy.id}').get_json()['analytics']['total_reports'] == 3
+        assert cache_stats(PANTRY_CACHE) == {'hits': 2, 'misses': 2}
+
+        # Editing an old report keeps the key but invalidates the pantry's entry
+        Report.query.filter_by(location_id=busy.id, pantry_fullness=20).one().pantry_fullness = 10
+        db.session.commit()
+        assert client.get(f'/api/analytics/{busy.id}').get_json()['analytics']['fullness_stats']['minimum'] == 10
+
+        client.get(f'/api/analytics/{quiet.id}')
+        flush_counts()
+        assert most_viewed_pantries(get_cache(), 5) == [busy.id, quiet.id]
+        assert most_viewed_pantries(get_cache(), 1) == [busy.id]
+
+        # Warming fills missing entries without counting as traffic
+        get_cache().delete(pantry_cache_name(busy.id))
+        before = cache_stats(PANTRY_CACHE)
+        assert warm_pantry_analytics(limit=1) == [busy.id]
+        assert cache_stats(PANTRY_CACHE) == before
+        client.get(f'/api/analytics/{busy.id}')
+        assert cache_stats(PANTRY_CACHE)['hits'] == before['hits'] + 1
+
+
+def test_views_are_counted_in_memory_until_flushed():
+    app = make_app()
+    app.config['COUNTER_FLUSH_SECONDS'] = 3600
+
+    with app.app_context():
+        client = app.test_client()
+        location = Location(name="Counted", address="9 Pine St", city="Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.commit()
+        for hours, fullness in ((30, 20), (2, 80)):
+            db.session.add(Report(location_id=location.id, pantry_fullness=fullness,
+                                  time=datetime.now(timezone.utc) - timedelta(hours=hours)))
+        db.session.commit()
+
+        for _ in range(3):
+            client.get(f'/api/analytics/{location.id}')
+        store = get_cache()
+        assert store.get(f"{PANTRY_CACHE}:views:{location.id}") is None
+        assert store.get(f"{PANTRY_CACHE}:hits") is None
+
+        flush_counts()
+        assert store.get(f"{PANTRY_CACHE}:views:{location.id}") == b'3'
+        assert cache_stats(PANTRY_CACHE) == {'hits': 2, 'misses': 1}
+
+
+if __name__ == "__main__":
+    test_database_store_behaves_like_redis()
+    test_cached_values_are_shared_until_a_write_commits()
+    test_nationwide_endpoint_uses_cache()
+    test_pantry_analytics_cache()
+    test_views_are_counted_in_memory_until_flushed()
+    print("Cache tests passed")
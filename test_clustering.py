@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the server-side marker clusters kept in map_cluster_cell
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report, MapClusterCell
+from app.clustering import rebuild_clusters, clusters_in_view, MAX_CLUSTER_ZOOM
+from config.config import TestingConfig
+
+
+def cell_snapshot():
+    """Non-empty cells as {(zoom, x, y): (count, full, low, empty, unknown, lat_sum, lon_sum)}"""
+    return {
+        (cell.zoom, cell.cell_x, cell.cell_y): (
+            cell.pantry_count, cell.full_count, cell.low_count, cell.empty_count, cell.unknown_count,
+            cell.latitude_micro_sum, cell.longitude_micro_sum)
+        for cell in MapClusterCell.query.filter(MapClusterCell.pantry_count > 0)
+    }
+
+
+def add_pantry(name, latitude, longitude, fullness=None):
+    location = Location(name=name, address=f"1 {name} St", city="Springfield", state="IL",
+                        zip=62701, latitude=latitude, longitude=longitude)
+    db.session.add(location)
+    db.session.flush()
+    if fullness is not None:
+        db.session.add(Report(location_id=location.id, pantry_fullness=fullness,
+                              time=datetime.now(timezone.utc) - timedelta(hours=1)))
+    db.session.commit()
+    return location
+
+
+def test_incremental_clusters_match_rebuild():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        springfield = add_pantry("Springfield", 39.80, -89.65, 90)
+        add_pantry("Chatham", 39.68, -89.70, 10)
+        add_pantry("Chicago", 41.88, -87.63, 50)
+        add_pantry("Unreported", 39.78, -89.60)
+        add_pantry("Ungeocoded", None, None, 80)
+
+        # New report flips Springfield from full to low
+        db.session.add(Report(location_id=springfield.id, pantry_fullness=30,
+                              time=datetime.now(timezone.utc)))
+        db.session.commit()
+
+        # Chatham moves back and forth before settling in Seattle, Chicago is removed
+        chatham = Location.query.filter_by(name="Chatham").one()
+        for latitude, longitude in ((40.01, -89.71), (39.68, -89.70)) * 5:
+            chatham.latitude, chatham.longitude = latitude, longitude
+            db.session.commit()
+        chatham.latitude, chatham.longitude = 47.6, -122.3
+        db.session.delete(Location.query.filter_by(name="Chicago").one())
+        db.session.commit()
+
+        # Sums are integers, so the moves leave no rounding drift
+        incremental = cell_snapshot()
+        assert rebuild_clusters() == 3
+        assert cell_snapshot() == incremental
+
+        # Zoomed all the way out every pantry is still counted exactly once
+        total = sum(cluster['count'] for cluster in clusters_in_view(0))
+        assert total == 3
+
+
+def test_clusters_endpoint():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        add_pantry("A", 39.80, -89.65, 90)
+        add_pantry("B", 39.81, -89.66, 10)
+        add_pantry("C", 39.79, -89.64)
+        add_pantry("Far", 47.6, -122.3, 50)
+        client = app.test_client()
+
+        clusters = client.get('/api/clusters?zoom=4&bbox=-91,38,-88,41').get_json()['clusters']
+        assert len(clusters) == 1
+        cluster = clusters[0]
+        assert cluster['count'] == 3
+        assert cluster['status_counts'] == {'full': 1, 'low': 0, 'empty': 1, 'unknown': 1}
+        assert (cluster['worst_status'], cluster['best_status']) == ('empty', 'full')
+        assert abs(cluster['latitude'] - 39.80) < 1e-6
+
+        # Zoom levels past the finest grid are served from it; Seattle stays out of the box
+        finest = client.get(f'/api/clusters?zoom={MAX_CLUSTER_ZOOM + 5}&bbox=-91,38,-88,41').get_json()
+        assert finest['zoom'] == MAX_CLUSTER_ZOOM + 5
+        assert sum(cluster['count'] for cluster in finest['clusters']) == 3
+
+        assert client.get('/api/clusters?bbox=-91,38,-88,41').status_code == 400
+        assert client.get('/api/clusters?zoom=3&bbox=1,2').status_code == 400
+
+
+if __name__ == "__main__":
+    test_incremental_clusters_match_rebuild()
+    test_clusters_endpoint()
+    print("Clustering tests passed")
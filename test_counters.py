@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the homepage counters kept in site_counter
+"""
+
+import os
+import sys
+from datetime import datetime, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Location, Report, SiteCounter
+from app.counters import homepage_stats, reconcile_counters
+from config.config import TestingConfig
+
+
+def add_location(name, state):
+    location = Location(name=name, address=f"1 {name} St", city="Springfield", state=state, zip=62701)
+    db.session.add(location)
+    db.session.commit()
+    return location
+
+
+def add_report(location, fullness):
+    report = Report(location_id=location.id, pantry_fullness=fullness, time=datetime.now(timezone.utc))
+    db.session.add(report)
+    db.session.commit()
+    return report
+
+
+def test_counters_follow_writes():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        north = add_location("North", "IL")
+        # Nothing stored yet: the first read computes the counters
+        assert homepage_stats() == {'total_pantries': 1, 'total_reports': 0, 'states_covered': 1, 'empty_alerts': 0}
+
+        south, west = add_location("South", "IL"), add_location("West", "CA")
+        add_report(north, 20)
+        low = add_report(south, 30)
+        add_report(west, 90)
+        add_report(west, None)
+        assert homepage_stats() == {'total_pantries': 3, 'total_reports': 4, 'states_covered': 2, 'empty_alerts': 2}
+
+        db.session.expire_all()
+        low.pantry_fullness = 80
+        west.state = "OR"
+        Report.query.filter_by(pantry_fullness=20).one().pantry_fullness = 10
+        db.session.commit()
+        assert homepage_stats()['empty_alerts'] == 1
+        assert homepage_stats()['states_covered'] == 2
+
+        db.session.delete(Report.query.filter_by(pantry_fullness=10).one())
+        db.session.delete(south)
+        db.session.commit()
+        stats = homepage_stats()
+        assert stats == {'total_pantries': 2, 'total_reports': 3, 'states_covered': 2, 'empty_alerts': 0}
+        assert reconcile_counters() == {}
+
+        # Core writes bypass the events until reconciled
+        db.session.execute(Report.__table__.insert(), [{'location_id': north.id, 'pantry_fullness': 5,
+                                                       'time': datetime.now(timezone.utc)}])
+        db.session.commit()
+        assert reconcile_counters() == {'total_reports': (3, 4), 'empty_alerts': (0, 1)}
+        assert homepage_stats()['total_reports'] == 4
+
+
+def test_homepage_runs_no_aggregate_queries():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        add_report(add_location("North", "IL"), 20)
+        client = app.test_client()
+        client.get('/')
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        response = client.get('/')
+        assert response.status_code == 200
+        assert not [statement for statement in statements if 'count(' in statement.lower()]
+        assert SiteCounter.query.count() == 4
+
+
+if __name__ == "__main__":
+    test_counters_follow_writes()
+    test_homepage_runs_no_aggregate_queries()
+    print("Counter tests passed")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the report_food_item index and /api/food-items
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report, ReportFoodItem
+from app.food_items import extract_food_items, backfill_food_items, top_food_items
+from config.config import TestingConfig
+
+
+def index_snapshot():
+    return sorted((row.report_id, row.location_id, row.normalized_item) for row in ReportFoodItem.query)
+
+
+def add_report(location, time, items, fullness=50):
+    report = Report(location_id=location.id, pantry_fullness=fullness, time=time,
+                    vision_analysis=json.dumps({'food_items': items, 'fullness_estimate': fullness}))
+    db.session.add(report)
+    db.session.commit()
+    return report
+
+
+def test_extract_food_items():
+    assert extract_food_items(json.dumps({'food_items': ['Canned  Beans', ' rice ', '', 7]})) == ['canned beans', 'rice']
+    assert extract_food_items(json.dumps({'food_items': [{'description': 'Pasta', 'score': 0.9}, {'score': 1}]})) == ['pasta']
+    assert extract_food_items('not json') == []
+    assert extract_food_items(json.dumps({'error': 'quota'})) == []
+    assert extract_food_items(None) == []
+
+
+def test_index_follows_writes_and_backfill():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        now = datetime.now(timezone.utc)
+        north = Location(name="North", address="1 Oak Ave", city="Springfield", state="IL", zip=62701)
+        west = Location(name="West", address="2 Elm St", city="Fresno", state="CA", zip=93650)
+        db.session.add_all([north, west])
+        db.session.commit()
+
+        add_report(north, now - timedelta(days=40), ['Rice', 'pasta', 'rice'])
+        edited = add_report(north, now - timedelta(days=3), ['soup'])
+        add_report(west, now - timedelta(days=1), [{'description': 'Pasta'}, 'Tuna'])
+        removed = add_report(west, now - timedelta(hours=2), ['cereal'])
+
+        edited.vision_analysis = json.dumps({'food_items': ['Soup', 'Pasta']})
+        db.session.delete(removed)
+        db.session.commit()
+
+        assert top_food_items() == [('pasta', 3), ('rice', 2), ('soup', 1), ('tuna', 1)]
+        assert top_food_items(limit=1, location_id=north.id) == [('rice', 2)]
+        assert top_food_items(state='CA') == [('pasta', 1), ('tuna', 1)]
+        assert top_food_items(since=now - timedelta(days=7)) == [('pasta', 2), ('soup', 1), ('tuna', 1)]
+
+        incremental = index_snapshot()
+        db.session.execute(ReportFoodItem.__table__.delete())
+        db.session.commit()
+        assert backfill_food_items(batch_size=2) == len(incremental) == 7
+        assert index_snapshot() == incremental
+
+        db.session.delete(west)
+        db.session.commit()
+        assert {location_id for _, location_id, _ in index_snapshot()} == {north.id}
+
+
+def test_food_items_endpoint():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+
+        now = datetime.now(timezone.utc)
+        location = Location(name="Corner", address="5 Oak Ave", city="Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.commit()
+        add_report(location, now - timedelta(days=60), ['rice', 'rice'])
+        add_report(location, now - timedelta(days=2), ['beans'])
+
+        body = client.get('/api/food-items').get_json()
+        assert body == {'scope': 'network', 'window': 'all',
+                        'items': [{'item': 'rice', 'count': 2}, {'item': 'beans', 'count': 1}]}
+        assert client.get('/api/food-items?scope=state:IL&window=30d').get_json()['items'] == [{'item': 'beans', 'count': 1}]
+        assert client.get(f'/api/food-items?scope=location:{location.id}&limit=1').get_json()['items'] == [{'item': 'rice', 'count': 2}]
+        assert client.get('/api/food-items?scope=state:CA').get_json()['items'] == []
+
+        assert client.get('/api/food-items?window=2w').status_code == 400
+        assert client.get('/api/food-items?scope=county:cook').status_code == 400
+        assert client.get('/api/food-items?limit=0').status_code == 400
+        assert client.get('/api/food-items?scope=location:999').status_code == 404
+
+
+if __name__ == "__main__":
+    test_extract_food_items()
+    test_index_follows_writes_and_backfill()
+    test_food_items_endpoint()
+    print("Food item tests passed")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Tests for the background geocoding queue, using a local stub geocoder
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, GeocodeJob, GeocodeCache, StatusEvent
+from app.geocoding import enqueue_geocode, process_geocode_jobs, normalize_address, geocode_and_cache
+from app.geocode_backfill import backfill_coordinates, TokenBucket
+from app.spatial import grid_cell_for
+from app.clustering import clusters_in_view
+from app.cache import get_cache
+from app.analytics import NATIONWIDE_CACHE
+from config.config import TestingConfig
+
+Point = namedtuple('Point', ['latitude', 'longitude'])
+
+
+class StubGeocoder:
+    """Answers from a fixed table and records every address it was asked about"""
+
+    def __init__(self, known=None, failing=None):
+        self.known = known or {}
+        self.failing = failing or set()
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        if address in self.failing:
+            raise RuntimeError("service unavailable")
+        return self.known.get(address)
+
+
+def make_app(geocoder):
+    app = create_app(TestingConfig)
+    app.config['GEOCODER'] = geocoder
+    app.config['GEOCODER_MIN_DELAY_SECONDS'] = 0
+    return app
+
+
+def add_location(address, latitude=None, longitude=None):
+    location = Location(name=f"Pantry at {address}", address=address, city="Springfield",
+                        state="IL", zip=62701, latitude=latitude, longitude=longitude)
+    db.session.add(location)
+    db.session.commit()
+    return location
+
+
+def test_worker_fills_coordinates_and_caches():
+    geocoder = StubGeocoder(known={"1 Main St, Springfield, IL 62701": Point(39.8, -89.6)})
+    app = make_app(geocoder)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        located = add_location("2 Main St", 40.0, -89.0)
+        assert enqueue_geocode(located) is None
+
+        first = add_location("1 Main St")
+        enqueue_geocode(first)
+        db.session.commit()
+        # Enqueuing twice keeps a single pending job
+        enqueue_geocode(first)
+        db.session.commit()
+        assert GeocodeJob.query.filter_by(location_id=first.id, status='pending').count() == 1
+
+        stats = process_geocode_jobs()
+        assert stats['done'] == 1
+        assert (first.latitude, first.longitude) == (39.8, -89.6)
+        assert GeocodeCache.query.get(normalize_address("1 main st springfield il 62701")).latitude == 39.8
+
+        # The same address (different punctuation) is served from the cache
+        db.session.delete(first)
+        db.session.commit()
+        second = add_location("1 Main St.")
+        enqueue_geocode(second)
+        db.session.commit()
+        stats = process_geocode_jobs()
+        assert stats['cache_hits'] == 1
+        assert second.latitude == 39.8
+        assert len(geocoder.calls) == 1
+
+
+def test_failures_are_retried_then_given_up():
+    geocoder = StubGeocoder(failing={"3 Main St, Springfield, IL 62701"})
+    app = make_app(geocoder)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        location = add_location("3 Main St")
+        missing = add_location("4 Nowhere Rd")
+        enqueue_geocode(location)
+        enqueue_geocode(missing)
+        db.session.commit()
+
+        stats = process_geocode_jobs()
+        assert stats == {'done': 0, 'failed': 1, 'retried': 1, 'cache_hits': 0}
+
+        process_geocode_jobs()
+        process_geocode_jobs()
+        job = GeocodeJob.query.filter_by(location_id=location.id).one()
+        assert (job.status, job.attempts) == ('failed', 3)
+        # Errors are not cached, "not found" is
+        assert GeocodeCache.query.count() == 1
+        assert location.latitude is None
+
+
+def test_cache_write_replaces_a_concurrent_entry():
+    """A row stored for the same address after the cache lookup (e.g. by the backfill) is replaced, not duplicated"""
+    geocoder = StubGeocoder(known={"5 Main St, Springfield, IL 62701": Point(39.7, -89.5)})
+    app = make_app(geocoder)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        key = normalize_address("5 Main St, Springfield, IL 62701")
+        db.session.add(GeocodeCache(normalized_address=key, latitude=None, longitude=None))
+        db.session.commit()
+
+        assert geocode_and_cache("5 Main St, Springfield, IL 62701") == (39.7, -89.5)
+        db.session.commit()
+        db.session.expire_all()
+        assert (GeocodeCache.query.get(key).latitude, GeocodeCache.query.count()) == (39.7, 1)
+
+
+def test_add_location_enqueues_instead_of_geocoding():
+    geocoder = StubGeocoder()
+    app = make_app(geocoder)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        client = app.test_client()
+        client.post('/location/add/', data={
+            'name': 'Corner Pantry', 'address': '5 Oak Ave', 'city': 'Springfield',
+            'state': 'IL', 'zipCode': '62701', 'latitude': '', 'longitude': ''
+        })
+        location = Location.query.filter_by(address='5 Oak Ave').one()
+        assert GeocodeJob.query.filter_by(location_id=location.id, status='pending').count() == 1
+
+        # The map endpoint never calls the geocoder
+        assert client.get('/get_pantry_data').status_code == 200
+        assert geocoder.calls == []
+
+
+def test_backfill_geocodes_in_bulk_and_resumes():
+    known = {f"{i} Main St, Springfield, IL 62701": Point(39.0 + i / 1000, -89.0) for i in range(1, 121)}
+    geocoder = StubGeocoder(known=known, failing={"7 Main St, Springfield, IL 62701"})
+    app = make_app(geocoder)
+    checkpoint = os.path.join(tempfile.mkdtemp(), 'backfill.json')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Location.__table__.insert(), [
+            {'id': i, 'name': f"Pantry {i}", 'address': f"{i} Main St", 'city': 'Springfield',
+             'state': 'IL', 'zip': 62701}
+            for i in range(1, 151)
+        ] + [
+            # Same address as pantry 1
+            {'id': 151, 'name': "Pantry 1 annex", 'address': "1 Main St.", 'city': 'Springfield',
+             'state': 'IL', 'zip': 62701},
+        ])
+        add_location("9 Elm St", 40.0, -88.0)
+        db.session.add(GeocodeCache(normalized_address=normalize_address("2 Main St, Springfield, IL 62701"),
+                                    latitude=39.5, longitude=-89.5))
+        db.session.commit()
+
+        preview = backfill_coordinates(dry_run=True, rate=1000, checkpoint_path=checkpoint)
+        # A dry run caches nothing, so pantry 151 still counts as a request
+        assert (preview['scanned'], preview['cache_hits'], preview['geocoded']) == (151, 1, 150)
+        assert geocoder.calls == [] and not os.path.exists(checkpoint)
+        assert Location.query.filter(Location.latitude.isnot(None)).count() == 1
+
+        generation = int(get_cache().get(f"{NATIONWIDE_CACHE}:generation") or 0)
+        stats = backfill_coordinates(batch_size=40, workers=8, rate=1000, checkpoint_path=checkpoint, limit=100)
+        assert stats['scanned'] == 100
+        # Each batch streams its pantries to open maps and invalidates the nationwide analytics
+        streamed = [event.location_id for event in StatusEvent.query.filter_by(kind='location')
+                    if json.loads(event.payload)['latitude'] is not None and event.location_id <= 100]
+        assert sorted(streamed) == [i for i in range(1, 101) if i != 7]
+        assert int(get_cache().get(f"{NATIONWIDE_CACHE}:generation")) == generation + 3
+        assert json.load(open(checkpoint))['last_id'] == 100
+        # Each committed batch is already on the cluster map, even though the run stopped early
+        located = Location.query.filter(Location.latitude.isnot(None)).count()
+        assert located == 100
+        assert sum(cluster['count'] for cluster in clusters_in_view(0)) == located
+
+        stats = backfill_coordinates(batch_size=40, workers=8, rate=1000, checkpoint_path=checkpoint)
+        assert stats['scanned'] == 51
+        # Pantry 151 shares pantry 1's cached answer; 121-150 are unknown, 7 failed
+        assert Location.query.get(151).latitude == Location.query.get(1).latitude == 39.001
+        assert Location.query.get(2).latitude == 39.5
+        assert Location.query.get(7).latitude is None and Location.query.get(130).latitude is None
+        assert Location.query.get(50).grid_cell == grid_cell_for(39.05, -89.0)
+        assert len(geocoder.calls) == 149
+        assert len(set(geocoder.calls)) == 149
+
+        # Starting over only revisits the still-missing ones, answering "not found" from the cache
+        geocoder.failing = set()
+        stats = backfill_coordinates(rate=1000, checkpoint_path=checkpoint, restart=True)
+        assert (stats['scanned'], stats['updated'], stats['cache_hits'], stats['geocoded']) == (31, 1, 30, 1)
+        assert Location.query.get(7).latitude == 39.007
+
+
+def test_token_bucket_enforces_rate():
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 10 / 50 * 0.95
+
+
+if __name__ == "__main__":
+    test_worker_fills_coordinates_and_caches()
+    test_failures_are_retried_then_given_up()
+    test_cache_write_replaces_a_concurrent_entry()
+    test_add_location_enqueues_instead_of_geocoding()
+    test_backfill_geocodes_in_bulk_and_resumes()
+    test_token_bucket_enforces_rate()
+    print("Geocoding tests passed")
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the /get_pantry_data feed
+
+Seeds 1k, 10k and 50k locations (two reports each) into a scratch database and
+checks that building the map feed issues the same number of queries at every size.
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Location, Report, StatusEvent
+from app.map_data import build_pantry_feed, feed_state
+from app.spatial import grid_cell_for
+from app.models import MapSnapshot
+from app.feed_format import BINARY_MIMETYPE
+import numpy as np
+from config.config import TestingConfig
+
+BENCHMARK_SIZES = [1000, 10000, 50000]
+
+
+def seed_locations(count):
+    """Insert `count` locations with an older and a newer report each"""
+    db.drop_all()
+    db.create_all()
+
+    now = datetime.now(timezone.utc)
+    locations = []
+    for i in range(1, count + 1):
+        latitude, longitude = 39.0 + (i % 1000) / 1000, -89.0 - (i // 1000) / 100
+        locations.append({
+            'id': i,
+            'name': f"Pantry {i}",
+            'address': f"{i} Main St",
+            'city': 'Springfield',
+            'state': 'IL',
+            'zip': 62701,
+            'latitude': latitude,
+            'longitude': longitude,
+            'grid_cell': grid_cell_for(latitude, longitude),
+            'updated_at': now - timedelta(days=1),
+        })
+    db.session.execute(Location.__table__.insert(), locations)
+    db.session.execute(Report.__table__.insert(), [
+        {'location_id': i, 'pantry_fullness': (i * 7) % 101, 'time': now - timedelta(days=2)}
+        for i in range(1, count + 1)
+    ] + [
+        {'location_id': i, 'pantry_fullness': (i * 13) % 101, 'time': now - timedelta(hours=i % 48)}
+        for i in range(1, count + 1)
+    ])
+    db.session.commit()
+
+
+def count_queries(func):
+    """Run `func` and return (result, number of SQL statements, seconds)"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements), elapsed
+
+
+def test_feed_query_count_is_constant():
+    """The feed must not issue one query per location"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        query_counts = {}
+        for size in BENCHMARK_SIZES:
+            seed_locations(size)
+            db.session.expire_all()
+            feed, queries, elapsed = count_queries(build_pantry_feed)
+
+            assert len(feed) == size
+            # Every pantry should report its newest report, not the older one
+            assert feed[0]['fullness'] == (1 * 13) % 101
+            query_counts[size] = queries
+            print(f"{size:>6} locations: {queries} queries, {elapsed * 1000:.0f} ms")
+
+        assert len(set(query_counts.values())) == 1, query_counts
+        assert query_counts[BENCHMARK_SIZES[0]] == 1
+
+
+def test_feed_json_shape():
+    """The endpoint keeps the original keys and status/color mapping"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_locations(3)
+        # A location without any reports shows up as unknown
+        db.session.add(Location(name="No Reports", address="9 Elm St", city="Springfield",
+                                state="IL", zip=62701, latitude=39.5, longitude=-89.5))
+        db.session.commit()
+
+        response = app.test_client().get('/get_pantry_data')
+        pantries = response.get_json()
+
+        assert [p['id'] for p in pantries] == [1, 2, 3, 4]
+        assert set(pantries[0].keys()) == {
+            'id', 'name', 'latitude', 'longitude', 'address', 'description', 'contact_info',
+            'fullness', 'status', 'marker_color', 'lastUpdated'
+        }
+        assert pantries[0]['address'] == "1 Main St, Springfield, IL 62701"
+        assert (pantries[0]['fullness'], pantries[0]['status'], pantries[0]['marker_color']) == (13, 'empty', 'red')
+        assert (pantries[1]['fullness'], pantries[1]['status'], pantries[1]['marker_color']) == (26, 'low', 'yellow')
+        assert (pantries[3]['status'], pantries[3]['marker_color'], pantries[3]['lastUpdated']) == ('unknown', 'gray', None)
+
+
+def test_delta_polling_and_etag():
+    """Polling with a cursor returns only changed pantries; unchanged feeds answer 304"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_locations(5)
+        client = app.test_client()
+
+        response = client.get('/get_pantry_data')
+        etag = response.headers['ETag']
+        cursor = response.headers['X-Pantry-Cursor']
+        assert len(response.get_json()) == 5
+        assert client.get('/get_pantry_data', headers={'If-None-Match': etag}).status_code == 304
+
+        # Pantries changed within CURSOR_OVERLAP of the cursor are sent again; here all were seeded together
+        delta = client.get(f'/get_pantry_data?since={cursor}').get_json()
+        assert (delta['full'], delta['removed'], delta['cursor']) == (False, [], cursor)
+
+        # A new report sends that pantry, with its new status
+        db.session.add(Report(location_id=3, pantry_fullness=90, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        assert client.get('/get_pantry_data', headers={'If-None-Match': etag}).status_code == 200
+        delta = client.get(f'/get_pantry_data?since={cursor}').get_json()
+        assert ('full', 3) in [(p['status'], p['id']) for p in delta['pantries']]
+        assert delta['cursor'] != cursor
+
+        # Metadata edits are picked up from Location.updated_at
+        cursor = delta['cursor']
+        Location.query.get(4).name = "Renamed Pantry"
+        db.session.commit()
+        delta = client.get(f'/get_pantry_data?since={cursor}').get_json()
+        assert "Renamed Pantry" in [p['name'] for p in delta['pantries']]
+
+        # Deletions are listed from the status event log
+        cursor = delta['cursor']
+        db.session.delete(Location.query.get(5))
+        db.session.commit()
+        delta = client.get(f'/get_pantry_data?since={cursor}').get_json()
+        assert (delta['full'], delta['removed']) == (False, [5])
+        assert 5 not in [p['id'] for p in delta['pantries']]
+
+        # Unreadable cursors, and cursors older than the pruned event log, reload everything
+        assert client.get('/get_pantry_data?since=garbage').get_json()['full'] is True
+        cursor = delta['cursor']
+        db.session.add(Report(location_id=1, pantry_fullness=10, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        StatusEvent.query.delete()
+        db.session.commit()
+        delta = client.get(f'/get_pantry_data?since={cursor}').get_json()
+        assert delta['full'] is True and len(delta['pantries']) == 4
+
+
+def test_delta_lists_deletions_moves_and_late_commits():
+    """A delete plus an add, a pantry leaving the box and a late commit all reach the client"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_locations(5)
+        client = app.test_client()
+        bbox = '-89.01,38.9,-88.99,39.1'
+        cursor = client.get(f'/get_pantry_data?bbox={bbox}').headers['X-Pantry-Cursor']
+
+        # The location count is unchanged, but the deleted pantry is still reported
+        db.session.delete(Location.query.get(2))
+        db.session.add(Location(name="New Pantry", address="9 Main St", city="Springfield", state="IL",
+                                zip=62701, latitude=39.05, longitude=-89.0))
+        # Pantry 4 moves out of the box
+        moved = Location.query.get(4)
+        moved.latitude, moved.longitude = 47.6, -122.3
+        db.session.commit()
+
+        delta = client.get(f'/get_pantry_data?since={cursor}&bbox={bbox}').get_json()
+        assert delta['full'] is False
+        assert delta['removed'] == [2, 4]
+        assert "New Pantry" in [p['name'] for p in delta['pantries']]
+
+        # A write committed after the cursor was issued, stamped just before it, is still sent
+        cursor = delta['cursor']
+        late = feed_state().last_location_update - timedelta(seconds=2)
+        db.session.execute(Location.__table__.update().where(Location.__table__.c.id == 3)
+                           .values(name="Late Pantry", updated_at=late))
+        db.session.commit()
+        delta = client.get(f'/get_pantry_data?since={cursor}&bbox={bbox}').get_json()
+        assert "Late Pantry" in [p['name'] for p in delta['pantries']]
+
+
+def test_bbox_queries_use_grid_index():
+    """Viewport queries return exactly the pantries inside the box"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_locations(10000)
+        client = app.test_client()
+        bbox = (-89.035, 39.1, -89.015, 39.2)
+
+        pantries = client.get('/get_pantry_data?bbox=' + ','.join(str(v) for v in bbox)).get_json()
+        expected = [p for p in build_pantry_feed()
+                    if bbox[1] <= p['latitude'] <= bbox[3] and bbox[0] <= p['longitude'] <= bbox[2]]
+        assert 0 < len(pantries) < 10000
+        assert [p['id'] for p in pantries] == [p['id'] for p in expected]
+
+        limited = client.get('/get_pantry_data?limit=5&bbox=' + ','.join(str(v) for v in bbox)).get_json()
+        assert [p['id'] for p in limited] == [p['id'] for p in expected[:5]]
+        assert client.get('/get_pantry_data?bbox=1,2,3').status_code == 400
+
+        # The grid cell follows ORM edits
+        location = Location.query.get(1)
+        location.latitude, location.longitude = 47.6, -122.3
+        db.session.commit()
+        assert location.grid_cell == grid_cell_for(47.6, -122.3)
+        seattle = client.get('/get_pantry_data?bbox=-122.5,47.5,-122.2,47.7').get_json()
+        assert [p['id'] for p in seattle] == [1]
+
+
+def test_snapshot_is_served_until_a_write():
+    """The full feed is stored once, compressed, and only rebuilt after a write"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_locations(20)
+        client = app.test_client()
+
+        response = client.get('/get_pantry_data', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        pantries = json.loads(gzip.decompress(response.data))
+        assert pantries == build_pantry_feed()
+        plain = client.get('/get_pantry_data')
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.get_json() == pantries
+        # Each encoding has its own strong ETag
+        assert response.headers['ETag'] != plain.headers['ETag']
+        assert not response.headers['ETag'].startswith('W/')
+
+        # Unchanged: the small columns, then only the negotiated body; no feed query
+        db.session.expire_all()
+        response, queries, _ = count_queries(lambda: client.get('/get_pantry_data'))
+        assert queries == 2
+        assert response.get_json() == pantries
+        # A matching ETag never loads a body
+        db.session.expire_all()
+        headers = {'If-None-Match': response.headers['ETag']}
+        not_modified, queries, _ = count_queries(lambda: client.get('/get_pantry_data', headers=headers))
+        assert not_modified.status_code == 304
+        assert queries == 1
+        generated_at = MapSnapshot.query.get('pantry_feed').generated_at
+
+        db.session.add(Report(location_id=2, pantry_fullness=5, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        assert MapSnapshot.query.get('pantry_feed').stale
+
+        # Further writes leave an already stale snapshot row alone
+        updated = []
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE map_snapshot'):
+                updated.append(cursor.rowcount)
+
+        event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+        try:
+            db.session.add(Report(location_id=2, pantry_fullness=6, time=datetime.now(timezone.utc)))
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', after_cursor_execute)
+        assert updated and not any(updated)
+
+        refreshed = client.get('/get_pantry_data').get_json()
+        assert refreshed[1]['status'] == 'empty'
+        snapshot = MapSnapshot.query.get('pantry_feed')
+        assert not snapshot.stale and snapshot.generated_at != generated_at
+
+
+def decode_binary_feed(data):
+    """Python mirror of decodePantryFeed in map-new.js"""
+    assert data[:4] == b'PNTF'
+    version, count, dictionary_size = np.frombuffer(data, '<u4', 3, 4)
+    assert version == 1
+    offset = 16
+    columns = []
+    for dtype in ('<u4', '<f4', '<f4', '<u4', '<u4', '<u4', 'u1', 'u1'):
+        columns.append(np.frombuffer(data, dtype, count, offset))
+        offset += count * np.dtype(dtype).itemsize
+    offset += -offset % 4
+    text_length = int(np.frombuffer(data, '<u4', 1, offset)[0])
+    strings = data[offset + 4:offset + 4 + text_length].decode('utf-8').split('\0')
+    ids, latitudes, longitudes, updated, zips, localities, statuses, fullness = columns
+    return [{
+        'id': int(ids[i]),
+        'name': strings[dictionary_size + 2 * i],
+        'latitude': float(latitudes[i]),
+        'longitude': float(longitudes[i]),
+        'address': f"{strings[dictionary_size + 2 * i + 1]}, {strings[localities[i]]} {zips[i]}",
+        'status': ['unknown', 'full', 'low', 'empty'][statuses[i]],
+        'fullness': None if fullness[i] == 255 else int(fullness[i]),
+        'updated': int(updated[i]),
+    } for i in range(count)]
+
+
+def test_binary_feed_is_compact_and_complete():
+    """The columnar format carries what the map needs in a fraction of the bytes"""
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_locations(1000)
+        client = app.test_client()
+
+        as_json = client.get('/get_pantry_data')
+        as_binary = client.get('/get_pantry_data?format=binary')
+        assert as_binary.mimetype == BINARY_MIMETYPE
+        assert as_binary.headers['ETag'] != as_json.headers['ETag']
+        assert as_binary.headers['X-Pantry-Cursor'] == as_json.headers['X-Pantry-Cursor']
+        assert client.get('/get_pantry_data', headers={'Accept': BINARY_MIMETYPE}).data == as_binary.data
+        ratio = len(as_json.data) / len(as_binary.data)
+        print(f"JSON {len(as_json.data)} bytes, binary {len(as_binary.data)} bytes ({ratio:.1f}x)")
+        assert ratio >= 5
+
+        decoded = decode_binary_feed(as_binary.data)
+        for pantry, entry in zip(as_json.get_json(), decoded):
+            assert (entry['id'], entry['name'], entry['address']) == (pantry['id'], pantry['name'], pantry['address'])
+            assert (entry['status'], entry['fullness']) == (pantry['status'], pantry['fullness'])
+            assert abs(entry['latitude'] - pantry['latitude']) < 1e-5
+            assert entry['updated'] == int(datetime.fromisoformat(pantry['lastUpdated'])
+                                           .replace(tzinfo=timezone.utc).timestamp())
+
+        # Viewport queries can use it too; deltas stay JSON
+        boxed = decode_binary_feed(client.get('/get_pantry_data?format=binary&bbox=-89.01,39.0,-88.99,39.5').data)
+        assert 0 < len(boxed) < 1000
+        cursor = as_json.headers['X-Pantry-Cursor']
+        assert client.get(f'/get_pantry_data?format=binary&since={cursor}').get_json()['full'] is False
+
+
+if __name__ == "__main__":
+    test_feed_query_count_is_constant()
+    test_feed_json_shape()
+    test_delta_polling_and_etag()
+    test_delta_lists_deletions_moves_and_late_commits()
+    test_bbox_queries_use_grid_index()
+    test_snapshot_is_served_until_a_write()
+    test_binary_feed_is_compact_and_complete()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Parity test and benchmark for the SQL-based calculate_nationwide_analytics
+
+The test compares the new implementation with the original one (kept below as
+legacy_nationwide_analytics) on a synthetic network. Running this file directly
+benchmarks both on a 1M-report table (ANALYTICS_BENCHMARK_REPORTS to change it).
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy.orm import joinedload
+from app import create_app, db
+from app.models import Location, Report
+from app.helpers import get_state_full_name
+from app.analytics import calculate_nationwide_analytics, normalize_datetime
+from app.rollups import rebuild_rollups
+from app.food_items import backfill_food_items
+from config.config import TestingConfig
+
+STATES = ['IL', 'CA', 'NY', 'TX', 'WA', 'OH', 'GA', 'MI']
+FOODS = ['canned beans', 'pasta', 'rice', 'cereal', 'soup', 'peanut butter', 'tuna']
+
+
+def legacy_nationwide_analytics():
+    """
+    The original in-Python implementation, kept as the reference for parity checks
+    """
+    from datetime import datetime, timedelta
+    from collections import defaultdict
+    import statistics
+    
+    # Get all locations with their reports
+    locations = db.session.query(Location).options(joinedload(Location.reports)).all()
+    
+    if not locations:
+        return None
+    
+    # Filter out locations without reports
+    active_locations = [loc for loc in locations if loc.reports]
+    
+    if len(active_locations) < 1:
+        return None
+    
+    # Collect all reports for analysis
+    all_reports = []
+    for location in active_locations:
+        all_reports.extend(location.reports)
+    
+    if len(all_reports) < 2:
+        return None
+    
+    # Sort reports by time
+    all_reports.sort(key=lambda r: r.time)
+    
+    # Time range analysis - with safe datetime handling
+    try:
+        start_date = normalize_datetime(all_reports[0].time)
+        end_date = normalize_datetime(all_reports[-1].time)
+        days_active = (end_date - start_date).days + 1
+    except Exception as e:
+        print(f"Error calculating date range: {e}")
+        start_date = normalize_datetime(datetime.now(timezone.utc))
+        end_date = start_date
+        days_active = 1
+    
+    # Current status across all pantries
+    current_reports = []
+    for location in active_locations:
+        if location.reports:
+            current_reports.append(location.reports[-1])
+    
+    # Calculate current metrics
+    current_fullness_values = [r.pantry_fullness for r in current_reports if r.pantry_fullness is not None]
+    avg_current_fullness = statistics.mean(current_fullness_values) if current_fullness_values else 0
+    
+    # Count pantries by status
+    empty_pantries = sum(1 for r in current_reports if r.pantry_fullness is not None and r.pantry_fullness <= 33)
+    low_pantries = sum(1 for r in current_reports if r.pantry_fullness is not None and 33 < r.pantry_fullness <= 66)
+    full_pantries = sum(1 for r in current_reports if r.pantry_fullness is not None and r.pantry_fullness > 66)
+    
+    # Historical trends - use timezone-aware datetime
+    from datetime import timezone
+    now = datetime.now(timezone.utc)
+    recent_cutoff = now - timedelta(days=30)
+    last_week_cutoff = now - timedelta(days=7)
+    
+    recent_reports = safe_datetime_filter(all_reports, recent_cutoff)
+    last_week_reports = safe_datetime_filter(all_reports, last_week_cutoff)
+    
+    # Activity metrics
+    total_reports = len(all_reports)
+    reports_last_30_days = len(recent_reports)
+    reports_last_7_days = len(last_week_reports)
+    
+    # Average reports per location
+    avg_reports_per_location = total_reports / len(active_locations) if active_locations else 0
+    
+    # Time series data for charts (last 30 days) - safe datetime handling
+    daily_data = defaultdict(list)
+    for report in recent_reports:
+        try:
+            # Normalize the report time to handle timezone issues
+            normalized_time = normalize_datetime(report.time)
+            day_key = normalized_time.strftime('%Y-%m-%d')
+            if report.pantry_fullness is not None:
+                daily_data[day_key].append(report.pantry_fullness)
+        except Exception as e:
+            print(f"Error processing report {report.id} for chart data: {e}")
+            continue
+    
+    # Calculate daily averages
+    chart_data = []
+    for day in sorted(daily_data.keys()):
+        avg_fullness = statistics.mean(daily_data[day])
+        chart_data.append({
+            'date': day,
+            'avg_fullness': round(avg_fullness, 1),
+            'report_count': len(daily_data[day])
+        })
+    
+    # State/regional breakdown
+    def new_state_stats():
+        return {'locations': 0, 'reports': 0, 'avg_fullness': 0.0, 'fullness_values': []}
+    state_stats = defaultdict(new_state_stats)
+    for location in active_locations:
+        state = location.state
+        state_stats[state]['locations'] += 1
+        state_stats[state]['reports'] += len(location.reports)
+        
+        if location.reports:
+            latest_fullness = location.reports[-1].pantry_fullness
+            if latest_fullness is not None:
+                state_stats[state]['fullness_values'].append(latest_fullness)
+    
+    # Calculate state averages and convert to full state names
+    state_breakdown_with_full_names = {}
+    for state_abbrev, state_data in state_stats.items():
+        if state_data['fullness_values']:
+            state_data['avg_fullness'] = round(statistics.mean(state_data['fullness_values']), 1)
+        del state_data['fullness_values']  # Remove raw data
+        
+        # Use full state name as the key
+        full_state_name = get_state_full_name(state_abbrev)
+        state_breakdown_with_full_names[full_state_name] = state_data
+    
+    # Vision API analytics (if available)
+    vision_reports = [r for r in all_reports if r.vision_analysis]
+    food_items_detected = []
+    ai_fullness_scores = []
+    
+    for report in vision_reports:
+        try:
+            analysis = report.get_vision_analysis()
+            if analysis:
+                if 'food_items' in analysis and analysis['food_items']:
+                    # Extract food item descriptions from the dictionary objects
+                    for food_item in analysis['food_items']:
+                        if isinstance(food_item, dict) and 'description' in food_item:
+                            food_items_detected.append(food_item['description'])
+                        elif isinstance(food_item, str):
+                            food_items_detected.append(food_item)
+                if 'fullness_estimate' in analysis:
+                    ai_fullness_scores.append(analysis['fullness_estimate'])
+        except Exception as e:
+            print(f"Error processing vision analysis for report: {e}")
+            continue
+    
+    # Most common food items
+    from collections import Counter
+    common_foods = Counter(food_items_detected).most_common(10) if food_items_detected else []
+    
+    # Calculate trends (compare periods for more meaningful insights)
+    two_weeks_ago = now - timedelta(days=14)
+    one_week_ago = now - timedelta(days=7)
+    
+    # Get reports from different time periods
+    last_week_reports = safe_datetime_filter(all_reports, one_week_ago)
+    previous_week_reports = []
+    last_month_reports = safe_datetime_filter(all_reports, recent_cutoff)
+    
+    # Get reports from week before last (for week-over-week comparison)
+    for report in all_reports:
+        try:
+            normalized_time = normalize_datetime(report.time)
+            normalized_two_weeks = normalize_datetime(two_weeks_ago)
+            normalized_one_week = normalize_datetime(one_week_ago);
+            
+            if normalized_two_weeks <= normalized_time < normalized_one_week:
+                previous_week_reports.append(report)
+        except Exception as e:
+            print(f"Error processing report {report.id} for weekly comparison: {e}")
+            continue
+    
+    # Calculate empty vs full trends
+    def count_empty_full(reports):
+        empty = sum(1 for r in reports if r.pantry_fullness is not None and r.pantry_fullness <= 33)
+        full = sum(1 for r in reports if r.pantry_fullness is not None and r.pantry_fullness > 66)
+        return empty, full
+    
+    last_week_empty, last_week_full = count_empty_full(last_week_reports)
+    prev_week_empty, prev_week_full = count_empty_full(previous_week_reports)
+    
+    # Calculate trends
+    empty_trend = "stable"
+    full_trend = "stable"
+    
+    if prev_week_empty > 0:
+        empty_change = ((last_week_empty - prev_week_empty) / prev_week_empty) * 100
+        if empty_change > 10:
+            empty_trend = "increasing"
+        elif empty_change < -10:
+            empty_trend = "decreasing"
+    
+    if prev_week_full > 0:
+        full_change = ((last_week_full - prev_week_full) / prev_week_full) * 100
+        if full_change > 10:
+            full_trend = "increasing"
+        elif full_change < -10:
+            full_trend = "decreasing"
+    
+    # Overall fullness trend
+    old_fullness = [r.pantry_fullness for r in previous_week_reports if r.pantry_fullness is not None]
+    new_fullness = [r.pantry_fullness for r in last_week_reports if r.pantry_fullness is not None]
+    
+    fullness_trend = None
+    if old_fullness and new_fullness:
+        old_avg = statistics.mean(old_fullness)
+        new_avg = statistics.mean(new_fullness)
+        fullness_trend = new_avg - old_avg
+    
+    return {
+        'network_overview': {
+            'total_locations': len(locations),
+            'active_locations': len(active_locations),
+            'total_reports': total_reports,
+            'avg_reports_per_location': round(avg_reports_per_location, 1),
+            'days_active': days_active,
+            'reports_last_30_days': reports_last_30_days,
+            'reports_last_7_days': reports_last_7_days
+        },
+        'current_status': {
+            'avg_fullness': round(avg_current_fullness, 1),
+            'empty_pantries': empty_pantries,
+            'low_pantries': low_pantries,
+            'full_pantries': full_pantries,
+            'total_reporting': len(current_reports)
+        },
+        'trends': {
+            'fullness_trend_weekly': round(fullness_trend, 1) if fullness_trend is not None else None,
+            'empty_trend': empty_trend,
+            'full_trend': full_trend,
+            'last_week_empty': last_week_empty,
+            'last_week_full': last_week_full,
+            'prev_week_empty': prev_week_empty,
+            'prev_week_full': prev_week_full,
+            'community_engagement': 'high' if reports_last_7_days > reports_last_30_days / 3 else 'moderate' if reports_last_7_days > reports_last_30_days / 6 else 'low'
+        },
+        'chart_data': chart_data,
+        'state_breakdown': state_breakdown_with_full_names,
+        'ai_insights': {
+            'reports_with_ai': len(vision_reports),
+            'common_foods': common_foods,
+            'avg_ai_fullness': round(statistics.mean(ai_fullness_scores), 1) if ai_fullness_scores else None
+        },
+        'date_range': {
+            'start': normalize_datetime(start_date),
+            'end': normalize_datetime(end_date)
+        }
+    }
+
+
+def safe_datetime_filter(reports, cutoff_datetime):
+    """
+    Safely filter reports by datetime, handling timezone issues
+    """
+    filtered_reports = []
+    for report in reports:
+        try:
+            normalized_report_time = normalize_datetime(report.time)
+            normalized_cutoff = normalize_datetime(cutoff_datetime)
+            
+            if normalized_report_time >= normalized_cutoff:
+                filtered_reports.append(report)
+        except Exception as e:
+            # If there's an error with timezone conversion, skip this report
+            print(f"Error comparing datetime for report {report.id}: {e}")
+            continue
+    
+    return filtered_reports
+
+
+def seed_network(location_count, report_count, seed=7):
+    """Locations spread over a few states with reports over the last 90 days, oldest first"""
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    now = datetime.now(timezone.utc)
+    db.session.execute(Location.__table__.insert(), [
+        {'id': i, 'name': f"Pantry {i}", 'address': f"{i} Main St", 'city': 'Springfield',
+         'state': STATES[i % len(STATES)], 'zip': 62701}
+        for i in range(1, location_count + 1)
+    ])
+
+    # Every few locations have no reports at all
+    reporting = [i for i in range(1, location_count + 1) if i % 10 != 0]
+    offsets = sorted((rng.uniform(0, 90 * 24 * 3600) for _ in range(report_count)), reverse=True)
+    batch = []
+    for offset in offsets:
+        fullness = None if rng.random() < 0.05 else rng.randint(0, 100)
+        vision = None
+        if rng.random() < 0.1:
+            vision = json.dumps({
+                'food_items': [{'description': rng.choice(FOODS)} for _ in range(rng.randint(0, 3))],
+                'fullness_estimate': rng.randint(0, 100),
+            })
+        batch.append({'location_id': rng.choice(reporting), 'pantry_fullness': fullness,
+                      'time': now - timedelta(seconds=offset), 'vision_analysis': vision})
+        if len(batch) == 50000:
+            db.session.execute(Report.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Report.__table__.insert(), batch)
+    db.session.commit()
+    # Core inserts skip the ORM events that maintain the rollups and the food item index
+    rebuild_rollups()
+    backfill_food_items()
+
+
+def measure(func):
+    """Run `func` and return (result, seconds, peak MB allocated)"""
+    db.session.expire_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    db.session.expunge_all()
+    return result, elapsed, peak
+
+
+def test_sql_analytics_match_legacy():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        seed_network(200, 5000)
+        legacy = legacy_nationwide_analytics()
+        db.session.expunge_all()
+        current = calculate_nationwide_analytics()
+
+        assert current == legacy
+        assert current['network_overview']['active_locations'] == 180
+        assert current['ai_insights']['common_foods']
+
+
+def test_insufficient_data_returns_none():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        assert calculate_nationwide_analytics() is None
+
+        db.session.add(Location(name="Lonely", address="1 Main St", city="Springfield", state="IL", zip=62701))
+        db.session.commit()
+        assert calculate_nationwide_analytics() is None
+
+        db.session.add(Report(location_id=1, pantry_fullness=50, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        assert calculate_nationwide_analytics() is None
+
+
+def benchmark(report_count):
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed_network(report_count // 50, report_count)
+        print(f"Seeded {report_count} reports in {time.perf_counter() - start:.1f} s")
+
+        current, sql_seconds, sql_peak = measure(calculate_nationwide_analytics)
+        print(f"SQL aggregates: {sql_seconds:.2f} s, peak {sql_peak:.1f} MB")
+        legacy, legacy_seconds, legacy_peak = measure(legacy_nationwide_analytics)
+        print(f"Legacy loop:    {legacy_seconds:.2f} s, peak {legacy_peak:.1f} MB")
+        # The rolling 7/14/30-day windows move between the two runs, so only compare the rest
+        stable = ('current_status', 'state_breakdown', 'ai_insights', 'date_range')
+        same = all(current[key] == legacy[key] for key in stable)
+        print(f"Speedup: {legacy_seconds / sql_seconds:.1f}x, same status/state/AI results: {same}")
+
+
+if __name__ == "__main__":
+    test_sql_analytics_match_legacy()
+    test_insufficient_data_returns_none()
+    benchmark(int(os.environ.get('ANALYTICS_BENCHMARK_REPORTS', 1000000)))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for the k-nearest pantry index and /api/pantries/nearest
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report
+from app.map_data import FeedState
+from app.nearest import NearestPantryIndex, haversine_miles
+from config.config import TestingConfig
+
+INDEX_SIZE = 100000
+
+
+def brute_force(pantries, latitude, longitude, k, statuses=None):
+    candidates = [(haversine_miles(latitude, longitude, lat, lon), location_id)
+                  for location_id, (lat, lon, status) in pantries.items()
+                  if lat is not None and (statuses is None or status in statuses)]
+    return [location_id for _, location_id in sorted(candidates)[:k]]
+
+
+def test_index_matches_brute_force_at_100k():
+    rng = random.Random(42)
+    statuses = ['full', 'low', 'empty', 'unknown']
+    pantries = {i: (rng.uniform(25, 49), rng.uniform(-124, -67), rng.choice(statuses))
+                for i in range(1, INDEX_SIZE + 1)}
+
+    start = time.perf_counter()
+    index = NearestPantryIndex(FeedState(0, None, INDEX_SIZE, 0), pantries)
+    print(f"Built index over {INDEX_SIZE} pantries in {time.perf_counter() - start:.2f} s")
+
+    queries = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(200)]
+    start = time.perf_counter()
+    for latitude, longitude in queries:
+        index.nearest(latitude, longitude, 10)
+    per_query = (time.perf_counter() - start) / len(queries)
+    print(f"k=10 search: {per_query * 1000:.3f} ms per query")
+    assert per_query < 0.001
+
+    for latitude, longitude in queries[:20]:
+        assert index.nearest(latitude, longitude, 10) == brute_force(pantries, latitude, longitude, 10)
+        assert index.nearest(latitude, longitude, 5, {'full'}) == \
+            brute_force(pantries, latitude, longitude, 5, {'full'})
+
+    # Points on opposite sides of the antimeridian are neighbours
+    pantries = {1: (0.0, 179.9, 'full'), 2: (0.0, -179.9, 'full'), 3: (0.0, 170.0, 'full')}
+    index = NearestPantryIndex(FeedState(0, None, 3, 0), pantries)
+    assert index.nearest(0.0, -179.95, 2) == [2, 1]
+
+
+def add_pantry(name, latitude, longitude, fullness):
+    location = Location(name=name, address=f"1 {name} St", city="Springfield", state="IL",
+                        zip=62701, latitude=latitude, longitude=longitude)
+    db.session.add(location)
+    db.session.flush()
+    db.session.add(Report(location_id=location.id, pantry_fullness=fullness, time=datetime.now(timezone.utc)))
+    db.session.commit()
+    return location
+
+
+def test_nearest_endpoint_follows_writes():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        downtown = add_pantry("Downtown", 39.80, -89.65, 90)
+        add_pantry("Chatham", 39.68, -89.70, 10)
+        add_pantry("Chicago", 41.88, -87.63, 50)
+        client = app.test_client()
+
+        def nearest(query):
+            return client.get(f'/api/pantries/nearest?lat=39.79&lon=-89.64&{query}').get_json()['pantries']
+
+        pantries = nearest('k=2')
+        assert [p['name'] for p in pantries] == ["Downtown", "Chatham"]
+        assert pantries[0]['status'] == 'full'
+        assert 0 < pantries[0]['distance_miles'] < pantries[1]['distance_miles']
+        assert [p['name'] for p in nearest('k=3&status=low')] == ["Chicago"]
+
+        # A new closer pantry, a report and a move are picked up without restarting
+        add_pantry("Next Door", 39.7901, -89.6401, 80)
+        db.session.add(Report(location_id=downtown.id, pantry_fullness=0, time=datetime.now(timezone.utc)))
+        chicago = Location.query.filter_by(name="Chicago").one()
+        chicago.latitude, chicago.longitude = 39.791, -89.641
+        db.session.commit()
+        assert [p['name'] for p in nearest('k=3')] == ["Next Door", "Chicago", "Downtown"]
+        assert [p['name'] for p in nearest('k=1&status=empty,unknown')] == ["Downtown"]
+
+        db.session.delete(Location.query.filter_by(name="Next Door").one())
+        db.session.commit()
+        assert [p['name'] for p in nearest('k=1')] == ["Chicago"]
+
+        assert client.get('/api/pantries/nearest?lat=100&lon=0').status_code == 400
+        assert client.get('/api/pantries/nearest?lat=1&lon=1&status=open').status_code == 400
+        assert client.get('/api/pantries/nearest?lat=1&lon=1&k=0').status_code == 400
+
+
+def test_other_workers_writes_are_seen_after_the_refresh_interval():
+    app = create_app(TestingConfig)
+    app.config['NEAREST_REFRESH_SECONDS'] = 60
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        add_pantry("Downtown", 39.80, -89.65, 90)
+        far = add_pantry("Chicago", 41.88, -87.63, 50)
+        client = app.test_client()
+
+        def nearest():
+            return [p['name'] for p in client.get('/api/pantries/nearest?lat=39.79&lon=-89.64&k=1').get_json()['pantries']]
+
+        assert nearest() == ["Downtown"]
+        # Written by another worker: this worker's index doesn't look before the interval is up
+        with db.engine.begin() as connection:
+            connection.execute(Location.__table__.update().where(Location.id == far.id).values(
+                latitude=39.7901, longitude=-89.6401, updated_at=datetime.now(timezone.utc)))
+        assert nearest() == ["Downtown"]
+        app.config['NEAREST_REFRESH_SECONDS'] = 0
+        db.session.expire_all()
+        assert nearest() == ["Chicago"]
+
+
+def test_searches_run_while_the_index_changes():
+    rng = random.Random(7)
+    pantries = {i: (rng.uniform(25, 49), rng.uniform(-124, -67), 'full') for i in range(1, 2001)}
+    index = NearestPantryIndex(FeedState(0, None, len(pantries), 0), pantries)
+    errors = []
+
+    def search():
+        try:
+            for _ in range(300):
+                ids = index.nearest(rng.uniform(25, 49), rng.uniform(-124, -67), 5)
+                assert len(ids) == 5
+        except Exception as e:
+            errors.append(e)
+
+    searchers = [threading.Thread(target=search) for _ in range(4)]
+    for thread in searchers:
+        thread.start()
+    # Updates swap in a new view; searches keep reading the one they started with
+    for location_id in range(1, 1001):
+        index.discard([location_id])
+    for thread in searchers:
+        thread.join()
+    assert errors == []
+    assert all(location_id > 1000 for location_id in index.nearest(37.0, -95.0, 50))
+
+
+if __name__ == "__main__":
+    test_index_matches_brute_force_at_100k()
+    test_nearest_endpoint_follows_writes()
+    test_other_workers_writes_are_seen_after_the_refresh_interval()
+    test_searches_run_while_the_index_changes()
+    print("Nearest pantry tests passed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the restock and depletion events kept in pantry_event
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report, PantryEvent
+from app.pantry_events import backfill_pantry_events, classify, restocking, RESTOCK, DEPLETION
+from app.report_engine import ReportColumns, restocking as engine_restocking
+from config.config import TestingConfig
+
+START = datetime(2024, 3, 1, 8, tzinfo=timezone.utc)
+
+
+def events():
+    return sorted((event.report_id, event.location_id, event.kind, event.from_fullness, event.to_fullness,
+                   round(event.elapsed_hours, 6)) for event in PantryEvent.query)
+
+
+def add_report(location, hours, fullness):
+    report = Report(location_id=location.id, pantry_fullness=fullness, time=START + timedelta(hours=hours))
+    db.session.add(report)
+    db.session.commit()
+    return report
+
+
+def engine_section(location):
+    columns = ReportColumns.load(Report.location_id == location.id)
+    return engine_restocking(columns, columns.date_range()['days'])
+
+
+def test_classify():
+    assert classify(20, 51) == RESTOCK
+    assert classify(20, 50) is None
+    assert classify(80, 59) == DEPLETION
+    assert classify(80, 60) is None
+    assert classify(None, 90) is None and classify(10, None) is None
+
+
+def test_events_follow_writes_and_backfill():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        north = Location(name="North", address="1 Oak Ave", city="Springfield", state="IL", zip=62701)
+        west = Location(name="West", address="2 Elm St", city="Fresno", state="CA", zip=93650)
+        db.session.add_all([north, west])
+        db.session.commit()
+
+        for hours, fullness in ((0, 90), (20, 30), (30, 100), (30, 10), (200, None), (210, 80), (400, 10), (420, 95)):
+            add_report(north, hours, fullness)
+        assert [(event.kind, event.from_fullness, event.to_fullness) for event in
+                PantryEvent.query.order_by(PantryEvent.time, PantryEvent.report_id)] == [
+            (DEPLETION, 90, 30), (RESTOCK, 30, 100), (DEPLETION, 100, 10), (DEPLETION, 80, 10), (RESTOCK, 10, 95)]
+        assert restocking(north.id, 18) == engine_section(north)
+
+        # Back-dated, moved, edited and deleted reports re-derive their neighbours
+        add_report(north, 10, 5)
+        moved = add_report(west, 5, 20)
+        add_report(west, 50, 90)
+        edited = Report.query.filter_by(location_id=north.id, pantry_fullness=80).one()
+        edited.pantry_fullness = 0
+        moved.location_id = north.id
+        moved.time = START + timedelta(hours=300)
+        db.session.commit()
+        db.session.delete(Report.query.filter_by(location_id=north.id, pantry_fullness=100).one())
+        db.session.commit()
+
+        for location in (north, west):
+            columns = ReportColumns.load(Report.location_id == location.id)
+            assert restocking(location.id, columns.date_range()['days']) == engine_section(location)
+        incremental = events()
+        assert len(incremental) > 0
+
+        db.session.execute(PantryEvent.__table__.delete())
+        db.session.commit()
+        assert backfill_pantry_events(batch_size=2) == len(incremental)
+        assert events() == incremental
+
+        db.session.delete(north)
+        db.session.commit()
+        assert {event[1] for event in events()} <= {west.id}
+
+
+if __name__ == "__main__":
+    test_classify()
+    test_events_follow_writes_and_backfill()
+    print("Pantry event tests passed")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests and benchmark for the pantry detail page (/location/<id>)
+
+Running this file directly also times the page for one pantry with 10k
+reports (PANTRY_PAGE_BENCHMARK_REPORTS to change it).
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Location, Report
+from app.rollups import rebuild_rollups
+from app.food_items import backfill_food_items
+from app.pantry_events import backfill_pantry_events
+from app.views import HISTORY_PAGE_SIZE
+from config.config import TestingConfig
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def add_location(name="Corner"):
+    location = Location(name=name, address=f"5 {name} Ave", city="Springfield", state="IL", zip=62701)
+    db.session.add(location)
+    db.session.commit()
+    return location
+
+
+def report_times(page):
+    """data-utc-time of every report on the page: the latest report first, then the history"""
+    return [part.split('"', 1)[0] for part in page.split('data-utc-time="')[1:]]
+
+
+def test_history_is_paginated():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+
+        location = add_location()
+        count = HISTORY_PAGE_SIZE + 5
+        # Ids in the opposite order of time: the page follows time
+        for i in range(count):
+            db.session.add(Report(location_id=location.id, pantry_fullness=i * 3,
+                                  time=START + timedelta(hours=count - i)))
+        db.session.commit()
+        newest_first = [report.time.isoformat() for report in
+                        Report.query.order_by(Report.time.desc(), Report.id.desc())]
+
+        # The first view builds the pantry's analytics state from its reports
+        client.get(f'/location/{location.id}')
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            first = client.get(f'/location/{location.id}').get_data(as_text=True)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        times = report_times(first)
+        assert times[0] == newest_first[0]
+        assert times[1:] == newest_first[:HISTORY_PAGE_SIZE]
+        # The page reads one page of reports (with only the columns it shows), not the whole history
+        report_queries = [statement for statement in statements if 'report.time AS report_time' in statement]
+        assert not any('report.user_id' in statement for statement in report_queries)
+        assert report_queries and all('LIMIT' in statement for statement in report_queries)
+
+        last_shown = Report.query.order_by(Report.time.desc(), Report.id.desc())[HISTORY_PAGE_SIZE - 1]
+        assert f'before={last_shown.id}"' in first
+        older = client.get(f'/location/{location.id}?before={last_shown.id}').get_data(as_text=True)
+        times = report_times(older)
+        assert times[0] == newest_first[0]
+        assert times[1:] == newest_first[HISTORY_PAGE_SIZE:]
+        assert 'before=' not in older
+
+        other = add_location("Other")
+        db.session.add(Report(location_id=other.id, pantry_fullness=100, time=START))
+        db.session.commit()
+        assert client.get(f'/location/{other.id}').status_code == 200
+        assert client.get(f'/location/{other.id}?before={last_shown.id}').status_code == 404
+
+
+def benchmark(report_count):
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+        location = add_location()
+
+        rng = random.Random(25)
+        db.session.execute(Report.__table__.insert(), [{
+            'location_id': location.id,
+            'time': START + timedelta(minutes=30 * i),
+            'pantry_fullness': rng.randint(0, 100),
+            'description': f"Report {i}",
+        } for i in range(report_count)])
+        db.session.commit()
+        rebuild_rollups()
+        backfill_food_items()
+        backfill_pantry_events()
+
+        for name in ('cold', 'warm', 'warm'):
+            started = time.perf_counter()
+            assert client.get(f'/location/{location.id}').status_code == 200
+            print(f"{name:>5}: {time.perf_counter() - started:.3f}s for {report_count} reports")
+
+
+if __name__ == "__main__":
+    test_history_is_paginated()
+    print("Pantry page tests passed")
+    benchmark(int(os.getenv('PANTRY_PAGE_BENCHMARK_REPORTS', 10000)))
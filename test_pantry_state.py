@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests for the persisted per-pantry analytics state
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Location, Report, LocationAnalyticsState
+from app import pantry_state
+from app.pantry_state import location_analytics, rebuild_states, check_states
+from app.report_engine import ReportColumns, pantry_analytics
+from config.config import TestingConfig
+
+COMMON_ITEMS = [('rice', 3), ('beans', 1)]
+
+
+def add_report(location, time, fullness, user_id=None, estimate=None):
+    analysis = json.dumps({'food_items': ['rice'], 'fullness_estimate': estimate}) if estimate is not None else None
+    report = Report(location_id=location.id, pantry_fullness=fullness, time=time,
+                    user_id=user_id, vision_analysis=analysis)
+    db.session.add(report)
+    db.session.commit()
+    return report
+
+
+def full_recompute(location):
+    return pantry_analytics(ReportColumns.load(Report.location_id == location.id), COMMON_ITEMS)
+
+
+def stored(location):
+    return LocationAnalyticsState.query.get(location.id)
+
+
+def test_state_follows_writes():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        location = Location(name="Corner", address="5 Oak Ave", city="Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.commit()
+
+        start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+        add_report(location, start, 80)
+        assert location_analytics(location.id, COMMON_ITEMS) is None
+        assert stored(location).report_count == 1
+
+        # In-order inserts are folded into the stored state
+        pattern = [10, 95, 60, 15, None, 70, 20, 100, 5, 45]
+        for step, fullness in enumerate(pattern, start=1):
+            add_report(location, start + timedelta(hours=13 * step), fullness,
+                       user_id=step % 3 or None, estimate=fullness and fullness - 5)
+            db.session.expire_all()
+            assert stored(location).report_count == step + 1
+        latest = add_report(location, start + timedelta(days=40), 30)
+        db.session.expire_all()
+        assert stored(location).last_report_id == latest.id
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+
+        # A back-dated insert, an edit and a delete each drop the state; the next read rebuilds it
+        backdated = add_report(location, start + timedelta(days=2), 0)
+        assert stored(location) is None
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+
+        backdated.pantry_fullness = 90
+        db.session.commit()
+        assert stored(location) is None
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+
+        db.session.delete(backdated)
+        db.session.commit()
+        assert stored(location) is None
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+
+        # A Core insert skips the listeners; the state no longer covers every report
+        db.session.execute(Report.__table__.insert().values(location_id=location.id, pantry_fullness=55,
+                                                             time=start + timedelta(days=41)))
+        db.session.commit()
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+        assert check_states(COMMON_ITEMS) == []
+
+        # Months keep a fullness sum and count, not every value
+        state = json.loads(stored(location).state)
+        assert all(len(entry) == 3 and all(isinstance(part, int) for part in entry) for entry in state['months'])
+
+        # A state stored by an older version (months with value lists) is rebuilt rather than extended
+        state['months'] = [[month, [total]] for month, total, _ in state['months']]
+        del state['version']
+        outdated = json.dumps(state)
+        db.session.execute(LocationAnalyticsState.__table__.update().values(state=outdated))
+        db.session.commit()
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+        assert 'version' in json.loads(stored(location).state)
+
+        db.session.execute(LocationAnalyticsState.__table__.update().values(state=outdated))
+        db.session.commit()
+        add_report(location, start + timedelta(days=42), 65)
+        assert stored(location) is None
+        assert location_analytics(location.id, COMMON_ITEMS) == full_recompute(location)
+        assert check_states(COMMON_ITEMS) == []
+
+        # A rebuild on read doesn't overwrite a row that changed after it was read
+        read = stored(location)
+        count, rebuilt = read.report_count, json.loads(read.state)
+        with db.engine.begin() as connection:
+            connection.execute(LocationAnalyticsState.__table__.update().values(report_count=count + 1))
+            pantry_state._save_if_unchanged(connection, location.id, {**rebuilt, 'count': 0}, read)
+        db.session.expire_all()
+        assert stored(location).report_count == count + 1
+        db.session.execute(LocationAnalyticsState.__table__.update().values(report_count=count))
+        db.session.commit()
+
+        # Float rounding differences are not reported as mismatches
+        assert pantry_state._close({'average': [12.3, 4]}, {'average': [12.4, 4]})
+        assert not pantry_state._close({'average': [12.3, 4]}, {'average': [12.3, 5]})
+
+        # A corrupted state is caught by the checker and fixed by a rebuild
+        db.session.execute(LocationAnalyticsState.__table__.update().values(state=json.dumps({'count': 3})))
+        db.session.commit()
+        assert check_states(COMMON_ITEMS) == [location.id]
+        assert rebuild_states() == 1
+        assert check_states(COMMON_ITEMS) == []
+
+        db.session.delete(location)
+        db.session.commit()
+        assert LocationAnalyticsState.query.count() == 0
+
+
+def test_field_selection():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+
+        location = Location(name="Corner", address="5 Oak Ave", city="Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.commit()
+        start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+        for step, fullness in enumerate([90, 20, 80, 5]):
+            add_report(location, start + timedelta(days=step), fullness, estimate=fullness)
+
+        full = client.get(f'/api/analytics/{location.id}').get_json()['analytics']
+        assert {'fullness_stats', 'restocking', 'time_trends', 'insights'} <= set(full)
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            body = client.get(f'/api/analytics/{location.id}?fields=fullness_stats,restocking').get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        assert set(body['analytics']) == {'total_reports', 'date_range', 'fullness_stats', 'restocking'}
+        assert body['analytics']['restocking'] == full['restocking']
+        # Neither the food item index nor the daily rollups are read
+        assert not any('report_food_item' in statement or 'report_daily_rollup' in statement for statement in statements)
+
+        # Insights are computed from their inputs, which are left out unless requested
+        insights = client.get(f'/api/analytics/{location.id}?fields=insights').get_json()['analytics']
+        assert set(insights) == {'total_reports', 'date_range', 'insights'}
+        assert insights['insights'] == full['insights']
+
+        assert client.get(f'/api/analytics/{location.id}?fields=patterns,colour').status_code == 400
+
+
+if __name__ == "__main__":
+    test_state_follows_writes()
+    test_field_selection()
+    print("Pantry state tests passed")
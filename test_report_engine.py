@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Parity test and benchmark for the NumPy report engine behind calculate_pantry_analytics
+
+The test compares calculate_pantry_analytics with the original implementation
+(kept below as legacy_pantry_analytics) for every pantry of a synthetic network.
+Running this file directly benchmarks both on one pantry with 20k reports
+(REPORT_ENGINE_BENCHMARK_REPORTS to change it).
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict, Counter
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import calendar
+from app import create_app, db
+from app.models import Location, Report, User
+from app.analytics import location_time_trends
+from app.report_engine import ReportColumns
+from app.views import calculate_pantry_analytics, generate_pantry_insights
+from config.config import TestingConfig
+
+FOODS = ['canned beans', 'pasta', 'rice', 'cereal', 'soup', 'peanut butter', 'tuna']
+START = datetime(2025, 11, 3, 6, tzinfo=timezone.utc)
+
+
+def legacy_pantry_analytics(location):
+    """
+    The original per-report implementation, kept as the reference for parity checks
+    """
+    try:
+        reports = Report.query.filter_by(location_id=location.id).order_by(Report.time.asc()).all()
+        
+        if len(reports) < 2:
+            return None  # Need at least 2 reports for meaningful analytics
+        
+        analytics = {
+            'total_reports': len(reports),
+            'date_range': {
+                'start': reports[0].time,
+                'end': reports[-1].time,
+                'days': (reports[-1].time - reports[0].time).days + 1
+            },
+            'fullness_stats': {},
+            'trends': {},
+            'patterns': {},
+            'ai_insights': {},
+            'chart_data': {},
+            'engagement': {},
+            'restocking': {}
+        }
+        
+        # Calculate fullness statistics
+        fullness_values = [r.pantry_fullness for r in reports]
+        analytics['fullness_stats'] = {
+            'average': round(sum(fullness_values) / len(fullness_values), 1),
+            'minimum': min(fullness_values),
+            'maximum': max(fullness_values),
+            'current': reports[-1].pantry_fullness,
+            'previous': reports[-2].pantry_fullness if len(reports) > 1 else None
+        }
+        
+        # Calculate trends
+        recent_reports = reports[-5:] if len(reports) >= 5 else reports
+        recent_fullness = [r.pantry_fullness for r in recent_reports]
+        
+        if len(recent_fullness) >= 2:
+            trend_direction = "stable"
+            recent_avg = sum(recent_fullness) / len(recent_fullness)
+            older_avg = sum(fullness_values[:-5]) / max(1, len(fullness_values[:-5])) if len(fullness_values) > 5 else recent_avg
+            
+            difference = recent_avg - older_avg
+            if difference > 10:
+                trend_direction = "improving"
+            elif difference < -10:
+                trend_direction = "declining"
+        else:
+            trend_direction = "insufficient_data"
+        
+        analytics['trends'] = {
+            'direction': trend_direction,
+            'recent_average': round(sum(recent_fullness) / len(recent_fullness), 1) if recent_fullness else 0,
+            'change_from_previous': analytics['fullness_stats']['current'] - analytics['fullness_stats']['previous'] if analytics['fullness_stats']['previous'] else 0
+        }
+        
+        # Calculate usage patterns
+        
+        # Group by day of week
+        day_counts = defaultdict(int)
+        day_fullness = defaultdict(list)
+        
+        for report in reports:
+            day_name = calendar.day_name[report.time.weekday()]
+            day_counts[day_name] += 1
+            day_fullness[day_name].append(report.pantry_fullness)
+        
+        # Find most/least active days
+        most_active_day = max(day_counts, key=day_counts.get) if day_counts else None
+        least_active_day = min(day_counts, key=day_counts.get) if day_counts else None
+        
+        # Calculate empty/critical periods
+        empty_reports = [r for r in reports if r.pantry_fullness <= 33]
+        critical_reports = [r for r in reports if r.pantry_fullness <= 10]
+        
+        analytics['patterns'] = {
+            'most_active_day': most_active_day,
+            'least_active_day': least_active_day,
+            'empty_periods': len(empty_reports),
+            'critical_periods': len(critical_reports),
+            'empty_percentage': round((len(empty_reports) / len(reports)) * 100, 1),
+            'day_averages': {day: round(sum(fullness) / len(fullness), 1) for day, fullness in day_fullness.items()}
+        }
+        
+        # AI insights (if available)
+        ai_reports = [r for r in reports if r.get_vision_analysis()]
+        if ai_reports:
+            all_detected_items = []
+            ai_fullness_estimates = []
+            
+            for report in ai_reports:
+                detected_items = report.get_detected_food_items()
+                if detected_items:
+                    all_detected_items.extend(detected_items)
+                
+                ai_fullness = report.get_ai_fullness_estimate()
+                if ai_fullness is not None:
+                    ai_fullness_estimates.append(ai_fullness)
+            
+            # Count most common food items
+            food_item_counts = Counter(all_detected_items)
+            
+            analytics['ai_insights'] = {
+                'total_ai_reports': len(ai_reports),
+                'most_common_items': food_item_counts.most_common(5),
+                'average_ai_fullness': round(sum(ai_fullness_estimates) / len(ai_fullness_estimates), 1) if ai_fullness_estimates else None,
+                'ai_coverage_percentage': round((len(ai_reports) / len(reports)) * 100, 1)
+            }
+        
+        # Prepare chart data - FIX: Use actual timestamps for proper time-based x-axis
+        chart_reports = reports[-30:] if len(reports) > 30 else reports  # Last 30 reports or all
+        
+        # Generate proper time-based chart data
+        chart_data_points = []
+        for report in chart_reports:
+            chart_data_points.append({
+                'timestamp': report.time.isoformat(),
+                'date': report.time.strftime('%Y-%m-%d'),
+                'datetime': report.time.strftime('%Y-%m-%d %H:%M'),
+                'fullness': report.pantry_fullness,
+                'ai_fullness': report.get_ai_fullness_estimate()
+            })
+        
+        analytics['chart_data'] = {
+            'data_points': chart_data_points,
+            'dates': [r.time.strftime('%Y-%m-%d') for r in chart_reports],
+            'timestamps': [r.time.isoformat() for r in chart_reports],
+            'fullness_values': [r.pantry_fullness for r in chart_reports],
+            'ai_fullness_values': [r.get_ai_fullness_estimate() or 0 for r in chart_reports if r.get_vision_analysis()],
+            'report_count_by_month': {},
+            'fullness_distribution': {'empty': 0, 'low': 0, 'medium': 0, 'high': 0, 'full': 0}
+        }
+        
+        # ENHANCED ANALYTICS - Time Period Trends (from the daily rollups)
+        analytics['time_trends'] = location_time_trends(location.id)
+        
+        # Calculate fullness distribution
+        for fullness in fullness_values:
+            if fullness <= 10:
+                analytics['chart_data']['fullness_distribution']['empty'] += 1
+            elif fullness <= 33:
+                analytics['chart_data']['fullness_distribution']['low'] += 1
+            elif fullness <= 66:
+                analytics['chart_data']['fullness_distribution']['medium'] += 1
+            elif fullness <= 90:
+                analytics['chart_data']['fullness_distribution']['high'] += 1
+            else:
+                analytics['chart_data']['fullness_distribution']['full'] += 1
+        
+        # ENHANCED ANALYTICS - Community Engagement
+        unique_users = set()
+        user_report_counts = {}
+        for report in reports:
+            if report.user_id:
+                unique_users.add(report.user_id)
+                user_report_counts[report.user_id] = user_report_counts.get(report.user_id, 0) + 1
+        
+        analytics['engagement'] = {
+            'unique_reporters': len(unique_users),
+            'anonymous_reports': sum(1 for r in reports if not r.user_id),
+            'average_reports_per_user': round(len(reports) / max(1, len(unique_users)), 1),
+            'most_active_reporter': max(user_report_counts.values()) if user_report_counts else 0,
+            'engagement_rate': round((len(unique_users) / max(1, analytics['date_range']['days'])) * 7, 2)  # reporters per week
+        }
+        
+        # ENHANCED ANALYTICS - Restocking Patterns
+        restocking_events = []
+        depletion_events = []
+        
+        for i in range(1, len(reports)):
+            prev_report = reports[i-1]
+            curr_report = reports[i]
+            
+            # Detect restocking (significant increase in fullness)
+            if curr_report.pantry_fullness > prev_report.pantry_fullness + 30:
+                time_diff = (curr_report.time - prev_report.time).total_seconds() / 3600  # hours
+                restocking_events.append({
+                    'time': curr_report.time,
+                    'from_fullness': prev_report.pantry_fullness,
+                    'to_fullness': curr_report.pantry_fullness,
+                    'time_since_last': time_diff
+                })
+            
+            # Detect depletion (significant decrease)
+            elif prev_report.pantry_fullness > curr_report.pantry_fullness + 20:
+                time_diff = (curr_report.time - prev_report.time).total_seconds() / 3600  # hours
+                depletion_events.append({
+                    'time': curr_report.time,
+                    'from_fullness': prev_report.pantry_fullness,
+                    'to_fullness': curr_report.pantry_fullness,
+                    'depletion_rate': time_diff
+                })
+        
+        # Calculate restocking analytics
+        restock_times = [event['time_since_last'] for event in restocking_events if event['time_since_last'] < 24*7]  # within a week
+        depletion_rates = [event['depletion_rate'] for event in depletion_events if event['depletion_rate'] < 24*3]  # within 3 days
+        
+        analytics['restocking'] = {
+            'total_restocking_events': len(restocking_events),
+            'total_depletion_events': len(depletion_events),
+            'average_restock_time_hours': round(sum(restock_times) / len(restock_times), 1) if restock_times else None,
+            'average_depletion_time_hours': round(sum(depletion_rates) / len(depletion_rates), 1) if depletion_rates else None,
+            'recent_restocking_events': restocking_events[-3:],  # Last 3
+            'restocking_frequency_per_week': round(len(restocking_events) / max(1, analytics['date_range']['days'] / 7), 1)
+        }
+        
+        # ENHANCED ANALYTICS - Peak Usage Patterns  
+        hour_patterns = defaultdict(list)
+        month_patterns = defaultdict(list)
+        
+        for report in reports:
+            hour_patterns[report.time.hour].append(report.pantry_fullness)
+            month_patterns[report.time.strftime('%B')].append(report.pantry_fullness)
+        
+        # Find peak depletion hours (hours with lowest average fullness)
+        hour_averages = {hour: sum(fullness_list) / len(fullness_list) 
+                        for hour, fullness_list in hour_patterns.items()}
+        
+        sorted_hours = sorted(hour_averages.items(), key=lambda x: x[1])
+        peak_depletion_hours = sorted_hours[:3] if len(sorted_hours) >= 3 else sorted_hours
+        
+        analytics['patterns'].update({
+            'peak_depletion_hours': [f"{hour:02d}:00 ({avg:.1f}% avg)" for hour, avg in peak_depletion_hours],
+            'month_averages': {month: round(sum(fullness_list) / len(fullness_list), 1) 
+                             for month, fullness_list in month_patterns.items()},
+            'busiest_months': [(month, len(fullness_list)) for month, fullness_list
+                               in sorted(month_patterns.items(), key=lambda x: len(x[1]), reverse=True)[:3]]
+        })
+        
+        # Add advanced insights
+        analytics['insights'] = generate_pantry_insights(analytics, reports)
+        
+        return analytics
+        
+    except Exception as e:
+        raise
+
+
+
+def vision(rng):
+    """A random AI analysis in one of the stored formats (or none at all)"""
+    choice = rng.random()
+    if choice < 0.4:
+        return None
+    if choice < 0.45:
+        return 'not json'
+    foods = rng.sample(FOODS, rng.randint(0, 4))
+    if choice < 0.7:
+        foods = [{'description': food, 'score': 0.9} for food in foods]
+    analysis = {'food_items': foods}
+    if rng.random() < 0.8:
+        analysis['fullness_estimate'] = rng.choice([rng.randint(0, 100), rng.randint(0, 1000) / 10])
+    return json.dumps(analysis)
+
+
+def seed_pantries(rng, report_counts):
+    """One pantry per entry of `report_counts`, with random reports at microsecond precision"""
+    users = [User(email=f"user{i}@example.com", first_name=f"User {i}") for i in range(5)]
+    db.session.add_all(users)
+    locations = [Location(name=f"Pantry {i}", address=f"{i} Main St", city="Springfield", state="IL", zip=62701)
+                 for i in range(len(report_counts))]
+    db.session.add_all(locations)
+    db.session.commit()
+
+    for location, count in zip(locations, report_counts):
+        time = START
+        for _ in range(count):
+            # Mostly hours apart, sometimes at the same instant
+            time += timedelta(microseconds=rng.choice([0, rng.randint(1, 400 * 3600 * 10 ** 6)]))
+            db.session.add(Report(location_id=location.id, time=time,
+                                  pantry_fullness=rng.choice([0, 10, 11, 33, 34, 66, 67, 90, 91, 100, rng.randint(0, 100)]),
+                                  user_id=rng.choice([None, None] + [user.id for user in users]),
+                                  vision_analysis=vision(rng)))
+        db.session.commit()
+    return locations
+
+
+def test_engine_matches_legacy_analytics():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        rng = random.Random(15)
+        locations = seed_pantries(rng, [0, 1, 2, 3, 6, 40, 250])
+
+        for location in locations:
+            db.session.expire_all()
+            expected = legacy_pantry_analytics(location)
+            assert calculate_pantry_analytics(location) == expected, location.name
+            if expected is not None:
+                # Same types too, so templates and JSON render the same
+                assert json.dumps(calculate_pantry_analytics(location), default=str) == json.dumps(expected, default=str)
+        assert calculate_pantry_analytics(locations[0]) is None
+        assert calculate_pantry_analytics(locations[1]) is None
+
+
+def test_columns_from_one_query():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        location = seed_pantries(random.Random(3), [4])[0]
+        db.session.add(Report(location_id=location.id, time=START - timedelta(days=1), pantry_fullness=None,
+                              vision_analysis=json.dumps({'food_items': ['rice'], 'fullness_estimate': 45})))
+        db.session.commit()
+
+        columns = ReportColumns.load(Report.location_id == location.id)
+        assert len(columns) == 5
+        assert columns.micros[0] == int((START - timedelta(days=1)).timestamp()) * 10 ** 6
+        assert columns.epoch_seconds[0] == (START - timedelta(days=1)).timestamp()
+        assert list(columns.weekdays()[:1]) == [6] and list(columns.hours()[:1]) == [6]
+        assert list(columns.months()[:1]) == [11]
+        assert columns.has_analysis[0] and columns.ai_fullness[0] == 45
+
+        # A report without a fullness value is left out of the fullness statistics
+        analytics = calculate_pantry_analytics(location)
+        assert analytics['total_reports'] == 5
+        assert analytics['fullness_stats']['minimum'] == min(
+            report.pantry_fullness for report in Report.query.filter(Report.pantry_fullness.isnot(None)))
+
+
+def benchmark(report_count):
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        location = seed_pantries(random.Random(1), [report_count])[0]
+        for name, calculate in (('legacy', legacy_pantry_analytics), ('engine', calculate_pantry_analytics)):
+            db.session.expire_all()
+            started = time.perf_counter()
+            calculate(location)
+            print(f"{name:>6}: {time.perf_counter() - started:.3f}s for {report_count} reports")
+
+
+if __name__ == "__main__":
+    test_engine_matches_legacy_analytics()
+    test_columns_from_one_query()
+    print("Report engine parity tests passed")
+    benchmark(int(os.getenv('REPORT_ENGINE_BENCHMARK_REPORTS', 20000)))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Tests for the daily report rollups kept in report_daily_rollup
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report, ReportDailyRollup, LocationLatestReport, StateSummary
+from app.rollups import rebuild_rollups
+from app.analytics import location_time_trends
+from config.config import TestingConfig
+
+MONDAY = datetime(2026, 9, 7, tzinfo=timezone.utc)
+
+
+def rollup_snapshot():
+    """All rollup rows as {(location_id, day): (count, sum, n, min, max, empty, full, last, first, latest, ai, ai sum, ai n)}"""
+    def as_utc(value):
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+    return {
+        (row.location_id, row.day): (
+            row.report_count, row.fullness_sum, row.fullness_count, row.fullness_min, row.fullness_max,
+            row.empty_count, row.full_count, row.last_fullness, as_utc(row.first_report_time),
+            as_utc(row.last_report_time), row.ai_report_count, row.ai_fullness_sum, row.ai_fullness_count)
+        for row in ReportDailyRollup.query
+    }
+
+
+def latest_snapshot():
+    return {row.location_id: (row.report_id, row.pantry_fullness) for row in LocationLatestReport.query}
+
+
+def state_snapshot():
+    return {row.state: (row.location_count, row.active_location_count, row.report_count, row.fullness_sum,
+                        row.fullness_count, row.empty_count, row.low_count, row.full_count)
+            for row in StateSummary.query}
+
+
+def add_location(name, state="IL"):
+    location = Location(name=name, address=f"1 {name} St", city="Springfield", state=state, zip=62701)
+    db.session.add(location)
+    db.session.commit()
+    return location
+
+
+def add_report(location, fullness, time, vision=None):
+    report = Report(location_id=location.id, pantry_fullness=fullness, time=time,
+                    vision_analysis=json.dumps(vision) if vision else None)
+    db.session.add(report)
+    db.session.commit()
+    return report
+
+
+def test_incremental_rollups_match_rebuild():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        north, south, closed = add_location("North"), add_location("South"), add_location("Closed")
+        add_report(north, 80, MONDAY + timedelta(hours=9))
+        # Inserted out of order: the 9:00 report stays the day's latest
+        moved = add_report(north, 20, MONDAY + timedelta(hours=7), {'fullness_estimate': 25})
+        add_report(north, None, MONDAY + timedelta(hours=8))
+        add_report(north, 50, MONDAY + timedelta(days=1, hours=23, minutes=59))
+        add_report(south, 10, MONDAY + timedelta(hours=12))
+        add_report(south, 70, MONDAY + timedelta(hours=12))
+        add_report(closed, 40, MONDAY)
+
+        row = ReportDailyRollup.query.get((north.id, MONDAY.date()))
+        assert (row.report_count, row.fullness_sum, row.fullness_count) == (3, 100, 2)
+        assert (row.fullness_min, row.fullness_max, row.empty_count, row.full_count) == (20, 80, 1, 1)
+        assert (row.last_fullness, row.ai_report_count) == (80, 1)
+        assert (row.ai_fullness_sum, row.ai_fullness_count) == (25, 1)
+        # Same time: the later insert wins
+        assert ReportDailyRollup.query.get((south.id, MONDAY.date())).last_fullness == 70
+
+        # Edits and deletes recompute the days they touch
+        moved.time = MONDAY + timedelta(days=1)
+        db.session.delete(Report.query.filter_by(pantry_fullness=10).one())
+        db.session.delete(closed)
+        db.session.commit()
+
+        assert ReportDailyRollup.query.get((north.id, MONDAY.date())).report_count == 2
+        assert ReportDailyRollup.query.get((north.id, MONDAY.date() + timedelta(days=1))).report_count == 2
+        assert ReportDailyRollup.query.filter_by(location_id=closed.id).count() == 0
+
+        incremental, latest = rollup_snapshot(), latest_snapshot()
+        assert latest == {north.id: (Report.query.filter_by(pantry_fullness=50).one().id, 50),
+                          south.id: (Report.query.filter_by(pantry_fullness=70).one().id, 70)}
+        assert rebuild_rollups() == 3
+        assert rollup_snapshot() == incremental
+        assert latest_snapshot() == latest
+
+
+def test_time_trends_from_rollups():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        location = add_location("Corner")
+        fullness = [90, 60, 30, 10, 50, 70]
+        for day, value in enumerate(fullness):
+            # Two reports in each of three weeks, all in September
+            add_report(location, value, MONDAY + timedelta(days=day * 3 + day // 2 * 2, hours=10))
+
+        trends = location_time_trends(location.id)
+        assert [week['period'] for week in trends['weekly']] == ['2026-09-07', '2026-09-14', '2026-09-21']
+        assert trends['weekly'][0] == {'period': '2026-09-07', 'label': 'Week of 2026-09-07',
+                                       'average_fullness': 75.0, 'report_count': 2,
+                                       'min_fullness': 60, 'max_fullness': 90}
+        assert [(month['label'], month['report_count']) for month in trends['monthly']] == [('September 2026', 6)]
+        assert trends['yearly'][0]['average_fullness'] == round(sum(fullness) / 6, 1)
+        assert trends['has_weekly_data'] and not trends['has_monthly_data'] and not trends['has_yearly_data']
+
+
+def test_trends_endpoint():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+
+        location = add_location("Corner")
+        # Monday, the Sunday ending that week, the next Monday, and a day in the next year
+        for value, when in ((20, MONDAY), (40, MONDAY + timedelta(days=6, hours=22)),
+                            (90, MONDAY + timedelta(days=7)), (None, MONDAY + timedelta(days=120))):
+            add_report(location, value, when + timedelta(hours=1))
+
+        weekly = client.get(f'/api/analytics/{location.id}/trends?granularity=week').get_json()
+        assert weekly['granularity'] == 'week' and weekly['from'] is None
+        assert [(week['period'], week['report_count'], week['average_fullness'], week['min_fullness'],
+                 week['max_fullness']) for week in weekly['trends']] == [
+            ('2026-09-07', 2, 30.0, 20, 40), ('2026-09-14', 1, 90.0, 90, 90)]
+
+        ranged = client.get(f'/api/analytics/{location.id}/trends?granularity=year&from=2026-09-13&to=2026-12-31')
+        assert [(year['period'], year['report_count'], year['average_fullness'])
+                for year in ranged.get_json()['trends']] == [('2026', 2, 65.0)]
+        assert client.get(f'/api/analytics/{location.id}/trends').get_json()['trends'][0]['label'] == 'September 2026'
+
+        assert client.get(f'/api/analytics/{location.id}/trends?granularity=day').status_code == 400
+        assert client.get(f'/api/analytics/{location.id}/trends?from=yesterday').status_code == 400
+        assert client.get(f'/api/analytics/{location.id}/trends?from=2026-10-01&to=2026-09-01').status_code == 400
+        assert client.get('/api/analytics/999/trends').status_code == 404
+
+
+def test_report_times_stored_in_utc():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        location = add_location("Corner")
+        chicago = timezone(timedelta(hours=-5))
+        # 22:30 in Chicago is 03:30 UTC the next day
+        evening = add_report(location, 40, datetime(2026, 9, 7, 22, 30, tzinfo=chicago))
+        before = datetime.now(timezone.utc)
+        defaulted = add_report(location, 60, None)
+        db.session.expire_all()
+
+        assert evening.time == datetime(2026, 9, 8, 3, 30, tzinfo=timezone.utc)
+        assert evening.time.utcoffset() == timedelta(0)
+        stored = db.session.execute(db.text("SELECT time FROM report WHERE id = :id"), {'id': evening.id}).scalar()
+        assert str(stored).startswith('2026-09-08 03:30:00')
+        assert ReportDailyRollup.query.get((location.id, datetime(2026, 9, 8).date())).report_count == 1
+
+        # Bounds in any zone compare as instants
+        assert Report.query.filter(Report.time >= datetime(2026, 9, 7, 22, 0, tzinfo=chicago),
+                                   Report.time < datetime(2026, 9, 7, 23, 0, tzinfo=chicago)).all() == [evening]
+
+        # The default is the insert time, not the time the app started
+        assert before <= defaulted.time <= datetime.now(timezone.utc)
+
+
+def test_state_summary_follows_writes():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        north, south, west = add_location("North"), add_location("South"), add_location("West", state="CA")
+        add_location("Nowhere", state=None)
+        assert state_snapshot() == {'IL': (2, 0, 0, 0, 0, 0, 0, 0), 'CA': (1, 0, 0, 0, 0, 0, 0, 0),
+                                    '': (1, 0, 0, 0, 0, 0, 0, 0)}
+
+        add_report(north, 20, MONDAY + timedelta(hours=9))
+        add_report(north, 80, MONDAY + timedelta(hours=10))
+        # Older than the latest: counted, but the latest fullness stays 80
+        add_report(north, 50, MONDAY + timedelta(hours=8))
+        add_report(south, None, MONDAY)
+        add_report(west, 40, MONDAY)
+        assert state_snapshot()['IL'] == (2, 2, 4, 80, 1, 0, 0, 1)
+        assert state_snapshot()['CA'] == (1, 1, 1, 40, 1, 0, 1, 0)
+
+        # Edits, deletes and a location moving state
+        Report.query.filter_by(pantry_fullness=80).one().pantry_fullness = 10
+        west.state = "IL"
+        db.session.delete(Report.query.filter_by(pantry_fullness=None).one())
+        db.session.commit()
+        assert state_snapshot()['IL'] == (3, 2, 4, 50, 2, 1, 1, 0)
+        assert 'CA' not in state_snapshot()
+        db.session.delete(south)
+        db.session.commit()
+
+        incremental = state_snapshot()
+        rebuild_rollups()
+        assert state_snapshot() == incremental
+        assert 'CA' not in incremental and incremental['IL'][:3] == (2, 2, 4)
+
+        states = app.test_client().get('/api/states').get_json()['states']
+        assert [state['name'] for state in states] == [None, 'Illinois']
+        assert states[1] == {'state': 'IL', 'name': 'Illinois', 'locations': 2, 'active_locations': 2,
+                             'reports': 4, 'avg_fullness': 25.0, 'empty_pantries': 1, 'low_pantries': 1,
+                             'full_pantries': 0}
+
+
+if __name__ == "__main__":
+    test_incremental_rollups_match_rebuild()
+    test_time_trends_from_rollups()
+    test_trends_endpoint()
+    test_report_times_stored_in_utc()
+    test_state_summary_follows_writes()
+    print("Rollup tests passed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the paginated /status table and the per-pantry report history
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report
+from config.config import TestingConfig
+
+
+def seed():
+    """Twelve pantries with reports an hour apart (pantry 1 most recent), plus one without reports"""
+    now = datetime.now(timezone.utc)
+    locations = []
+    for i in range(1, 13):
+        location = Location(name=f"Pantry {i:02d}", address=f"{i} Main St",
+                            city="Chicago" if i % 3 == 0 else "Springfield", state="IL", zip=62701)
+        db.session.add(location)
+        db.session.flush()
+        db.session.add(Report(location_id=location.id, pantry_fullness=10 * i, time=now - timedelta(hours=i)))
+        locations.append(location)
+    db.session.add(Location(name="Unreported", address="99 Main St", city="Springfield", state="IL", zip=62701))
+    db.session.commit()
+    return locations
+
+
+def test_status_table_is_paginated():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        client = app.test_client()
+
+        assert client.get('/status').status_code == 200
+
+        first = client.get('/api/status/locations?offset=0&limit=5').get_json()
+        assert first['total'] == 12
+        assert [row['name'] for row in first['rows']] == [f"Pantry {i:02d}" for i in range(1, 6)]
+        assert first['rows'][0]['fullness'] == 10
+        assert first['rows'][0]['address'] == "1 Main St, Springfield, IL"
+
+        last = client.get('/api/status/locations?offset=10&limit=5&sort=time&order=desc').get_json()
+        assert [row['name'] for row in last['rows']] == ["Pantry 11", "Pantry 12"]
+
+        by_name = client.get('/api/status/locations?limit=3&sort=location&order=asc').get_json()
+        assert [row['name'] for row in by_name['rows']] == ["Pantry 01", "Pantry 02", "Pantry 03"]
+
+        chicago = client.get('/api/status/locations?search=chicago').get_json()
+        assert chicago['total'] == 4
+
+        assert client.get('/api/status/locations?limit=500').status_code == 400
+        assert client.get('/api/status/locations?sort=fullness').status_code == 400
+
+
+def test_history_pages_through_reports():
+    app = create_app(TestingConfig)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        location = seed()[0]
+        now = datetime.now(timezone.utc)
+        # Two reports at the same time are ordered by id
+        for days, fullness in ((1, 50), (2, 60), (2, 70), (3, 80)):
+            db.session.add(Report(location_id=location.id, pantry_fullness=fullness, time=now - timedelta(days=days),
+                                  description="Restocked" if fullness == 80 else None))
+        db.session.commit()
+        client = app.test_client()
+
+        page = client.get(f'/api/locations/{location.id}/history?limit=3').get_json()
+        assert [report['fullness'] for report in page['reports']] == [10, 50, 70]
+        assert page['reports'][0]['status'] == 'Empty'
+        assert page['next'] == page['reports'][-1]['id']
+
+        rest = client.get(f'/api/locations/{location.id}/history?limit=3&before={page["next"]}').get_json()
+        assert [report['fullness'] for report in rest['reports']] == [60, 80]
+        assert rest['reports'][-1]['description'] == "Restocked"
+        assert rest['next'] is None
+
+        assert client.get('/api/locations/999/history').status_code == 404
+        other = Report.query.filter(Report.location_id != location.id).first()
+        assert client.get(f'/api/locations/{location.id}/history?before={other.id}').status_code == 400
+
+
+if __name__ == "__main__":
+    test_status_table_is_paginated()
+    test_history_pages_through_reports()
+    print("Status page tests passed")
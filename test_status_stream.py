@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for the /stream/status Server-Sent Events endpoint
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Location, Report, StatusEvent
+from app.status_stream import broker, prune_status_events, stream_slots, stream_status_events
+from config.config import TestingConfig
+
+
+def parse_events(body):
+    """SSE text -> list of (id, event, data) for the real events (no comments/retry lines)"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':') and ': ' in line)
+        if 'event' in fields:
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def make_app():
+    app = create_app(TestingConfig)
+    # End each stream after sending the backlog
+    app.config['SSE_STREAM_SECONDS'] = 0
+    return app
+
+
+def test_writes_are_streamed_and_resumable():
+    app = make_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+
+        location = Location(name="Corner Pantry", address="5 Oak Ave", city="Springfield",
+                            state="IL", zip=62701, latitude=39.8, longitude=-89.6)
+        db.session.add(location)
+        db.session.commit()
+        db.session.add(Report(location_id=location.id, pantry_fullness=80, time=datetime.now(timezone.utc)))
+        db.session.commit()
+        # A backdated report does not change the map, so it is not pushed
+        db.session.add(Report(location_id=location.id, pantry_fullness=5,
+                              time=datetime.now(timezone.utc) - timedelta(days=3)))
+        db.session.commit()
+        location.name = "Corner Pantry (Oak Ave)"
+        db.session.commit()
+
+        response = client.get('/stream/status', headers={'Last-Event-ID': '0'})
+        assert response.mimetype == 'text/event-stream'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        events = parse_events(response.get_data(as_text=True))
+        assert [kind for _, kind, _ in events] == ['location', 'report', 'location']
+        assert events[1][2] == {**events[1][2], 'id': location.id, 'fullness': 80, 'status': 'full'}
+        assert events[2][2]['name'] == "Corner Pantry (Oak Ave)"
+        assert events[2][2]['status'] == 'full'
+
+        # Resuming sends what came after the last seen id (plus the recent window the client dedupes)
+        seen = {event_id for event_id, _, _ in events[:2]}
+        resumed = parse_events(client.get('/stream/status', headers={'Last-Event-ID': str(events[1][0])})
+                               .get_data(as_text=True))
+        assert [event_id for event_id, _, _ in resumed if event_id not in seen] == [events[2][0]]
+        # A fresh connection starts at "now"
+        assert parse_events(client.get('/stream/status').get_data(as_text=True)) == []
+
+        db.session.delete(location)
+        db.session.commit()
+        deleted = parse_events(client.get(f'/stream/status?lastEventId={events[2][0]}').get_data(as_text=True))
+        assert deleted[-1][1:] == ('deleted', {'id': location.id})
+
+
+def test_commit_wakes_waiting_streams_and_pruned_history_resets():
+    app = make_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        version = broker.version
+        woke = []
+        waiter = threading.Thread(target=lambda: woke.append(broker.wait(version, 5)))
+        waiter.start()
+        time.sleep(0.05)
+        db.session.add(Location(name="New Pantry", address="7 Elm St", city="Springfield", state="IL", zip=62701))
+        db.session.commit()
+        waiter.join()
+        assert woke == [True]
+
+        StatusEvent.query.update({'created_at': datetime.now(timezone.utc) - timedelta(days=30)})
+        db.session.commit()
+        assert prune_status_events() == 1
+        db.session.add(Location(name="Another Pantry", address="8 Elm St", city="Springfield", state="IL", zip=62701))
+        db.session.commit()
+
+        events = parse_events(app.test_client().get('/stream/status', headers={'Last-Event-ID': '0'})
+                              .get_data(as_text=True))
+        assert [kind for _, kind, _ in events] == ['reset']
+
+
+def add_event(event_id, location_id):
+    db.session.add(StatusEvent(id=event_id, location_id=location_id, kind='deleted',
+                               payload=json.dumps({'id': location_id}), created_at=datetime.now(timezone.utc)))
+    db.session.commit()
+
+
+def test_events_committed_out_of_order_are_sent():
+    app = make_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+        # Ids 11 and 13 committed; 12 was taken by a transaction that has not committed yet
+        add_event(11, 1)
+        add_event(13, 3)
+
+        # A live stream that already sent 13 still sends 12 once it commits
+        stream = stream_status_events(last_event_id=10, max_seconds=0.2)
+        streamed = [chunk for chunk in (next(stream), next(stream), next(stream))]
+        assert [event_id for event_id, _, _ in parse_events(''.join(streamed))] == [11, 13]
+        assert next(stream) == ": keepalive\n\n"
+        add_event(12, 2)
+        assert [event_id for event_id, _, _ in parse_events(next(stream))] == [12]
+        stream.close()
+
+        # A resumed stream resends the recent window, which the client dedupes
+        resumed = parse_events(client.get('/stream/status', headers={'Last-Event-ID': '13'}).get_data(as_text=True))
+        assert [event_id for event_id, _, _ in resumed] == [11, 12, 13]
+        # A fresh stream does not replay what the page already reflects
+        assert parse_events(client.get('/stream/status').get_data(as_text=True)) == []
+
+
+def test_open_streams_are_capped():
+    app = make_app()
+    app.config['SSE_MAX_STREAMS'] = 1
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+
+        held = client.get('/stream/status', buffered=False)
+        assert held.status_code == 200
+        refused = client.get('/stream/status')
+        assert refused.status_code == 503 and refused.headers['Retry-After'] == '60'
+        held.close()
+        assert stream_slots.open == 0
+        assert client.get('/stream/status').status_code == 200
+        assert stream_slots.open == 0
+
+
+if __name__ == "__main__":
+    test_writes_are_streamed_and_resumable()
+    test_commit_wakes_waiting_streams_and_pruned_history_resets()
+    test_events_committed_out_of_order_are_sent()
+    test_open_streams_are_capped()
+    print("Status stream tests passed")